@@ -1,11 +1,13 @@
 from apis.base_generation_api import BaseGenerationAPIClient
 import cohere
+from services.metrics import span
 
 
 class CohereAPIClient(BaseGenerationAPIClient):
     def __init__(self, api_key, model):
         super().__init__(api_key, model)
 
+    @span('cohere.chat')
     def generate(self, prompt):
         co = cohere.ClientV2(api_key=self.api_key)
         res = co.chat(
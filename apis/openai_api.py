@@ -1,59 +1,204 @@
+import os
 from openai import OpenAI
+import base64
+import hashlib
 import logging
 import json
+import threading
+import time
 import requests
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from PIL import Image
+from services.metrics import span
+from services.llm_usage import usage_recorder
+
+# DALL-E 2 price per image in USD, by size
+IMAGE_PRICES = {
+    "256x256": 0.016,
+    "512x512": 0.018,
+    "1024x1024": 0.020,
+}
+
+
+class ImageCache:
+    """
+    Small thread-safe LRU of generated image bytes keyed by prompt hash,
+    bounded by the total size of the cached images (IMAGE_CACHE_MAX_BYTES,
+    64 MB by default) since a b64_json 1024x1024 PNG alone is 1-3 MB.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes if max_bytes is not None else int(
+            os.environ.get('IMAGE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+        self.size = 0  # total bytes of cached images
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(prompt, size, model):
+        return hashlib.sha256(f"{model}\0{size}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        return None
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._items.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._items[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+
+
+# Shared across clients so repeated prompts are never paid for twice
+image_cache = ImageCache()
+
+# Pooled session for the URL download path
+_http = requests.Session()
+
 
 class OpenAIClient:
-    def __init__(self, api_key, model="gpt-3.5-turbo"):
+    def __init__(self, api_key, model="gpt-3.5-turbo", image_model="dall-e-2"):
         self.client = OpenAI(api_key=api_key)
         self.model = model
+        self.image_model = image_model
 
-    def generate(self, prompt):
-        """Generate text using the OpenAI API"""
+    def generate(self, prompt, template=None, max_tokens=500):
+        """Generate text using the OpenAI API; template names the prompt in usage accounting"""
+        started = time.perf_counter()
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                max_tokens=500
-            )
+            with span('openai.chat'):
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.7,
+                    max_tokens=max_tokens
+                )
+            usage_recorder.record_completion(template, self.model, started, max_tokens, response=response)
             return response.choices[0].message.content.strip()
         except Exception as e:
+            usage_recorder.record_completion(template, self.model, started, max_tokens, error=e)
             logging.error(f"Error generating text: {str(e)}")
             raise
 
-    def generate_image(self, prompt, size="1024x1024"):
-        """Generate an image using DALL-E 2"""
+    def generate_image(self, prompt, size="1024x1024", response_format="b64_json", use_cache=True):
+        """
+        Generate an image using DALL-E 2
+        Args:
+            prompt (str): Image description
+            size (str): One of IMAGE_PRICES
+            response_format (str): "b64_json" returns the image inline; "url" needs a second download
+            use_cache (bool): Reuse a previous image for the same (prompt, size, model)
+        Returns:
+            bytes: Image data or None if failed
+        """
+        cache_key = ImageCache.make_key(prompt, size, self.image_model)
+        if use_cache:
+            cached = image_cache.get(cache_key)
+            if cached is not None:
+                logging.info(f"[OpenAI] Image cache hit for prompt: {prompt}")
+                return cached
+
+        started = time.perf_counter()
         try:
             # Log the image generation attempt
             logging.info(f"[OpenAI] Generating image with prompt: {prompt}")
 
-            response = self.client.images.generate(
-                model="dall-e-2",  # Use DALL-E 2 which is more cost-effective
-                prompt=prompt,
-                size=size,
-                n=1
-            )
-            
-            # Log the response
-            logging.info(f"[OpenAI] Image generation response: {response}")
-            
-            # Download the image
-            image_url = response.data[0].url
-            logging.info(f"[OpenAI] Downloading image from: {image_url}")
-            
-            image_response = requests.get(image_url)
-            if image_response.status_code == 200:
-                logging.info("[OpenAI] Image downloaded successfully")
-                return image_response.content  # Return bytes directly instead of BytesIO
+            with span('openai.image'):
+                response = self.client.images.generate(
+                    model=self.image_model,  # DALL-E 2 is the more cost-effective default
+                    prompt=prompt,
+                    size=size,
+                    response_format=response_format,
+                    n=1
+                )
+
+            if response_format == "b64_json":
+                image_bytes = base64.b64decode(response.data[0].b64_json)
             else:
-                error_msg = f"Failed to download image: {image_response.status_code}"
-                logging.error(f"[OpenAI] {error_msg}")
-                raise Exception(error_msg)
-                
+                # Download the image
+                image_url = response.data[0].url
+                logging.info(f"[OpenAI] Downloading image from: {image_url}")
+
+                with span('openai.image_download'):
+                    image_response = _http.get(image_url, timeout=30)
+                if image_response.status_code != 200:
+                    error_msg = f"Failed to download image: {image_response.status_code}"
+                    logging.error(f"[OpenAI] {error_msg}")
+                    raise Exception(error_msg)
+                image_bytes = image_response.content
+
+            if use_cache:
+                image_cache.put(cache_key, image_bytes)
+
+            logging.info(f"[OpenAI] Image generated in {time.perf_counter() - started:.2f}s "
+                         f"({len(image_bytes)} bytes, {response_format})")
+            return image_bytes
+
         except Exception as e:
-            logging.error(f"[OpenAI] Error generating image: {str(e)}")
+            logging.error(f"[OpenAI] Error generating image after {time.perf_counter() - started:.2f}s: {str(e)}")
             # Return None instead of raising to prevent presentation generation failure
             return None
+
+    def generate_images(self, prompts, size="1024x1024", max_workers=4, max_spend_usd=None,
+                        response_format="b64_json"):
+        """
+        Generate images for several slides concurrently
+        Args:
+            prompts (list): Image descriptions, one per slide
+            size (str): One of IMAGE_PRICES
+            max_workers (int): Maximum concurrent image requests
+            max_spend_usd (float): Stop submitting new uncached prompts once this budget is used up
+            response_format (str): Passed through to generate_image
+        Returns:
+            list: Image bytes (or None) in the same order as prompts
+        """
+        price = IMAGE_PRICES.get(size, IMAGE_PRICES["1024x1024"])
+        results = [None] * len(prompts)
+        budget_left = max_spend_usd
+        slides_by_prompt = {}  # prompt -> indexes of the slides that asked for it
+
+        for i, prompt in enumerate(prompts):
+            slides_by_prompt.setdefault(prompt, []).append(i)
+
+        jobs = []
+        for prompt, indexes in slides_by_prompt.items():
+            cached = image_cache.get(ImageCache.make_key(prompt, size, self.image_model))
+            if cached is not None:
+                for i in indexes:
+                    results[i] = cached
+                continue
+            if budget_left is not None:
+                if budget_left < price:
+                    logging.warning(f"[OpenAI] Image budget exhausted, skipping prompt: {prompt}")
+                    continue
+                budget_left -= price
+            jobs.append(prompt)
+
+        if jobs:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs)))) as executor:
+                # Each distinct prompt is generated and paid for once, then shared by every slide that asked for it
+                futures = {
+                    executor.submit(self.generate_image, prompt, size, response_format): prompt
+                    for prompt in jobs
+                }
+                for future, prompt in futures.items():
+                    image = future.result()
+                    for i in slides_by_prompt[prompt]:
+                        results[i] = image
+            logging.info(f"[OpenAI] Generated {len(jobs)} images for {len(prompts)} slides in "
+                         f"{time.perf_counter() - started:.2f}s (estimated spend ${price * len(jobs):.3f})")
+
+        return results
@@ -1,20 +1,33 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, send_from_directory, session, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash, g, Response
 from werkzeug.utils import secure_filename
-from auth.google_auth import GoogleAuth, login_required
+from auth.google_auth import GoogleAuth, login_required, admin_required, is_admin
 from models.database import db, User, Presentation, PlanType
+from models.migrations import apply_migrations, stamp_migrations
+from models.user_cache import current_user
 from services.paystack import PaystackService
-from datetime import datetime, timedelta
+from services.health import HealthMonitor
+from services.usage import usage_quota
+from services.sweeper import ExpirySweeper
+from services.reconcile import reconcile_pending_payments
+from services.page_cache import page_cache
+from services.downloads import download_index
+from services.metrics import registry, http_seconds, span
+from services.llm_usage import usage_recorder, usage_tags
+from services.profiler import profiler
+from services.admission import admission
+from datetime import date, datetime, timedelta
 import logging
-from sqlalchemy import text
+import time
+import click
+from sqlalchemy.exc import OperationalError
 import tempfile
 import shutil
 from slides_generator import GoogleSlidesGenerator
+from crawlers.quota import quota_tracker
 import secrets
 import random
 import string
-from google_auth_oauthlib.flow import Flow
-from googleapiclient.errors import HttpError
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -29,16 +42,25 @@ if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgres://'):
     app.config['SQLALCHEMY_DATABASE_URI'] = app.config['SQLALCHEMY_DATABASE_URI'].replace('postgres://', 'postgresql://', 1)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Validate pooled connections on checkout instead of probing on every request
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_pre_ping': True}
+
 # Only add pooling options for PostgreSQL
 if 'postgres' in app.config['SQLALCHEMY_DATABASE_URI']:
-    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'].update({
         'pool_size': 5,
         'pool_recycle': 280,
         'pool_timeout': 20,
         'max_overflow': 2
-    }
+    })
 db.init_app(app)
 
+# Optional read replicas, comma-separated; reads fall back to the primary when they lag or fail
+db.configure_replicas(
+    os.getenv('DATABASE_REPLICA_URLS', '').split(','),
+    engine_options={'pool_pre_ping': True}
+)
+
 # Initialize services
 auth = GoogleAuth(app)
 if os.environ.get('PAYSTACK_SECRET_KEY'):
@@ -52,9 +74,83 @@ UPLOAD_FOLDER = os.path.join('static', 'downloads')
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)  # Create directory if it doesn't exist
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
-# Create database tables
-with app.app_context():
+health_monitor = HealthMonitor(app)
+expiry_sweeper = ExpirySweeper(app)
+download_index.init_app(app)
+usage_recorder.init_app(app)
+
+# Endpoints that never touch the database and stay up while it is down
+DB_FREE_ENDPOINTS = {
+    'static', 'health_check', 'login', 'logout', 'privacy_policy', 'terms_of_service', 'crawler_quotas',
+    'metrics'
+}
+
+# Shown as "Last updated" on the privacy policy and terms; bump when either changes
+LEGAL_LAST_UPDATED = date(2026, 10, 19)
+
+DASHBOARD_PAGE_SIZE = 20
+
+# Requests eligible for profiling (admin X-Profile header or PROFILE_SAMPLE_RATE sampling)
+PROFILED_ENDPOINTS = {'generate_presentation'}
+
+def init_database():
+    """Create missing tables; a brand new schema already matches every migration"""
+    from sqlalchemy import inspect
+    fresh_database = not inspect(db.engine).has_table('user')
     db.create_all()
+    if fresh_database:
+        stamp_migrations(db.engine)
+    return fresh_database
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create the database schema (run once per database, before migrate)."""
+    if init_database():
+        print("Created a fresh schema")
+    else:
+        print("Created any missing tables; run `flask migrate` for schema changes")
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Apply pending SQL migrations from migrations/."""
+    applied = apply_migrations(db.engine)
+    print(f"Applied {len(applied)} migration(s)")
+
+@app.cli.command('reconcile-payments')
+@click.option('--batch-size', default=100, help='Pending payments verified per transaction.')
+@click.option('--workers', default=4, help='Concurrent Paystack requests.')
+@click.option('--min-age', default=10, help='Skip payments younger than this many minutes.')
+@click.option('--profile', is_flag=True, help='Store a stack profile of this run (see /admin/profiles).')
+def reconcile_payments_command(batch_size, workers, min_age, profile):
+    """Re-verify stuck pending payments against Paystack."""
+    if not paystack:
+        raise click.ClickException("PAYSTACK_SECRET_KEY is not set")
+    with profiler.job('reconcile_payments', force=profile):
+        report = reconcile_pending_payments(paystack, batch_size=batch_size, max_workers=workers,
+                                            min_age_minutes=min_age)
+    if report is None:
+        print("Another reconciliation run holds the lease")
+    else:
+        print(', '.join(f"{key}: {value}" for key, value in sorted(report.items())))
+
+@app.cli.command('rollup-llm-usage')
+def rollup_llm_usage_command():
+    """Fold finished hours of LLM usage into hourly rollups."""
+    hours = usage_recorder.rollup()
+    if hours is None:
+        print("Another worker holds the rollup lease")
+    else:
+        print(f"Rolled up {hours} hour(s) of LLM usage")
+
+@app.cli.command('sweep-expired')
+def sweep_expired_command():
+    """Expire overdue free-plan presentations and delete their files."""
+    report = expiry_sweeper.run_once()
+    if report is None:
+        print("Another worker holds the sweep lease")
+    else:
+        print(f"Expired {report['rows']} presentation(s), reclaimed {report['bytes']} bytes "
+              f"from {report['files']} file(s)")
 
 # OAuth scopes
 GOOGLE_SCOPES = [
@@ -92,7 +188,7 @@ def create_flow():
     """Create a new OAuth 2.0 flow with proper configuration."""
     base_url = os.getenv('APP_URL', 'http://localhost:5000')
     redirect_uri = f"{base_url}/oauth2callback"
-    
+    from google_auth_oauthlib.flow import Flow
     return Flow.from_client_config(
         GOOGLE_CLIENT_CONFIG,
         scopes=GOOGLE_SCOPES,
@@ -101,13 +197,47 @@ def create_flow():
 
 @app.before_request
 def before_request():
-    """Ensure database connection is active"""
-    try:
-        db.session.execute(text('SELECT 1'))
-    except Exception as e:
-        logger.error(f"Database connection error: {e}")
-        db.session.rollback()
-        return jsonify({'error': 'Service temporarily unavailable'}), 503
+    """Fail fast while the database circuit breaker is open"""
+    g._started = time.perf_counter()
+    if request.endpoint in PROFILED_ENDPOINTS and profiler.wanted(request.headers, is_admin()):
+        g._profile = profiler.start(request.endpoint, session.get('user', {}).get('id'),
+                                    request.headers.get('X-Request-ID'))
+    health_monitor.ensure_started()
+    expiry_sweeper.ensure_started()
+    usage_recorder.ensure_started()
+    if request.endpoint in DB_FREE_ENDPOINTS:
+        return None
+    if not health_monitor.database_available:
+        response = jsonify({'error': 'Service temporarily unavailable'})
+        response.headers['Retry-After'] = str(health_monitor.retry_after)
+        return response, 503
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('_started')
+    if started is not None and request.endpoint != 'static':
+        http_seconds.observe(time.perf_counter() - started, endpoint=request.endpoint or 'unmatched',
+                             method=request.method, status=response.status_code)
+    profile = g.get('_profile')
+    if profile is not None:
+        profile.finish(response.status_code)
+        response.headers['X-Profile-Id'] = profile.id
+    return response
+
+@app.teardown_request
+def stop_profile(exc):
+    """Make sure a sampler never outlives its request"""
+    profile = g.get('_profile')
+    if profile is not None:
+        profile.finish(type(exc).__name__ if exc else None)
+
+@app.errorhandler(OperationalError)
+def database_error(error):
+    """Count connection-level database errors towards the circuit breaker"""
+    logger.error(f"Database connection error: {error}")
+    db.session.rollback()
+    health_monitor.record_db_failure()
+    return jsonify({'error': 'Service temporarily unavailable'}), 503
 
 @app.errorhandler(500)
 def internal_error(error):
@@ -124,15 +254,39 @@ def not_found_error(error):
 @app.route('/')
 def index():
     if 'user' in session:
-        user = User.query.get(session['user']['id'])
-        presentations = Presentation.query.filter_by(
-            user_id=user.id,
-            status='active'
-        ).order_by(Presentation.created_at.desc()).all()
-        return render_template('index.html', user=user, presentations=presentations)
+        user = current_user()
+        presentations, next_cursor = Presentation.page_for_user(user.id, limit=DASHBOARD_PAGE_SIZE)
+        return render_template('index.html', user=user, presentations=presentations, next_cursor=next_cursor)
     return redirect(url_for('login'))
 
+@app.route('/presentations')
+@login_required
+def list_presentations():
+    """Further dashboard pages for infinite scroll"""
+    # A missing or non-integer limit falls back to the page size; anything else is clamped to 1..100
+    limit = max(1, min(request.args.get('limit', DASHBOARD_PAGE_SIZE, type=int), 100))
+    try:
+        presentations, next_cursor = Presentation.page_for_user(
+            session['user']['id'],
+            cursor=request.args.get('cursor'),
+            limit=limit
+        )
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    return jsonify({
+        'presentations': [{
+            'id': pres.id,
+            'title': pres.title,
+            'created_at': pres.created_at.isoformat(),
+            'expires_at': pres.expires_at.isoformat() if pres.expires_at else None,
+            'download_url': url_for('download_presentation', presentation_id=pres.id)
+        } for pres in presentations],
+        'next_cursor': next_cursor
+    })
+
 @app.route('/login')
+@page_cache.cached(max_age=3600)
 def login():
     """Show login page."""
     next_url = request.args.get('next', url_for('index'))
@@ -162,7 +316,8 @@ def google_auth_callback():
     
     user_info = auth.get_user_info(token_data['access_token'])
     
-    # Create or update user
+    # Create or update user; read from the primary so a just-created user is never missed
+    db.use_primary()
     user = User.query.get(user_info['id'])
     if not user:
         user = User(
@@ -263,7 +418,8 @@ def oauth2callback():
                 'picture': userinfo.get('picture')
             }
             
-            # Create or update user in database
+            # Create or update user in database, reading from the primary
+            db.use_primary()
             user = User.query.filter_by(email=userinfo['email']).first()
             if not user:
                 user = User(
@@ -313,6 +469,7 @@ def oauth2callback():
 
 @app.route('/generate', methods=['POST'])
 @login_required
+@admission.limit
 def generate_presentation():
     """Generate a presentation based on user input."""
     try:
@@ -323,22 +480,31 @@ def generate_presentation():
         if not title or not topic:
             return jsonify({'error': 'Title and topic are required'}), 400
 
+        # Claim plan usage up front so concurrent requests cannot overrun the limit
+        reservation = usage_quota.reserve(session['user']['id'], num_slides)
+        if not reservation:
+            return jsonify({
+                'error': 'Plan limit reached. Upgrade your plan to create more presentations.',
+                'upgrade_url': url_for('pricing')
+            }), 403
+
         # Create presentation
         try:
-            presentation_id = slides.create_presentation(title, topic, num_slides)
+            with usage_tags(user_id=reservation.user_id, plan=reservation.plan.value):
+                presentation_id = slides.create_presentation(title, topic, num_slides)
             if not presentation_id:
                 raise ValueError("Failed to create presentation")
                 
             # Save to database
             presentation = Presentation(
-                id=presentation_id,
                 title=title,
-                topic=topic,
+                num_slides=num_slides,
                 user_id=session['user']['id'],
                 created_at=datetime.utcnow()
             )
             db.session.add(presentation)
-            db.session.commit()
+            with span('db.commit'):
+                db.session.commit()
             
             presentation_url = f"https://docs.google.com/presentation/d/{presentation_id}"
             return jsonify({
@@ -349,6 +515,8 @@ def generate_presentation():
             
         except Exception as e:
             logger.error(f"Google API error: {str(e)}")
+            db.session.rollback()
+            usage_quota.release(reservation)
             return jsonify({'error': 'Failed to create presentation. Please try again.'}), 500
             
     except Exception as e:
@@ -362,32 +530,42 @@ def download(filename):
     try:
         # Ensure the filename is secure
         filename = secure_filename(filename)
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
-        
-        if not os.path.exists(file_path):
-            logger.error(f"File not found: {file_path}")
+        entry = download_index.lookup(filename)
+        if not entry:
+            logger.error(f"File not found: {filename}")
             return jsonify({'error': 'File not found'}), 404
-            
-        return send_from_directory(
-            UPLOAD_FOLDER,
-            filename,
-            as_attachment=True,
-            download_name=filename
-        )
+
+        return download_index.send(entry, filename)
+    except FileNotFoundError:
+        # Deleted since it was indexed, e.g. by another worker's sweep
+        download_index.unregister(filename)
+        return jsonify({'error': 'File not found'}), 404
     except Exception as e:
         logger.error(f"Error downloading file: {e}")
         return jsonify({'error': 'Error downloading file'}), 500
 
+@app.route('/presentations/<int:presentation_id>/download')
+@login_required
+def download_presentation(presentation_id):
+    """Download a presentation by id; the file path is only loaded here"""
+    presentation = Presentation.query.filter_by(
+        id=presentation_id,
+        user_id=session['user']['id']
+    ).first()
+    if not presentation or not presentation.file_path:
+        return jsonify({'error': 'File not found'}), 404
+    return download(os.path.basename(presentation.file_path))
+
 @app.route('/pricing')
 @login_required
 def pricing():
-    user = User.query.get(session['user']['id'])
+    user = current_user()
     return render_template('pricing.html', user=user)
 
 @app.route('/payment/create', methods=['POST'])
 def create_payment():
     try:
-        user = User.query.get(session['user']['id'])
+        user = current_user()
         payment_type = request.form.get('type')
         
         if payment_type == 'subscription':
@@ -416,62 +594,106 @@ def create_payment():
 
 @app.route('/payment/callback')
 def payment_callback():
+    """Return from Paystack checkout; the webhook does the actual confirmation"""
     reference = request.args.get('reference')
-    if reference and paystack.verify_transaction(reference):
+    status = paystack.payment_status(reference) if reference and paystack else None
+    if status == 'success':
+        return redirect(url_for('index'))
+    if status == 'pending':
+        flash('Your payment is being confirmed. Your plan will update in a moment.', 'info')
         return redirect(url_for('index'))
     return redirect(url_for('pricing'))
 
+@app.route('/payment/webhook', methods=['POST'])
+def payment_webhook():
+    """Signed Paystack event delivery"""
+    if not paystack:
+        return jsonify({'error': 'Payments not configured'}), 503
+    payload = request.get_data()
+    if not paystack.verify_webhook_signature(payload, request.headers.get('X-Paystack-Signature')):
+        logger.warning("Rejected Paystack webhook with invalid signature")
+        return jsonify({'error': 'Invalid signature'}), 401
+
+    event = request.get_json(silent=True) or {}
+    try:
+        paystack.handle_event(event)
+    except Exception as e:
+        # A non-200 makes Paystack redeliver, which is safe because processing is idempotent
+        logger.error(f"Error processing Paystack webhook: {e}")
+        db.session.rollback()
+        return jsonify({'error': 'Processing failed'}), 500
+    return jsonify({'received': True}), 200
+
 @app.route('/subscription/cancel')
 @login_required
 def cancel_subscription():
-    user = User.query.get(session['user']['id'])
+    user = current_user()
     if paystack.cancel_subscription(user.id):
         return redirect(url_for('pricing'))
     return jsonify({'error': 'Failed to cancel subscription'}), 500
 
 @app.route('/healthz')
 def health_check():
-    """Enhanced health check endpoint"""
-    try:
-        # Check database connection
-        db.session.execute(text('SELECT 1'))
-        
-        # Check file system
-        if not os.path.exists(UPLOAD_FOLDER):
-            raise Exception("Upload directory not accessible")
-            
-        # Check if we can write to the upload directory
-        test_file = os.path.join(UPLOAD_FOLDER, '.health_check')
-        try:
-            with open(test_file, 'w') as f:
-                f.write('ok')
-            os.remove(test_file)
-        except Exception as e:
-            raise Exception(f"Upload directory not writable: {e}")
-        
-        return jsonify({
-            'status': 'healthy',
-            'timestamp': datetime.utcnow().isoformat(),
-            'checks': {
-                'database': 'ok',
-                'filesystem': 'ok'
-            }
-        }), 200
-    except Exception as e:
-        logger.error(f"Health check failed: {e}")
-        return jsonify({
-            'status': 'unhealthy',
-            'error': str(e),
-            'timestamp': datetime.utcnow().isoformat()
-        }), 503
+    """Report the cached health status and its age"""
+    report = dict(health_monitor.report(), admission=admission.report())
+    return jsonify(report), 200 if report['status'] == 'healthy' else 503
+
+@app.route('/admin/quotas')
+@admin_required
+def crawler_quotas():
+    """Remaining stock-photo API quota per key, for dashboards"""
+    return jsonify({
+        'timestamp': datetime.utcnow().isoformat(),
+        'quotas': quota_tracker.snapshot()
+    })
+
+@app.route('/admin/llm-usage')
+@admin_required
+def llm_usage_report():
+    """LLM calls, tokens, cost and latency per prompt template and model"""
+    hours = request.args.get('hours', 24, type=int)
+    since = datetime.utcnow() - timedelta(hours=hours)
+    return jsonify({
+        'since': since.isoformat(),
+        'templates': usage_recorder.report(since)
+    })
+
+@app.route('/admin/profiles')
+@admin_required
+def list_profiles():
+    """Slowest profiled requests and jobs, optionally for one name or X-Request-ID"""
+    return jsonify({'profiles': [
+        dict(summary, url=url_for('get_profile', profile_id=summary['id']))
+        for summary in profiler.slowest(request.args.get('limit', 50, type=int), request.args.get('name'),
+                                        request.args.get('request_id'))
+    ]})
+
+@app.route('/admin/profiles/<profile_id>')
+@admin_required
+def get_profile(profile_id):
+    """Collapsed stacks for one profile, for flamegraph.pl or speedscope"""
+    collapsed = profiler.collapsed(profile_id)
+    if collapsed is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    return Response(collapsed, mimetype='text/plain')
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint; set METRICS_TOKEN to require a bearer token"""
+    token = os.environ.get('METRICS_TOKEN')
+    if token and not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({'error': 'Forbidden'}), 403
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/privacy')
+@page_cache.cached(max_age=86400)
 def privacy_policy():
-    return render_template('privacy.html', now=datetime.now())
+    return render_template('privacy.html', now=LEGAL_LAST_UPDATED)
 
 @app.route('/terms')
+@page_cache.cached(max_age=86400)
 def terms_of_service():
-    return render_template('terms.html', now=datetime.now())
+    return render_template('terms.html', now=LEGAL_LAST_UPDATED)
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
@@ -3,7 +3,7 @@ import json
 import requests
 from functools import wraps
 from urllib.parse import quote
-from flask import redirect, request, session, url_for
+from flask import jsonify, redirect, request, session, url_for
 
 class GoogleAuth:
     GOOGLE_AUTH_URL = "https://accounts.google.com/o/oauth2/v2/auth"
@@ -76,3 +76,21 @@ def login_required(f):
             return redirect(url_for('login'))
         return f(*args, **kwargs)
     return decorated_function
+
+def is_admin():
+    """True if the logged-in user's email is listed in ADMIN_EMAILS"""
+    if 'user' not in session:
+        return False
+    admins = [e.strip().lower() for e in os.environ.get('ADMIN_EMAILS', '').split(',') if e.strip()]
+    return (session['user'].get('email') or '').lower() in admins
+
+def admin_required(f):
+    """Decorator to restrict a route to the emails listed in ADMIN_EMAILS"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user' not in session:
+            return redirect(url_for('login'))
+        if not is_admin():
+            return jsonify({'error': 'Forbidden'}), 403
+        return f(*args, **kwargs)
+    return decorated_function
@@ -0,0 +1,62 @@
+"""Helpers shared by the benchmark scripts: percentiles, result files and comparisons."""
+import os
+import json
+import subprocess
+from datetime import datetime
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize_ms(seconds):
+    """p50/p95/p99/mean/max of a list of durations, in milliseconds"""
+    values = sorted(s * 1000 for s in seconds)
+    if not values:
+        return {}
+    return {
+        'p50': round(percentile(values, 50), 2),
+        'p95': round(percentile(values, 95), 2),
+        'p99': round(percentile(values, 99), 2),
+        'mean': round(sum(values) / len(values), 2),
+        'max': round(values[-1], 2),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return 'unknown'
+
+
+def write_results(payload, path=None, name='results'):
+    """Write a result file tagged with the commit and time; returns its path"""
+    payload = dict(payload, commit=git_commit(), timestamp=datetime.utcnow().isoformat())
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{name}-{payload['commit']}.json")
+    with open(path, 'w') as f:
+        json.dump(payload, f, indent=2, sort_keys=True)
+    return path
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def relative_change(old, new):
+    """Signed change as a fraction of old, or None when it cannot be computed"""
+    if old in (None, 0) or new is None:
+        return None
+    return (new - old) / old
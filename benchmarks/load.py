@@ -0,0 +1,317 @@
+"""
+End-to-end load benchmark against local fakes of every upstream.
+
+Starts the OpenAI, Slides and stock-photo fakes as subprocesses, points the
+app at them, then drives one target at each concurrency level:
+
+    generate      POST /generate through a fixed pool of WSGI worker threads
+    generate_ppt  generate_ppt.generate_ppt() called directly
+    images        PexelsCrawler.get_image() for distinct queries
+
+    python -m benchmarks.load --target generate --levels 1,2,4,8,16 --workers 8
+    python -m benchmarks.load --target generate_ppt --openai-latency 1.5 --compare benchmarks/results/old.json
+
+Each level reports throughput, p50/p95/p99 latency, status counts, worker
+utilisation (busy worker-seconds over workers x wall time) and process CPU
+utilisation. Results are written as JSON for comparison across commits.
+A level where more than --max-failure-ratio of calls fail (non-2xx or an
+exception) aborts the run without writing results, since its numbers would
+only describe the error path.
+"""
+import os
+import sys
+import time
+import uuid
+import shutil
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import summarize_ms, write_results, load_results, relative_change
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_fake(module, *args):
+    """Run a fake upstream in its own process; returns (process, base_url)"""
+    process = subprocess.Popen(
+        [sys.executable, '-m', module, '--port', '0', *map(str, args)],
+        cwd=ROOT, stdout=subprocess.PIPE, text=True
+    )
+    line = process.stdout.readline().strip()
+    if ' on ' not in line:
+        process.kill()
+        raise RuntimeError(f"{module} failed to start: {line!r}")
+    return process, line.rsplit(' on ', 1)[1]
+
+
+def profile_args(latency, args):
+    return ['--latency', latency, '--jitter', latency * args.jitter, '--error-rate', args.error_rate]
+
+
+class BusyTracker:
+    """WSGI middleware measuring how long worker threads spend inside the app"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        started = time.perf_counter()
+        try:
+            return self.wsgi_app(environ, start_response)
+        finally:
+            with self._lock:
+                self.busy_seconds += time.perf_counter() - started
+
+    def reset(self):
+        with self._lock:
+            busy, self.busy_seconds = self.busy_seconds, 0.0
+        return busy
+
+
+def serve_pooled(wsgi_app, workers):
+    """A WSGI server with a fixed worker pool, like gunicorn's gthread worker"""
+    from werkzeug.serving import BaseWSGIServer
+
+    class PooledWSGIServer(BaseWSGIServer):
+        def __init__(self):
+            super().__init__('127.0.0.1', 0, wsgi_app)
+            self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='wsgi-worker')
+
+        def _handle(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self._handle, request, client_address)
+
+    server = PooledWSGIServer()
+    threading.Thread(target=server.serve_forever, name='wsgi-accept', daemon=True).start()
+    return server
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_level(call, concurrency, total):
+    """Run total calls with concurrency threads; returns (durations, statuses, wall seconds)"""
+    durations, statuses = [], Counter()
+    lock = threading.Lock()
+
+    def one(i):
+        started = time.perf_counter()
+        try:
+            status = call(i)
+        except Exception as e:
+            status = type(e).__name__
+        elapsed = time.perf_counter() - started
+        with lock:
+            durations.append(elapsed)
+            statuses[str(status)] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(total)))
+    return durations, statuses, time.perf_counter() - started
+
+
+def failure_ratio(statuses):
+    """Share of calls that ended in a non-2xx response or an exception"""
+    total = sum(statuses.values())
+    ok = sum(count for status, count in statuses.items() if status.startswith('2') or status in ('ok', 'none'))
+    return (total - ok) / total if total else 0.0
+
+
+def setup_app(args, workdir):
+    """Import the app against a throwaway database and return (app module, db, models)"""
+    os.chdir(workdir)
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'EXPIRY_SWEEP_INTERVAL': '0',
+        'HEALTH_CHECK_INTERVAL': '3600',
+        'CRAWLER_QUOTA_DB': os.path.join(workdir, 'quota.db'),
+    })
+    sys.path.insert(0, ROOT)
+    import app as app_module
+    app_module.app.template_folder = os.path.join(ROOT, 'templates')
+    with app_module.app.app_context():
+        app_module.init_database()
+    return app_module
+
+
+def generate_target(args, app_module):
+    """POST /generate as distinct pay-per-presentation users"""
+    import requests
+    from models.database import db, User, PlanType
+
+    flask_app = app_module.app
+    users = [f'bench-{uuid.uuid4().hex[:12]}' for _ in range(args.requests * len(args.levels))]
+    with flask_app.app_context():
+        db.session.bulk_save_objects([
+            User(id=uid, email=f'{uid}@bench.local', current_plan=PlanType.PAY_PER_PRESENTATION) for uid in users
+        ])
+        db.session.commit()
+
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    cookie_name = flask_app.session_cookie_name
+    tracker = BusyTracker(flask_app.wsgi_app)
+    flask_app.wsgi_app = tracker
+    server = serve_pooled(flask_app, args.workers)
+    url = f'http://127.0.0.1:{server.server_port}/generate'
+    user_iter = iter(users)
+    user_lock = threading.Lock()
+    http = requests.Session()
+
+    def call(i):
+        with user_lock:
+            uid = next(user_iter)
+        cookie = serializer.dumps({'user': {'id': uid, 'email': f'{uid}@bench.local'}})
+        response = http.post(url, data={'title': f'Deck {i}', 'topic': args.topic, 'num_slides': args.slides},
+                             cookies={cookie_name: cookie}, timeout=args.timeout)
+        return response.status_code
+
+    return call, tracker, args.workers
+
+
+def generate_ppt_target(args, app_module):
+    import generate_ppt
+
+    def call(i):
+        path = generate_ppt.generate_ppt(f'{args.topic} {i}', args.slides)
+        os.remove(path)
+        return 'ok'
+
+    return call, None, None
+
+
+def images_target(args, app_module):
+    from crawlers.pexels_crawler import PexelsCrawler
+    crawler = PexelsCrawler()
+    save_dir = tempfile.mkdtemp(prefix='bench-images-')
+
+    def call(i):
+        with crawler.deck() as deck_id:
+            name = crawler.get_image(f'{args.topic} {i}', save_dir, deck_id=deck_id)
+        return 'ok' if name else 'none'
+
+    return call, None, None
+
+
+TARGETS = {'generate': generate_target, 'generate_ppt': generate_ppt_target, 'images': images_target}
+
+
+def print_comparison(previous, current):
+    old_levels = {level['concurrency']: level for level in previous.get('levels', [])}
+    print(f"\nAgainst {previous.get('commit')} ({previous.get('timestamp')}):")
+    for level in current['levels']:
+        old = old_levels.get(level['concurrency'])
+        if not old:
+            continue
+        changes = []
+        for label, old_value, new_value in (
+            ('rps', old['throughput_rps'], level['throughput_rps']),
+            ('p50', old['latency_ms'].get('p50'), level['latency_ms'].get('p50')),
+            ('p95', old['latency_ms'].get('p95'), level['latency_ms'].get('p95')),
+        ):
+            change = relative_change(old_value, new_value)
+            changes.append(f"{label} {'n/a' if change is None else f'{change:+.1%}'}")
+        print(f"  c={level['concurrency']:<4} " + '  '.join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', choices=sorted(TARGETS), default='generate')
+    parser.add_argument('--levels', default='1,2,4,8,16', help='comma-separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=0, help='calls per level (default: 4 x concurrency)')
+    parser.add_argument('--workers', type=int, default=8, help='WSGI worker threads for --target generate')
+    parser.add_argument('--slides', type=int, default=5)
+    parser.add_argument('--topic', default='Renewable energy adoption')
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--openai-latency', type=float, default=1.0)
+    parser.add_argument('--slides-latency', type=float, default=0.3)
+    parser.add_argument('--photos-latency', type=float, default=0.2)
+    parser.add_argument('--jitter', type=float, default=0.25, help='jitter as a fraction of each latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='injected 500 rate for every fake')
+    parser.add_argument('--max-failure-ratio', type=float, default=0.1,
+                        help='abort when a level fails more often than this; raise it with --error-rate')
+    parser.add_argument('--out', help='result file (default: benchmarks/results/load-<target>-<commit>.json)')
+    parser.add_argument('--compare', help='previous result file to diff against')
+    args = parser.parse_args()
+    args.levels = [int(level) for level in args.levels.split(',')]
+    args.requests = args.requests or 4 * max(args.levels)
+
+    fakes = []
+    workdir = tempfile.mkdtemp(prefix='bench-load-')
+    try:
+        openai_proc, openai_url = start_fake('fakes.openai_server', *profile_args(args.openai_latency, args))
+        slides_proc, slides_url = start_fake('fakes.slides_server', *profile_args(args.slides_latency, args))
+        photos_proc, photos_url = start_fake('fakes.stock_photos_server', *profile_args(args.photos_latency, args))
+        fakes = [openai_proc, slides_proc, photos_proc]
+        os.environ.update({
+            'OPENAI_API_KEY': 'sk-bench',
+            'OPENAI_BASE_URL': f'{openai_url}/v1',
+            'SLIDES_API_ROOT': f'{slides_url}/',
+            'PEXELS_API_KEY': 'bench',
+            'PEXELS_API_URL': f'{photos_url}/v1/search',
+            'PIXABAY_API_KEY': 'bench',
+            'PIXABAY_API_URL': f'{photos_url}/api/',
+        })
+
+        app_module = setup_app(args, workdir)
+        call, tracker, workers = TARGETS[args.target](args, app_module)
+
+        levels = []
+        for concurrency in args.levels:
+            if tracker:
+                tracker.reset()
+            cpu_before = cpu_seconds()
+            durations, statuses, wall = run_level(call, concurrency, args.requests)
+            cpu = cpu_seconds() - cpu_before
+            level = {
+                'concurrency': concurrency,
+                'requests': len(durations),
+                'statuses': dict(statuses),
+                'throughput_rps': round(len(durations) / wall, 3),
+                'latency_ms': summarize_ms(durations),
+                'wall_seconds': round(wall, 3),
+                'cpu_utilisation': round(cpu / wall / (os.cpu_count() or 1), 3),
+            }
+            if tracker:
+                level['worker_utilisation'] = round(tracker.reset() / (workers * wall), 3)
+            levels.append(level)
+            print(f"c={concurrency:<4} {level['throughput_rps']:>8.2f} rps  "
+                  f"p50={level['latency_ms'].get('p50')}ms p95={level['latency_ms'].get('p95')}ms "
+                  f"p99={level['latency_ms'].get('p99')}ms  "
+                  f"workers={level.get('worker_utilisation', '-')} cpu={level['cpu_utilisation']}  "
+                  f"{dict(statuses)}")
+            failed = failure_ratio(statuses)
+            if failed > args.max_failure_ratio:
+                raise SystemExit(f"c={concurrency}: {failed:.0%} of calls failed "
+                                 f"(limit {args.max_failure_ratio:.0%}), not writing results")
+
+        config = {k: v for k, v in vars(args).items() if k not in ('out', 'compare', 'max_failure_ratio')}
+        payload = {'benchmark': 'load', 'target': args.target, 'config': config, 'levels': levels}
+        path = write_results(payload, args.out, name=f'load-{args.target}')
+        print(f"Results written to {path}")
+        if args.compare:
+            print_comparison(load_results(args.compare), payload)
+    finally:
+        for process in fakes:
+            process.terminate()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
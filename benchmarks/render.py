@@ -0,0 +1,240 @@
+"""
+Microbenchmarks for the python-pptx render path in generate_ppt.py.
+
+Times each slide builder for every palette, then whole decks of 5-100
+slides including ppt.save. The LLM call in generate_intro_slide is replaced
+by a canned reply so only rendering is measured.
+
+    python -m benchmarks.render                      # run and compare with the baseline
+    python -m benchmarks.render --save-baseline      # record benchmarks/baselines/render.json
+    python -m benchmarks.render --sizes 5,25 --repeat 5 --palettes minimalist_blue
+
+Per case it records median and p95 wall time, bytes allocated and peak
+traced memory (tracemalloc, measured in a separate pass so it does not
+skew the timings), and for decks also peak RSS growth and output size.
+Decks are built in a forked child each so peak RSS is per case.
+"""
+import os
+import io
+import sys
+import time
+import argparse
+import resource
+import statistics
+import tracemalloc
+import multiprocessing
+
+from benchmarks.common import percentile, write_results, load_results, relative_change
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'render.json')
+
+INSIGHT = ("Implement AI-powered customer analytics to increase retention by 25% through "
+           "personalized engagement strategies and predictive behavior modeling.")
+OVERVIEW = ("The renewable energy sector is experiencing unprecedented growth, with global investments "
+            "exceeding $500B. Advanced technologies and favorable policies are accelerating adoption.")
+
+
+class CannedClient:
+    """Replaces OpenAIClient in generate_ppt so the intro slide renders without a network call"""
+
+    def __init__(self, *args, **kwargs):
+        self.model = 'gpt-3.5-turbo'
+
+    def generate(self, prompt, template=None, max_tokens=500):
+        return OVERVIEW
+
+
+def load_generate_ppt():
+    os.environ.setdefault('OPENAI_API_KEY', 'sk-bench')
+    import generate_ppt
+    generate_ppt.OpenAIClient = CannedClient
+    return generate_ppt
+
+
+def new_deck(gp):
+    from pptx import Presentation
+    from pptx.util import Inches
+    ppt = Presentation()
+    ppt.slide_width = Inches(13.33)
+    ppt.slide_height = Inches(7.5)
+    return ppt
+
+
+def stage_calls(gp):
+    """name -> callable(ppt, palette) for every slide builder being measured"""
+    calls = {
+        'create_title_slide': lambda ppt, palette: gp.create_title_slide(ppt, 'Renewable Energy', palette),
+        'generate_intro_slide': lambda ppt, palette: gp.generate_intro_slide(ppt, 'Renewable Energy', palette),
+        'create_modern_conclusion_slide':
+            lambda ppt, palette: gp.create_modern_conclusion_slide(ppt, [INSIGHT] * 4, palette),
+    }
+    for n in range(1, 5):
+        calls[f'create_modern_content_slide[{n}]'] = (
+            lambda ppt, palette, n=n: gp.create_modern_content_slide(ppt, 'Key Insights', [INSIGHT] * n, palette)
+        )
+    return calls
+
+
+def build_deck(gp, size, palette):
+    """Title, overview, content slides of three insights and a conclusion: size slides in total"""
+    ppt = new_deck(gp)
+    gp.create_title_slide(ppt, 'Renewable Energy', palette)
+    gp.generate_intro_slide(ppt, 'Renewable Energy', palette)
+    for _ in range(max(0, size - 3)):
+        gp.create_modern_content_slide(ppt, 'Key Insights', [INSIGHT] * 3, palette)
+    gp.create_modern_conclusion_slide(ppt, [INSIGHT] * 4, palette)
+    return ppt
+
+
+def timing_summary(samples):
+    ordered = sorted(samples)
+    return {
+        'median_ms': round(statistics.median(ordered) * 1000, 3),
+        'p95_ms': round(percentile(ordered, 95) * 1000, 3),
+    }
+
+
+def traced(func):
+    """Run func under tracemalloc; returns (result, bytes allocated and still held, peak traced bytes)"""
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        result = func()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, current - before, peak - before
+
+
+def bench_stage(gp, call, palette, repeat):
+    call(new_deck(gp), palette)  # warm-up: imports, template parsing, caches
+    samples = []
+    for _ in range(repeat):
+        ppt = new_deck(gp)
+        started = time.perf_counter()
+        call(ppt, palette)
+        samples.append(time.perf_counter() - started)
+    ppt = new_deck(gp)
+    _, held, peak = traced(lambda: call(ppt, palette))
+    return dict(timing_summary(samples), alloc_bytes=held, peak_traced_bytes=peak)
+
+
+def _deck_case(size, theme, repeat, results):
+    """Runs in a forked child so ru_maxrss reflects this case only"""
+    gp = load_generate_ppt()
+    palette = gp.ColorPalette.get_palette(theme)
+    rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    build_deck(gp, size, palette).save(io.BytesIO())  # warm-up
+    build, save, output = [], [], 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        ppt = build_deck(gp, size, palette)
+        built = time.perf_counter()
+        buffer = io.BytesIO()
+        ppt.save(buffer)
+        build.append(built - started)
+        save.append(time.perf_counter() - built)
+        output = buffer.tell()
+
+    _, build_held, build_peak = traced(lambda: build_deck(gp, size, palette))
+    ppt = build_deck(gp, size, palette)
+    _, save_held, save_peak = traced(lambda: ppt.save(io.BytesIO()))
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    rss_growth = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_start) * scale
+
+    results.put({
+        'build': dict(timing_summary(build), alloc_bytes=build_held, peak_traced_bytes=build_peak),
+        'save': dict(timing_summary(save), alloc_bytes=save_held, peak_traced_bytes=save_peak),
+        'output_bytes': output,
+        'peak_rss_growth_bytes': rss_growth,
+    })
+
+
+def bench_deck(size, theme, repeat):
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    child = context.Process(target=_deck_case, args=(size, theme, repeat, results))
+    child.start()
+    result = results.get()
+    child.join()
+    return result
+
+
+def flatten(results):
+    """case name -> metrics, for comparing two runs"""
+    flat = {}
+    for theme, stages in results['stages'].items():
+        for stage, metrics in stages.items():
+            flat[f'{stage} [{theme}]'] = metrics
+    for theme, decks in results['decks'].items():
+        for size, metrics in decks.items():
+            flat[f'deck {size} build [{theme}]'] = metrics['build']
+            flat[f'deck {size} save [{theme}]'] = dict(metrics['save'], output_bytes=metrics['output_bytes'])
+    return flat
+
+
+def compare(previous, current, threshold):
+    """Print cases whose median time, allocations or output size moved by more than threshold"""
+    old, new = flatten(previous), flatten(current)
+    print(f"\nAgainst {previous.get('commit')} ({previous.get('timestamp')}), threshold {threshold:.0%}:")
+    flagged = 0
+    for case in sorted(new):
+        if case not in old:
+            continue
+        for metric in ('median_ms', 'alloc_bytes', 'output_bytes'):
+            change = relative_change(old[case].get(metric), new[case].get(metric))
+            if change is not None and abs(change) >= threshold:
+                flagged += 1
+                print(f"  {case:<52} {metric:<12} {old[case][metric]:>12} -> {new[case][metric]:<12} {change:+.1%}")
+    if not flagged:
+        print("  no changes above threshold")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--palettes', help='comma-separated palette names (default: all)')
+    parser.add_argument('--sizes', default='5,10,25,50,100', help='deck sizes in slides')
+    parser.add_argument('--repeat', type=int, default=20, help='timed runs per slide builder')
+    parser.add_argument('--deck-repeat', type=int, default=3, help='timed runs per deck size')
+    parser.add_argument('--out', help='result file (default: benchmarks/results/render-<commit>.json)')
+    parser.add_argument('--save-baseline', action='store_true', help=f'also write {BASELINE}')
+    parser.add_argument('--compare', default=BASELINE, help='result file to diff against (default: the baseline)')
+    parser.add_argument('--threshold', type=float, default=0.10, help='relative change worth reporting')
+    args = parser.parse_args()
+
+    gp = load_generate_ppt()
+    themes = args.palettes.split(',') if args.palettes else list(gp.ColorPalette.PALETTES)
+    sizes = [int(size) for size in args.sizes.split(',')]
+    calls = stage_calls(gp)
+
+    stages, decks = {}, {}
+    for theme in themes:
+        palette = gp.ColorPalette.get_palette(theme)
+        stages[theme] = {name: bench_stage(gp, call, palette, args.repeat) for name, call in calls.items()}
+        decks[theme] = {}
+        for size in sizes:
+            decks[theme][str(size)] = result = bench_deck(size, theme, args.deck_repeat)
+            print(f"{theme:<18} {size:>4} slides  build {result['build']['median_ms']:>9.1f}ms  "
+                  f"save {result['save']['median_ms']:>8.1f}ms  {result['output_bytes']:>9} bytes  "
+                  f"rss +{result['peak_rss_growth_bytes'] // 1024} KiB")
+
+    payload = {
+        'benchmark': 'render',
+        'config': {'palettes': themes, 'sizes': sizes, 'repeat': args.repeat, 'deck_repeat': args.deck_repeat},
+        'python': sys.version.split()[0],
+        'stages': stages,
+        'decks': decks,
+    }
+    path = write_results(payload, args.out, name='render')
+    print(f"Results written to {path}")
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(BASELINE), exist_ok=True)
+        print(f"Baseline written to {write_results(payload, BASELINE)}")
+    elif args.compare and os.path.exists(args.compare):
+        compare(load_results(args.compare), load_results(path), args.threshold)
+
+
+if __name__ == '__main__':
+    main()
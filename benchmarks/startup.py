@@ -0,0 +1,124 @@
+"""
+Cold-start benchmark: how long a fresh interpreter takes to import the app.
+
+Each run imports the module in a new process under `python -X importtime`,
+against a throwaway SQLite database and without Google or OpenAI
+credentials, the way a new autoscaled worker starts.
+
+    python -m benchmarks.startup                          # 10 runs of `import app`
+    python -m benchmarks.startup --module generate_ppt --runs 20
+    python -m benchmarks.startup --compare benchmarks/results/startup-app-abc1234.json
+
+It reports median and p95 import time, the slowest imports by cumulative
+time from the median run, and which heavy client libraries the import
+pulled in; those should only load on first use.
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+from benchmarks.common import percentile, write_results, load_results, relative_change
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Client libraries that must not be imported until a request needs them
+HEAVY_MODULES = ('openai', 'googleapiclient', 'google_auth_oauthlib', 'cohere', 'pptx')
+
+CHILD = """
+import sys, time, json
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{'seconds': elapsed, 'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def parse_importtime(stderr):
+    """module -> cumulative microseconds from -X importtime output"""
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumul, name = line[len('import time:'):].split('|')
+        cumulative[name.strip()] = int(cumul)
+    return cumulative
+
+
+def run_once(module, workdir):
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'startup.db')}",
+        CRAWLER_QUOTA_DB=os.path.join(workdir, 'quota.db'),
+        OPENAI_API_KEY='sk-bench',
+    )
+    for name in ('GOOGLE_CREDENTIALS_JSON', 'SLIDES_API_ROOT'):
+        env.pop(name, None)
+    child = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD.format(module=module, heavy=HEAVY_MODULES)],
+        cwd=workdir, env=env, capture_output=True, text=True
+    )
+    if child.returncode:
+        raise RuntimeError(f"import {module} failed:\n{child.stderr[-2000:]}")
+    result = json.loads(child.stdout.strip().splitlines()[-1])
+    result['imports'] = parse_importtime(child.stderr)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='app', help='module to import')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--top', type=int, default=15, help='slowest imports to report')
+    parser.add_argument('--out', help='result file (default: benchmarks/results/startup-<module>-<commit>.json)')
+    parser.add_argument('--compare', help='previous result file to diff against')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-startup-')
+    try:
+        run_once(args.module, workdir)  # warm-up: bytecode and filesystem caches
+        runs = [run_once(args.module, workdir) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    ordered = sorted(runs, key=lambda run: run['seconds'])
+    seconds = [run['seconds'] for run in ordered]
+    median_run = ordered[len(ordered) // 2]
+    slowest = sorted(median_run['imports'].items(), key=lambda item: item[1], reverse=True)[:args.top]
+    payload = {
+        'benchmark': 'startup',
+        'module': args.module,
+        'config': {'runs': args.runs},
+        'python': sys.version.split()[0],
+        'median_ms': round(statistics.median(seconds) * 1000, 1),
+        'p95_ms': round(percentile(seconds, 95) * 1000, 1),
+        'heavy_modules': median_run['heavy'],
+        'slowest_imports_ms': {name: round(us / 1000, 1) for name, us in slowest},
+    }
+
+    print(f"import {args.module}: median {payload['median_ms']}ms  p95 {payload['p95_ms']}ms  "
+          f"({args.runs} runs)")
+    print(f"heavy modules loaded: {', '.join(payload['heavy_modules']) or 'none'}")
+    for name, ms in payload['slowest_imports_ms'].items():
+        print(f"  {ms:>9.1f}ms  {name}")
+    path = write_results(payload, args.out, name=f'startup-{args.module}')
+    print(f"Results written to {path}")
+
+    if args.compare:
+        previous = load_results(args.compare)
+        change = relative_change(previous.get('median_ms'), payload['median_ms'])
+        print(f"\nAgainst {previous.get('commit')} ({previous.get('timestamp')}): median "
+              f"{previous.get('median_ms')}ms -> {payload['median_ms']}ms "
+              f"({'n/a' if change is None else f'{change:+.1%}'})")
+        added = sorted(set(payload['heavy_modules']) - set(previous.get('heavy_modules', [])))
+        if added:
+            print(f"  now imported eagerly: {', '.join(added)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,9 @@
+import uuid
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from crawlers.image_index import image_index
+from crawlers.keywords import extract_image_queries
+from crawlers.search_cache import search_cache
 
 
 class BaseCrawler(ABC):
@@ -6,5 +11,44 @@ class BaseCrawler(ABC):
         self.browser = browser
 
     @abstractmethod
-    def get_image(self, prompt, save_dir):
+    def get_image(self, prompt, save_dir, deck_id=None):
         pass
+
+    @contextmanager
+    def deck(self, deck_id=None):
+        """
+        Scope for one deck's image lookups: images are not repeated inside it,
+        and its cursors and hashes are released on exit. Generates a deck id
+        when none is given.
+        """
+        deck_id = deck_id or uuid.uuid4().hex
+        try:
+            yield deck_id
+        finally:
+            self.release_deck(deck_id)
+
+    def get_images_for_sections(self, sections, save_dir, deck_id=None, topic=None):
+        """
+        Fetch one image per slide, trying each slide's locally ranked queries in
+        order until one returns an image. Returns a filename (or None) per section.
+        Without a deck_id the call is its own deck; a caller passing one owns
+        its lifecycle, e.g. through deck().
+        """
+        if deck_id is None:
+            with self.deck() as deck_id:
+                return self.get_images_for_sections(sections, save_dir, deck_id, topic)
+
+        images = []
+        for queries in extract_image_queries(sections, topic=topic):
+            filename = None
+            for query in queries:
+                filename = self.get_image(query, save_dir, deck_id)
+                if filename:
+                    break
+            images.append(filename)
+        return images
+
+    def release_deck(self, deck_id):
+        """Drop the per-deck image cursors and hashes once a deck is finished"""
+        search_cache.release_deck(deck_id)
+        image_index.release_deck(deck_id)
@@ -4,7 +4,9 @@ from random import choice
 from urllib.parse import urlparse
 from icrawler.builtin import ImageDownloader, BaiduImageCrawler, BingImageCrawler, GoogleImageCrawler
 from crawlers import base_crawler
+from crawlers.image_index import image_index
 import logging
+from services.metrics import span
 
 class ICrawlerDownloader(ImageDownloader):
     def __init__(self, *args, **kwargs):
@@ -40,7 +42,7 @@ class ICrawlerCrawler(base_crawler.BaseCrawler):
         super().__init__(browser)
         self.browser = browser
 
-    def get_image(self, query, save_dir):
+    def get_image(self, query, save_dir, deck_id=None):
         try:
             if self.browser == "google":
                 crawler = GoogleImageCrawler(downloader_cls=ICrawlerDownloader, storage={'root_dir': save_dir if save_dir
@@ -59,7 +61,8 @@ class ICrawlerCrawler(base_crawler.BaseCrawler):
             downloader.generate_new_name()
             
             try:
-                crawler.crawl(keyword=query, max_num=1)
+                with span(f'icrawler.{self.browser}'):
+                    crawler.crawl(keyword=query, max_num=1)
             except Exception as e:
                 logging.error(f"Failed to crawl for image: {str(e)}")
                 return None
@@ -75,6 +78,9 @@ class ICrawlerCrawler(base_crawler.BaseCrawler):
                 logging.warning(f"Image file not found after download: {image_path}")
                 return None
 
+            if not image_index.register_file(deck_id, image_path):
+                return None
+
             return final_image_name
         except Exception as e:
             logging.error(f"Error in get_image: {str(e)}")
@@ -0,0 +1,168 @@
+import os
+import time
+import shutil
+import logging
+import threading
+from collections import OrderedDict
+from io import BytesIO
+import numpy as np
+from PIL import Image
+
+# Bit counts for every byte value, used to popcount XORed hashes
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def dhash(data, hash_size=8):
+    """
+    Compute a 64-bit difference hash of encoded image bytes.
+    Each bit says whether a pixel is brighter than its right neighbour in a
+    (hash_size + 1) x hash_size grayscale thumbnail.
+    """
+    image = Image.open(BytesIO(data))
+    # Let the JPEG decoder downscale while decoding; far cheaper than a full decode
+    image.draft('L', (hash_size * 8, hash_size * 8))
+    pixels = np.asarray(
+        image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR),
+        dtype=np.int16
+    )
+    bits = np.packbits(pixels[:, 1:] > pixels[:, :-1])
+    return int.from_bytes(bits.tobytes(), 'big')
+
+
+def hamming_distances(hashes, image_hash):
+    """Vectorised Hamming distance from image_hash to every entry of a uint64 array"""
+    xored = np.bitwise_xor(hashes, np.uint64(image_hash))
+    return _POPCOUNT[xored.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class PerceptualHashIndex:
+    """
+    Tracks perceptual hashes of every saved image. Rejects near-duplicates
+    within a deck and reuses already stored files across decks. Per-deck
+    hashes go on release_deck(), and at the latest once max_decks newer
+    decks have been seen or they have been idle for deck_ttl seconds.
+    """
+
+    def __init__(self, threshold=None, max_entries=10000, max_decks=1024, deck_ttl=3600):
+        if threshold is None:
+            threshold = int(os.environ.get('IMAGE_DUPLICATE_THRESHOLD', 6))
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_decks = max_decks
+        self.deck_ttl = deck_ttl
+        self._hashes = np.empty(0, dtype=np.uint64)
+        self._paths = []
+        self._decks = OrderedDict()  # deck_id -> (touched_at, uint64 array of hashes), least recent first
+        self._lock = threading.Lock()
+
+    def is_duplicate(self, deck_id, image_hash):
+        """Whether a deck already contains an image within the threshold"""
+        entry = self._decks.get(deck_id)
+        if entry is None or not len(entry[1]):
+            return False
+        deck_hashes = entry[1]
+        return bool((hamming_distances(deck_hashes, image_hash) <= self.threshold).any())
+
+    def find_stored(self, image_hash):
+        """Return the path of a stored near-identical image, if one still exists"""
+        if not len(self._hashes):
+            return None
+        distances = hamming_distances(self._hashes, image_hash)
+        best = int(distances.argmin())
+        if distances[best] <= self.threshold and os.path.exists(self._paths[best]):
+            return self._paths[best]
+        return None
+
+    def add(self, deck_id, image_hash, path):
+        entry = np.array([image_hash], dtype=np.uint64)
+        if deck_id is not None:
+            now = time.time()
+            previous = self._decks.pop(deck_id, (now, entry[:0]))[1]
+            self._decks[deck_id] = (now, np.concatenate([previous, entry]))
+            while len(self._decks) > self.max_decks or now - next(iter(self._decks.values()))[0] > self.deck_ttl:
+                self._decks.popitem(last=False)
+        self._hashes = np.concatenate([self._hashes, entry])
+        self._paths.append(path)
+        if len(self._paths) > self.max_entries:
+            drop = len(self._paths) - self.max_entries
+            self._hashes = self._hashes[drop:]
+            self._paths = self._paths[drop:]
+
+    def store(self, deck_id, data, save_dir, filename):
+        """
+        Save image bytes unless the deck already has a near-duplicate.
+        Args:
+            deck_id (str): Deck the image is for, or None to skip the per-deck check
+            data (bytes): Encoded image
+            save_dir (str): Directory to save the image
+            filename (str): Name to save the image under
+        Returns:
+            str: Filename in save_dir, or None if the image was rejected as a duplicate
+        """
+        try:
+            image_hash = dhash(data)
+        except Exception as e:
+            # Unreadable images are saved as before, just not indexed
+            logging.warning(f"Could not hash image {filename}: {str(e)}")
+            image_hash = None
+
+        filepath = os.path.join(save_dir, filename)
+        with self._lock:
+            if image_hash is not None:
+                if self.is_duplicate(deck_id, image_hash):
+                    logging.info(f"Rejected near-duplicate image for deck {deck_id}: {filename}")
+                    return None
+                existing = self.find_stored(image_hash)
+            else:
+                existing = None
+
+            if existing and os.path.dirname(os.path.abspath(existing)) == os.path.abspath(save_dir):
+                filepath = existing
+            elif existing:
+                self._link_or_copy(existing, filepath)
+                logging.info(f"Reused stored image {existing} for {filename}")
+            else:
+                with open(filepath, 'wb') as f:
+                    f.write(data)
+
+            if image_hash is not None:
+                self.add(deck_id, image_hash, filepath)
+
+        return os.path.basename(filepath)
+
+    def register_file(self, deck_id, path):
+        """
+        Index an image that was already written to disk by someone else.
+        Returns False (and removes the file) if the deck already has a near-duplicate.
+        """
+        try:
+            with open(path, 'rb') as f:
+                image_hash = dhash(f.read())
+        except Exception as e:
+            logging.warning(f"Could not hash image {path}: {str(e)}")
+            return True
+
+        with self._lock:
+            if self.is_duplicate(deck_id, image_hash):
+                logging.info(f"Rejected near-duplicate image for deck {deck_id}: {path}")
+                os.remove(path)
+                return False
+            self.add(deck_id, image_hash, path)
+        return True
+
+    @staticmethod
+    def _link_or_copy(source, target):
+        if os.path.exists(target):
+            return
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
+
+    def release_deck(self, deck_id):
+        with self._lock:
+            self._decks.pop(deck_id, None)
+
+
+# Shared by every crawler in the process
+image_index = PerceptualHashIndex()
@@ -0,0 +1,114 @@
+import re
+import numpy as np
+
+STOPWORDS = frozenset("""
+a about above across after again against all almost also although always am among an and another any
+are around as at be became because become becomes been before being below between both but by can
+could did do does doing done down during each either enough etc even ever every few for from further
+get gets getting given gives go goes going had has have having he her here hers him his how however
+i if in including into is it its itself just least less like made make makes making many may me might
+more most much must my near need needs new no nor not now of off often on once one only onto or other
+others our ours out over own per rather same several she should since so some such than that the their
+them then there these they this those through thus to too toward towards under until up upon us use
+used uses using very via was we well were what when where whether which while who whom whose why will
+with within without would yet you your
+key important significant major better best greater increase increases increased increasing improve
+improves improved improving enable enables enabled enabling provide provides provided providing
+ensure ensures help helps create creates drive drives driving allow allows reduce reduces reducing
+introduction overview conclusion summary takeaways insights points section slide presentation example
+examples including various different specific potential future current today overall strategy
+grow grows grew grown fall falls fell rise rises rose convert converts generate generates lead leads
+led open opens double doubles smooth offer offers boost boosts cut cuts gain gains show shows shown
+become keep keeps support supports require requires achieve achieves deliver delivers transform
+transforms remain remains expect expected see seen take takes took
+""".split())
+
+# Words that rarely name something photographable when they start or end a phrase
+_WEAK_SUFFIXES = ('ly', 'ing', 'ed', 'ize', 'ise', 'ful')
+
+_TOKEN_RE = re.compile(r"[A-Za-z][A-Za-z\-']+")
+
+
+def _candidate_phrases(text, max_words=3):
+    """
+    Split text into noun-phrase-like candidates: runs of content words broken
+    at stopwords and punctuation, trimmed of weak leading/trailing words.
+    """
+    phrases = []
+    for chunk in re.split(r"[,.;:!?()\"–—]", text):
+        run = []
+        for token in _TOKEN_RE.findall(chunk) + [None]:
+            word = token.lower().strip("-'") if token else None
+            if word and word not in STOPWORDS and len(word) > 2:
+                run.append(word)
+                continue
+            while run and run[0].endswith(_WEAK_SUFFIXES):
+                run.pop(0)
+            while run and run[-1].endswith(_WEAK_SUFFIXES):
+                run.pop()
+            # Long runs yield their trailing sub-phrases, which carry the head noun
+            for size in range(min(max_words, len(run)), 0, -1):
+                phrases.append(' '.join(run[-size:]))
+            run = []
+    return phrases
+
+
+def extract_image_queries(sections, top_k=3, topic=None, title_weight=2.0):
+    """
+    Rank image search queries for every slide in one pass.
+    Args:
+        sections (list): Dicts with 'title' and 'points', one per slide
+        top_k (int): Queries to return per slide
+        topic (str): Optional deck topic, used as the last-resort query
+        title_weight (float): Extra weight for phrases that appear in a slide title
+    Returns:
+        list: One list of queries per slide, best first
+    """
+    slide_terms = []
+    vocabulary = {}
+    for section in sections:
+        terms = {}
+        for phrase in _candidate_phrases(section.get('title', '')):
+            terms[phrase] = terms.get(phrase, 0) + title_weight
+        for point in section.get('points', []):
+            for phrase in _candidate_phrases(point):
+                terms[phrase] = terms.get(phrase, 0) + 1
+        for phrase in terms:
+            vocabulary.setdefault(phrase, len(vocabulary))
+        slide_terms.append(terms)
+
+    if not vocabulary:
+        return [[topic] if topic else [] for _ in sections]
+
+    # Slides x terms count matrix, then TF-IDF over the deck's own slides
+    counts = np.zeros((len(sections), len(vocabulary)), dtype=np.float32)
+    for row, terms in enumerate(slide_terms):
+        columns = [vocabulary[p] for p in terms]
+        counts[row, columns] = list(terms.values())
+
+    tf = counts / np.maximum(counts.sum(axis=1, keepdims=True), 1)
+    df = (counts > 0).sum(axis=0)
+    idf = np.log((1 + len(sections)) / (1 + df)) + 1
+    # Multi-word phrases are more specific queries than their single words
+    lengths = np.array([p.count(' ') + 1 for p in vocabulary], dtype=np.float32)
+    scores = tf * idf * np.sqrt(lengths)
+
+    phrases = list(vocabulary)
+    queries = []
+    for row in range(len(sections)):
+        ranked, chosen_words = [], []
+        for column in np.argsort(-scores[row]):
+            if scores[row, column] <= 0 or len(ranked) == top_k:
+                break
+            phrase = phrases[column]
+            # Skip phrases already covered by a better-ranked one, comparing whole words
+            # so "tail" does not shadow "retail"
+            words = frozenset(phrase.split())
+            if any(words <= chosen or chosen <= words for chosen in chosen_words):
+                continue
+            ranked.append(phrase)
+            chosen_words.append(words)
+        if topic and len(ranked) < top_k:
+            ranked.append(topic)
+        queries.append(ranked)
+    return queries
@@ -4,17 +4,20 @@ import logging
 import re
 from urllib.parse import urljoin
 from crawlers.base_crawler import BaseCrawler
+from crawlers.image_index import image_index
+from crawlers.quota import QuotaExhausted, get_api_keys, quota_tracker
+from crawlers.search_cache import search_cache
+from services.metrics import span
 
 class PexelsCrawler(BaseCrawler):
     def __init__(self):
         super().__init__("pexels")
-        self.api_key = os.environ.get('PEXELS_API_KEY')
-        if not self.api_key:
+        self.api_keys = get_api_keys('PEXELS')
+        if not self.api_keys:
             raise ValueError("PEXELS_API_KEY environment variable is not set")
-        self.base_url = "https://api.pexels.com/v1/search"
-        self.headers = {
-            'Authorization': self.api_key
-        }
+        self.base_url = os.environ.get('PEXELS_API_URL', "https://api.pexels.com/v1/search")
+        self.page_size = int(os.environ.get('PEXELS_PAGE_SIZE', 30))
+        self.max_candidates = 5
 
     def _sanitize_filename(self, filename):
         """Sanitize filename to be safe for all operating systems"""
@@ -26,12 +29,41 @@ class PexelsCrawler(BaseCrawler):
         filename = filename.strip('_')
         return filename
 
-    def get_image(self, query, save_dir):
+    def _search(self, query):
+        """Fetch one large result page for a query"""
+        params = {
+            'query': query,
+            'per_page': self.page_size,  # One page serves every slide on this topic
+            'orientation': 'landscape'  # Better for presentations
+        }
+
+        # Rotate to a key with quota left instead of paying for a 429
+        api_key = quota_tracker.choose_key(self.browser, self.api_keys)
+        if not api_key:
+            raise QuotaExhausted("All Pexels API keys are out of quota")
+
+        with span('pexels.search'):
+            response = requests.get(
+                self.base_url,
+                headers={'Authorization': api_key},
+                params=params
+            )
+            quota_tracker.record(self.browser, api_key, response)
+            response.raise_for_status()
+        data = response.json()
+
+        return [
+            {'id': photo['id'], 'url': photo['src']['large']}
+            for photo in data.get('photos', [])
+        ]
+
+    def get_image(self, query, save_dir, deck_id=None):
         """
         Search and download an image from Pexels
         Args:
             query (str): Search term for the image
             save_dir (str): Directory to save the image
+            deck_id (str): Deck the image is for; images are not repeated within a deck
         Returns:
             str: Filename of the downloaded image or None if failed
         """
@@ -39,45 +71,38 @@ class PexelsCrawler(BaseCrawler):
             # Make sure save_dir exists
             os.makedirs(save_dir, exist_ok=True)
 
-            # Make API request
-            params = {
-                'query': query,
-                'per_page': 1,  # Get just one result
-                'orientation': 'landscape'  # Better for presentations
-            }
-            
-            response = requests.get(
-                self.base_url, 
-                headers=self.headers,
-                params=params
-            )
-            response.raise_for_status()
-            data = response.json()
-            
-            if not data.get('photos'):
-                logging.warning(f"No images found for query: {query}")
-                return None
-            
-            # Get the image URL (large size)
-            photo = data['photos'][0]
-            image_url = photo['src']['large']
-            
-            # Download the image
-            image_response = requests.get(image_url)
-            image_response.raise_for_status()
-            
-            # Create filename with photo ID for uniqueness
-            safe_query = self._sanitize_filename(query)
-            filename = f"pexels_{safe_query}_{photo['id']}.jpg"
-            filepath = os.path.join(save_dir, filename)
-            
-            # Save the image
-            with open(filepath, 'wb') as f:
-                f.write(image_response.content)
-            
-            logging.info(f"Successfully downloaded image: {filename}")
-            return filename
-            
+            # Skip candidates that look the same as an image already in this deck
+            for _ in range(self.max_candidates if deck_id is not None else 1):
+                if deck_id is None:
+                    candidates = search_cache.get_page(self.browser, query, self._search)
+                    photo = candidates[0] if candidates else None
+                else:
+                    photo = search_cache.next_candidate(deck_id, self.browser, query, self._search)
+
+                if not photo:
+                    break
+
+                # Download the image
+                with span('pexels.download'):
+                    image_response = requests.get(photo['url'])
+                    image_response.raise_for_status()
+
+                # Create filename with photo ID for uniqueness
+                safe_query = self._sanitize_filename(query)
+                filename = f"pexels_{safe_query}_{photo['id']}.jpg"
+
+                # Save the image
+                filename = image_index.store(deck_id, image_response.content, save_dir, filename)
+                if filename:
+                    logging.info(f"Successfully downloaded image: {filename}")
+                    return filename
+
+            logging.warning(f"No images found for query: {query}")
+            return None
+
+        except QuotaExhausted as e:
+            logging.warning(str(e))
+            return None
         except requests.RequestException as e:
             logging.error(f"Error making request to Pexels API: {str(e)}")
             return None
@@ -3,68 +3,97 @@ import requests
 import logging
 from urllib.parse import urljoin
 from crawlers.base_crawler import BaseCrawler
+from crawlers.image_index import image_index
+from crawlers.quota import QuotaExhausted, get_api_keys, quota_tracker
+from crawlers.search_cache import search_cache
+from services.metrics import span
 
 class PixabayCrawler(BaseCrawler):
     def __init__(self):
         super().__init__("pixabay")
-        self.api_key = os.environ.get('PIXABAY_API_KEY')
-        if not self.api_key:
+        self.api_keys = get_api_keys('PIXABAY')
+        if not self.api_keys:
             raise ValueError("PIXABAY_API_KEY environment variable is not set")
-        self.base_url = "https://pixabay.com/api/"
+        self.base_url = os.environ.get('PIXABAY_API_URL', "https://pixabay.com/api/")
+        self.page_size = int(os.environ.get('PIXABAY_PAGE_SIZE', 30))
+        self.max_candidates = 5
 
-    def get_image(self, query, save_dir):
+    def _search(self, query):
+        """Fetch one large result page for a query"""
+        # Rotate to a key with quota left instead of paying for a 429
+        api_key = quota_tracker.choose_key(self.browser, self.api_keys)
+        if not api_key:
+            raise QuotaExhausted("All Pixabay API keys are out of quota")
+
+        params = {
+            'key': api_key,
+            'q': query,
+            'image_type': 'photo',
+            'orientation': 'horizontal',
+            'per_page': self.page_size,  # One page serves every slide on this topic
+            'safesearch': True,
+        }
+
+        with span('pixabay.search'):
+            response = requests.get(self.base_url, params=params)
+            quota_tracker.record(self.browser, api_key, response)
+            response.raise_for_status()
+        data = response.json()
+
+        return [
+            {'id': hit['id'], 'url': hit['largeImageURL']}
+            for hit in data.get('hits', [])
+            if hit.get('largeImageURL')
+        ]
+
+    def get_image(self, query, save_dir, deck_id=None):
         """
         Search and download an image from Pixabay
         Args:
             query (str): Search term for the image
             save_dir (str): Directory to save the image
+            deck_id (str): Deck the image is for; images are not repeated within a deck
         Returns:
             str: Filename of the downloaded image or None if failed
         """
         try:
-            # Make API request
-            params = {
-                'key': self.api_key,
-                'q': query,
-                'image_type': 'photo',
-                'orientation': 'horizontal',
-                'per_page': 3,  # Get top 3 results to choose from
-                'safesearch': True,
-            }
-            
-            response = requests.get(self.base_url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            if not data.get('hits'):
-                logging.warning(f"No images found for query: {query}")
-                return None
-            
-            # Get the first image URL
-            image_url = data['hits'][0].get('largeImageURL')
-            if not image_url:
-                logging.warning(f"No large image URL found for query: {query}")
-                return None
-            
-            # Download the image
-            image_response = requests.get(image_url)
-            image_response.raise_for_status()
-            
-            # Create a unique filename
-            image_ext = image_url.split('.')[-1]
-            if image_ext not in ['jpg', 'jpeg', 'png']:
-                image_ext = 'jpg'
-            
-            filename = f"pixabay_{query.replace(' ', '_')}_{data['hits'][0]['id']}.{image_ext}"
-            filepath = os.path.join(save_dir, filename)
-            
-            # Save the image
-            with open(filepath, 'wb') as f:
-                f.write(image_response.content)
-            
-            logging.info(f"Successfully downloaded image: {filename}")
-            return filename
-            
+            # Skip candidates that look the same as an image already in this deck
+            for _ in range(self.max_candidates if deck_id is not None else 1):
+                if deck_id is None:
+                    candidates = search_cache.get_page(self.browser, query, self._search)
+                    hit = candidates[0] if candidates else None
+                else:
+                    hit = search_cache.next_candidate(deck_id, self.browser, query, self._search)
+
+                if not hit:
+                    break
+
+                image_url = hit['url']
+
+                # Download the image
+                with span('pixabay.download'):
+                    image_response = requests.get(image_url)
+                    image_response.raise_for_status()
+
+                # Create a unique filename
+                image_ext = image_url.split('.')[-1]
+                if image_ext not in ['jpg', 'jpeg', 'png']:
+                    image_ext = 'jpg'
+
+                filename = f"pixabay_{query.replace(' ', '_')}_{hit['id']}.{image_ext}"
+
+                # Save the image
+                filename = image_index.store(deck_id, image_response.content, save_dir, filename)
+                if filename:
+                    logging.info(f"Successfully downloaded image: {filename}")
+                    return filename
+
+            logging.warning(f"No images found for query: {query}")
+            return None
+
+        except QuotaExhausted as e:
+            logging.warning(str(e))
+            return None
         except requests.RequestException as e:
             logging.error(f"Error making request to Pixabay API: {str(e)}")
             return None
@@ -0,0 +1,153 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+
+
+class QuotaExhausted(Exception):
+    """Raised when every configured key for a provider is out of quota"""
+
+
+def get_api_keys(name):
+    """
+    Read API keys for a provider from the environment.
+    NAME_API_KEYS may hold several comma-separated keys; NAME_API_KEY is the single-key fallback.
+    """
+    keys = [k.strip() for k in os.environ.get(f'{name}_API_KEYS', '').split(',') if k.strip()]
+    if not keys and os.environ.get(f'{name}_API_KEY'):
+        keys = [os.environ[f'{name}_API_KEY']]
+    return keys
+
+
+class QuotaTracker:
+    """
+    Records remaining request quota per (provider, API key) from rate-limit
+    response headers. State lives in a small SQLite file so every worker
+    process on the host sees the same numbers.
+    """
+
+    def __init__(self, path=None, reserve=None):
+        self.path = path or os.environ.get(
+            'CRAWLER_QUOTA_DB', os.path.join(tempfile.gettempdir(), 'deckppt_quota.sqlite3')
+        )
+        # Stop using a key while this many requests are still left, before it starts returning 429s
+        self.reserve = reserve if reserve is not None else int(os.environ.get('CRAWLER_QUOTA_RESERVE', 5))
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS quota ('
+                ' provider TEXT NOT NULL,'
+                ' key_id TEXT NOT NULL,'
+                ' remaining INTEGER,'
+                ' reset_at REAL,'
+                ' last_used REAL NOT NULL DEFAULT 0,'
+                ' throttled INTEGER NOT NULL DEFAULT 0,'
+                ' PRIMARY KEY (provider, key_id))'
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def key_id(api_key):
+        """Keys are never stored; only a short fingerprint is"""
+        return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:12]
+
+    @staticmethod
+    def _parse_reset(value, now):
+        # Pexels sends a UNIX timestamp, Pixabay sends seconds until the window resets
+        reset = float(value)
+        return reset if reset > 1e9 else now + reset
+
+    def record(self, provider, api_key, response):
+        """Update quota state from a provider response"""
+        now = time.time()
+        headers = response.headers
+        remaining = headers.get('X-Ratelimit-Remaining')
+        reset = headers.get('X-Ratelimit-Reset')
+        throttled = 0
+
+        try:
+            remaining = int(remaining) if remaining is not None else None
+            reset_at = self._parse_reset(reset, now) if reset is not None else None
+        except ValueError:
+            remaining, reset_at = None, None
+
+        if response.status_code == 429:
+            throttled = 1
+            remaining = 0
+            retry_after = headers.get('Retry-After')
+            if reset_at is None:
+                reset_at = now + (float(retry_after) if retry_after and retry_after.isdigit() else 60)
+            logging.warning(f"[{provider}] Key {self.key_id(api_key)} rate limited until {reset_at:.0f}")
+
+        self._connect().execute(
+            'INSERT INTO quota (provider, key_id, remaining, reset_at, last_used, throttled)'
+            ' VALUES (?, ?, ?, ?, ?, ?)'
+            ' ON CONFLICT (provider, key_id) DO UPDATE SET'
+            ' remaining = COALESCE(excluded.remaining, remaining),'
+            ' reset_at = COALESCE(excluded.reset_at, reset_at),'
+            ' last_used = excluded.last_used,'
+            ' throttled = excluded.throttled',
+            (provider, self.key_id(api_key), remaining, reset_at, now, throttled)
+        )
+
+    def choose_key(self, provider, api_keys):
+        """
+        Pick the key with the most quota left, rotating between equals.
+        Returns None when every key is exhausted until its window resets.
+        """
+        if not api_keys:
+            return None
+        now = time.time()
+        rows = {
+            row[0]: row[1:]
+            for row in self._connect().execute(
+                'SELECT key_id, remaining, reset_at, last_used FROM quota WHERE provider = ?', (provider,)
+            )
+        }
+
+        best, best_rank = None, None
+        for api_key in api_keys:
+            remaining, reset_at, last_used = rows.get(self.key_id(api_key), (None, None, 0))
+            window_over = reset_at is not None and reset_at <= now
+            if remaining is not None and remaining <= self.reserve and not window_over:
+                continue
+            # Unknown or reset quota ranks as plentiful; ties go to the least recently used key
+            left = float('inf') if remaining is None or window_over else remaining
+            rank = (-left, last_used)
+            if best_rank is None or rank < best_rank:
+                best, best_rank = api_key, rank
+        return best
+
+    def is_available(self, provider, api_keys):
+        return self.choose_key(provider, api_keys) is not None
+
+    def snapshot(self):
+        """Current quota state for dashboards"""
+        now = time.time()
+        return [
+            {
+                'provider': provider,
+                'key_id': key_id,
+                'remaining': remaining,
+                'resets_in': max(0, round(reset_at - now)) if reset_at else None,
+                'throttled': bool(throttled),
+                'last_used': last_used,
+            }
+            for provider, key_id, remaining, reset_at, last_used, throttled in self._connect().execute(
+                'SELECT provider, key_id, remaining, reset_at, last_used, throttled'
+                ' FROM quota ORDER BY provider, key_id'
+            )
+        ]
+
+
+# Shared by every crawler in the process
+quota_tracker = QuotaTracker()
@@ -0,0 +1,103 @@
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+
+def normalize_query(query):
+    """Reduce a query to a canonical key so related slide queries share a page"""
+    tokens = re.findall(r'\w+', (query or '').lower())
+    return ' '.join(sorted(set(tokens)))
+
+
+class SearchResultCache:
+    """
+    Caches one large search result page per (provider, query) and hands out
+    distinct candidates to each deck through a per-deck cursor. Deck state
+    is dropped by release_deck(), and at the latest once max_decks newer
+    decks have been seen or it has been idle for deck_ttl seconds.
+    """
+
+    def __init__(self, ttl=3600, max_pages=256, max_decks=1024, deck_ttl=3600):
+        self.ttl = ttl
+        self.max_pages = max_pages
+        self.max_decks = max_decks
+        self.deck_ttl = deck_ttl
+        self._pages = OrderedDict()  # (provider, key) -> (fetched_at, candidates)
+        # deck_id -> {'touched': time, 'used': {(provider, candidate id)}, 'cursors': {(provider, key): next index}}
+        self._decks = OrderedDict()
+        self._lock = threading.Lock()
+        self.searches = 0
+        self.hits = 0
+
+    def _get_page(self, provider, key):
+        entry = self._pages.get((provider, key))
+        if entry and time.time() - entry[0] < self.ttl:
+            self._pages.move_to_end((provider, key))
+            return entry[1]
+        return None
+
+    def _deck(self, deck_id):
+        """Per-deck state, least recently used first; call with the lock held"""
+        now = time.time()
+        deck = self._decks.get(deck_id)
+        if deck is None:
+            deck = self._decks[deck_id] = {'used': set(), 'cursors': {}}
+        self._decks.move_to_end(deck_id)
+        deck['touched'] = now
+        while len(self._decks) > self.max_decks or now - next(iter(self._decks.values()))['touched'] > self.deck_ttl:
+            self._decks.popitem(last=False)
+        return deck
+
+    def get_page(self, provider, query, fetch):
+        """
+        Return the cached candidate list for a query, calling fetch(query) once
+        to populate it. Candidates are dicts with at least 'id' and 'url'.
+        """
+        key = normalize_query(query)
+        with self._lock:
+            page = self._get_page(provider, key)
+            if page is not None:
+                self.hits += 1
+                return page
+
+        # Fetch outside the lock so slow searches don't block other decks
+        candidates = fetch(query) or []
+        with self._lock:
+            self.searches += 1
+            self._pages[(provider, key)] = (time.time(), candidates)
+            self._pages.move_to_end((provider, key))
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+        logging.info(f"[{provider}] Cached {len(candidates)} results for query: {query}")
+        return candidates
+
+    def next_candidate(self, deck_id, provider, query, fetch):
+        """
+        Return the next candidate for this deck that it has not used yet, or
+        None once the cached page is exhausted.
+        """
+        candidates = self.get_page(provider, query, fetch)
+        key = normalize_query(query)
+        with self._lock:
+            deck = self._deck(deck_id)
+            cursor = deck['cursors'].get((provider, key), 0)
+            while cursor < len(candidates):
+                candidate = candidates[cursor]
+                cursor += 1
+                if (provider, candidate['id']) not in deck['used']:
+                    deck['used'].add((provider, candidate['id']))
+                    deck['cursors'][(provider, key)] = cursor
+                    return candidate
+            deck['cursors'][(provider, key)] = cursor
+        return None
+
+    def release_deck(self, deck_id):
+        """Forget cursors for a finished deck; cached pages are kept for reuse"""
+        with self._lock:
+            self._decks.pop(deck_id, None)
+
+
+# Shared by every crawler in the process
+search_cache = SearchResultCache()
@@ -0,0 +1,138 @@
+"""
+Shared plumbing for the local upstream fakes: routing, JSON responses and a
+latency / error profile applied to every request.
+"""
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FaultProfile:
+    """
+    Latency and failure injection: every response waits latency +/- jitter
+    seconds, error_rate of requests get a 500 and every rate_limit_every-th
+    request gets a 429.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit_every=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_every = rate_limit_every
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def apply(self):
+        """Sleep for this request; returns (status, message) to fail with, or None"""
+        with self._lock:
+            self.requests += 1
+            count = self.requests
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if self.rate_limit_every and count % self.rate_limit_every == 0:
+            return 429, 'Rate limited by fake upstream'
+        if self.error_rate and random.random() < self.error_rate:
+            return 500, 'Injected failure'
+        return None
+
+    @classmethod
+    def add_arguments(cls, parser):
+        parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+        parser.add_argument('--jitter', type=float, default=0.0, help='uniform +/- spread on --latency')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 500')
+        parser.add_argument('--rate-limit-every', type=int, default=0, help='answer every Nth request with 429')
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(args.latency, args.jitter, args.error_rate, args.rate_limit_every)
+
+
+class FakeUpstream:
+    """Base for a fake HTTP API; subclasses register handlers with route()"""
+
+    name = 'upstream'
+
+    def __init__(self, profile=None):
+        self.profile = profile or FaultProfile()
+        self.routes = []  # (method, compiled pattern, handler)
+        self.server = None
+
+    def route(self, method, pattern, handler):
+        self.routes.append((method, re.compile(pattern + '$'), handler))
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _dispatch(self, request, method):
+        path = request.path.split('?', 1)[0]
+        for route_method, pattern, handler in self.routes:
+            match = pattern.match(path)
+            if route_method == method and match:
+                # Always drain the body so keep-alive connections stay in sync
+                length = int(request.headers.get('Content-Length') or 0)
+                body = json.loads(request.rfile.read(length) or b'{}') if length else {}
+                failure = self.profile.apply()
+                if failure:
+                    return request.send_json(failure[0], {'error': {'message': failure[1]}})
+                return handler(request, body, **match.groupdict())
+        request.send_json(404, {'error': {'message': f'No fake route for {method} {path}'}})
+
+    def handler(self):
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status, body):
+                self.send_bytes(status, json.dumps(body).encode(), 'application/json')
+
+            def send_bytes(self, status, payload, content_type):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                upstream._dispatch(self, 'GET')
+
+            def do_POST(self):
+                upstream._dispatch(self, 'POST')
+
+        return Handler
+
+    def serve(self, host='127.0.0.1', port=0):
+        """Start serving on a background thread and return self"""
+        self.server = ThreadingHTTPServer((host, port), self.handler())
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name=f'fake-{self.name}', daemon=True).start()
+        return self
+
+    def shutdown(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    @classmethod
+    def main(cls, default_port):
+        """Command-line entry point shared by every fake"""
+        parser = argparse.ArgumentParser(description=cls.__doc__)
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=default_port)
+        FaultProfile.add_arguments(parser)
+        args = parser.parse_args()
+
+        fake = cls(FaultProfile.from_args(args))
+        fake.server = ThreadingHTTPServer((args.host, args.port), fake.handler())
+        print(f"Fake {cls.name} listening on {fake.base_url}", flush=True)
+        fake.server.serve_forever()
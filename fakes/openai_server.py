@@ -0,0 +1,87 @@
+"""
+Local stand-in for the OpenAI chat completions and image generation APIs.
+
+    python -m fakes.openai_server --port 8766 --latency 1.5 --jitter 0.5
+    OPENAI_BASE_URL=http://127.0.0.1:8766/v1 OPENAI_API_KEY=sk-fake python app.py
+"""
+import re
+import json
+import time
+import uuid
+import base64
+from io import BytesIO
+from PIL import Image
+from fakes.base import FakeUpstream
+
+SENTENCE = ("Deploy measurable improvements across teams to lift retention by 20% "
+            "through focused experiments and clear ownership of outcomes.")
+
+
+def _outline(num_sections):
+    """The JSON outline slides_generator asks for"""
+    return json.dumps({'sections': [
+        {'title': f'Section {i + 1}', 'points': [f'{SENTENCE} ({i + 1}.{j + 1})' for j in range(5)]}
+        for i in range(num_sections)
+    ]})
+
+
+def _paragraphs(count):
+    """Blank-line separated insights, as generate_ppt asks for"""
+    return '\n\n'.join(f'{SENTENCE} ({i + 1})' for i in range(count))
+
+
+def reply_for(prompt):
+    """A plausible completion in whichever format the prompt asks for"""
+    sections = re.search(r'with (\d+) sections|\((\d+) sections\)', prompt)
+    if 'JSON' in prompt and sections:
+        return _outline(int(sections.group(1) or sections.group(2)))
+    insights = re.search(r'Create (\d+) distinct', prompt)
+    return _paragraphs(int(insights.group(1)) if insights else 3)
+
+
+class FakeOpenAI(FakeUpstream):
+    """Fake OpenAI API: /v1/chat/completions and /v1/images/generations"""
+
+    name = 'openai'
+
+    def __init__(self, profile=None):
+        super().__init__(profile)
+        self.route('POST', r'/v1/chat/completions', self.chat)
+        self.route('POST', r'/v1/images/generations', self.images)
+
+    def chat(self, request, body):
+        prompt = '\n'.join(m.get('content', '') for m in body.get('messages', []))
+        content, finish_reason = reply_for(prompt), 'stop'
+        # Cut replies off at max_tokens (about 4 characters each) like the real API
+        max_tokens = body.get('max_tokens')
+        if max_tokens and len(content) > max_tokens * 4:
+            content, finish_reason = content[:max_tokens * 4], 'length'
+        prompt_tokens, completion_tokens = len(prompt) // 4, len(content) // 4
+        request.send_json(200, {
+            'id': f'chatcmpl-{uuid.uuid4().hex}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'gpt-3.5-turbo'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': finish_reason
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens
+            }
+        })
+
+    def images(self, request, body):
+        width, height = (int(v) for v in body.get('size', '256x256').split('x'))
+        buffer = BytesIO()
+        Image.effect_noise((width, height), 64).convert('RGB').save(buffer, 'PNG')
+        data = base64.b64encode(buffer.getvalue()).decode()
+        items = [{'b64_json': data} for _ in range(body.get('n', 1))]
+        request.send_json(200, {'created': int(time.time()), 'data': items})
+
+
+if __name__ == '__main__':
+    FakeOpenAI.main(8766)
@@ -0,0 +1,117 @@
+"""
+Local stand-in for the Paystack transaction API, for offline testing.
+
+    python -m fakes.paystack_server --port 8765 --status ref_abc=failed
+    PAYSTACK_BASE_URL=http://127.0.0.1:8765 PAYSTACK_SECRET_KEY=sk_test flask reconcile-payments
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakePaystack:
+    """Configurable transaction outcomes, latency and failure injection"""
+
+    def __init__(self, default_status='success', statuses=None, latency=0.0, error_rate=0.0, rate_limit_every=0,
+                 amounts=None):
+        self.default_status = default_status
+        self.statuses = dict(statuses or {})
+        self.amounts = dict(amounts or {})  # reference -> pesewas reported as paid
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_every = rate_limit_every
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _inject_faults(self):
+                with fake._lock:
+                    fake.requests += 1
+                    count = fake.requests
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if fake.rate_limit_every and count % fake.rate_limit_every == 0:
+                    self._send(429, {'status': False, 'message': 'Too many requests'})
+                    return True
+                if random.random() < fake.error_rate:
+                    self._send(500, {'status': False, 'message': 'Injected failure'})
+                    return True
+                return False
+
+            def do_GET(self):
+                if self._inject_faults():
+                    return
+                if not self.path.startswith('/transaction/verify/'):
+                    return self._send(404, {'status': False, 'message': 'Not found'})
+                reference = self.path.rsplit('/', 1)[-1]
+                status = fake.statuses.get(reference, fake.default_status)
+                if status == 'missing':
+                    return self._send(404, {'status': False, 'message': 'Transaction reference not found'})
+                data = {'reference': reference, 'status': status}
+                if reference in fake.amounts:
+                    data['amount'] = fake.amounts[reference]
+                self._send(200, {'status': True, 'data': data})
+
+            def do_POST(self):
+                if self._inject_faults():
+                    return
+                if self.path != '/transaction/initialize':
+                    return self._send(404, {'status': False, 'message': 'Not found'})
+                reference = f"fake_{random.getrandbits(48):012x}"
+                self._send(200, {'status': True, 'data': {
+                    'reference': reference,
+                    'authorization_url': f'http://{self.headers.get("Host")}/checkout/{reference}'
+                }})
+
+        return Handler
+
+    def serve(self, host='127.0.0.1', port=0):
+        """Start serving on a background thread; returns the server (server.server_port has the port)"""
+        server = ThreadingHTTPServer((host, port), self.handler())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--default-status', default='success',
+                        help="status for unknown references (success, failed, abandoned, ongoing, missing)")
+    parser.add_argument('--status', action='append', default=[], metavar='REF=STATUS')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 500')
+    parser.add_argument('--rate-limit-every', type=int, default=0, help='answer every Nth request with 429')
+    args = parser.parse_args()
+
+    fake = FakePaystack(
+        default_status=args.default_status,
+        statuses=dict(s.split('=', 1) for s in args.status),
+        latency=args.latency,
+        error_rate=args.error_rate,
+        rate_limit_every=args.rate_limit_every
+    )
+    server = ThreadingHTTPServer((args.host, args.port), fake.handler())
+    print(f"Fake Paystack listening on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
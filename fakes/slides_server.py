@@ -0,0 +1,39 @@
+"""
+Local stand-in for the Google Slides presentations.create and batchUpdate calls.
+
+    python -m fakes.slides_server --port 8767 --latency 0.8
+    SLIDES_API_ROOT=http://127.0.0.1:8767/ python app.py
+"""
+import time
+import uuid
+from fakes.base import FakeUpstream
+
+
+class FakeSlides(FakeUpstream):
+    """Fake Slides API: create and batchUpdate, with a per-request cost on batchUpdate"""
+
+    name = 'slides'
+
+    def __init__(self, profile=None, per_request_latency=0.0):
+        super().__init__(profile)
+        self.per_request_latency = per_request_latency
+        self.presentations = {}
+        self.route('POST', r'/v1/presentations', self.create)
+        self.route('POST', r'/v1/presentations/(?P<presentation_id>[^/:]+):batchUpdate', self.batch_update)
+
+    def create(self, request, body):
+        presentation_id = uuid.uuid4().hex
+        self.presentations[presentation_id] = body.get('title')
+        request.send_json(200, {'presentationId': presentation_id, 'title': body.get('title'), 'slides': []})
+
+    def batch_update(self, request, body, presentation_id):
+        if presentation_id not in self.presentations:
+            return request.send_json(404, {'error': {'code': 404, 'message': 'Requested entity was not found.'}})
+        updates = body.get('requests', [])
+        if self.per_request_latency:
+            time.sleep(self.per_request_latency * len(updates))
+        request.send_json(200, {'presentationId': presentation_id, 'replies': [{} for _ in updates]})
+
+
+if __name__ == '__main__':
+    FakeSlides.main(8767)
@@ -0,0 +1,58 @@
+"""
+Local stand-in for the Pexels and Pixabay search APIs and their image CDNs.
+
+    python -m fakes.stock_photos_server --port 8768 --latency 0.3
+    PEXELS_API_URL=http://127.0.0.1:8768/v1/search PIXABAY_API_URL=http://127.0.0.1:8768/api/ ...
+"""
+import zlib
+import threading
+from io import BytesIO
+from PIL import Image
+from fakes.base import FakeUpstream
+
+
+class FakeStockPhotos(FakeUpstream):
+    """Fake Pexels (/v1/search) and Pixabay (/api/) search plus image downloads"""
+
+    name = 'stock-photos'
+
+    def __init__(self, profile=None, page_size=30, image_size=(640, 360)):
+        super().__init__(profile)
+        self.page_size = page_size
+        self.image_size = image_size
+        self._images = {}
+        self._lock = threading.Lock()
+        self.route('GET', r'/v1/search', self.pexels_search)
+        self.route('GET', r'/api/', self.pixabay_search)
+        self.route('GET', r'/images/(?P<image_id>\d+)\.jpg', self.image)
+
+    def _ids(self, request):
+        """Stable per-query photo ids, so repeated searches return the same page"""
+        seed = zlib.crc32(request.path.encode()) % 10_000_000
+        return [seed * 100 + i for i in range(self.page_size)]
+
+    def pexels_search(self, request, body):
+        request.send_json(200, {'photos': [
+            {'id': i, 'src': {'large': f'{self.base_url}/images/{i}.jpg'}} for i in self._ids(request)
+        ]})
+
+    def pixabay_search(self, request, body):
+        request.send_json(200, {'hits': [
+            {'id': i, 'largeImageURL': f'{self.base_url}/images/{i}.jpg'} for i in self._ids(request)
+        ], 'total': self.page_size})
+
+    def image(self, request, body, image_id):
+        # Noise images so the perceptual duplicate filter sees distinct pictures
+        with self._lock:
+            data = self._images.get(image_id)
+        if data is None:
+            buffer = BytesIO()
+            Image.effect_noise(self.image_size, 80).convert('RGB').save(buffer, 'JPEG', quality=70)
+            data = buffer.getvalue()
+            with self._lock:
+                self._images[image_id] = data
+        request.send_bytes(200, data, 'image/jpeg')
+
+
+if __name__ == '__main__':
+    FakeStockPhotos.main(8768)
@@ -8,11 +8,26 @@ from pptx.enum.dml import MSO_LINE, MSO_THEME_COLOR
 from pptx.dml.color import RGBColor
 from pptx.enum.text import PP_ALIGN
 from apis.openai_api import OpenAIClient
+from services.metrics import span
+from services.token_budget import TokenBudget
+from services.cancellation import GenerationCancelled, raise_if_cancelled
 import re
+import uuid
 import tempfile
 from io import BytesIO
 from datetime import datetime
 
+# Steps reported to a progress callback: title, overview, insights, content slides, save
+PROGRESS_STEPS = 5
+
+
+def _step(step, message, progress=None, cancel_event=None):
+    """Report progress and stop before the next LLM call or save if cancelled"""
+    raise_if_cancelled(cancel_event, message)
+    if progress is not None:
+        progress(step, PROGRESS_STEPS, message)
+
+
 class ColorPalette:
     """Modern color palettes for professional presentations."""
     MINIMALIST_BLUE = {
@@ -65,17 +80,18 @@ class ColorPalette:
         "accent": RGBColor(230, 250, 247)      # Light Teal
     }
     
+    PALETTES = {
+        "minimalist_blue": MINIMALIST_BLUE,
+        "soft_gray": SOFT_GRAY,
+        "fresh_green": FRESH_GREEN,
+        "elegant_purple": ELEGANT_PURPLE,
+        "professional_teal": PROFESSIONAL_TEAL
+    }
+
     @classmethod
     def get_palette(cls, theme="minimalist_blue"):
         """Get color palette by theme name."""
-        palettes = {
-            "minimalist_blue": cls.MINIMALIST_BLUE,
-            "soft_gray": cls.SOFT_GRAY,
-            "fresh_green": cls.FRESH_GREEN,
-            "elegant_purple": cls.ELEGANT_PURPLE,
-            "professional_teal": cls.PROFESSIONAL_TEAL
-        }
-        return palettes.get(theme, cls.MINIMALIST_BLUE)
+        return cls.PALETTES.get(theme, cls.MINIMALIST_BLUE)
 
 def create_shaped_textbox(slide, left, top, width, height, text, palette, 
                          is_title=False, shape_type=MSO_SHAPE.ROUNDED_RECTANGLE):
@@ -353,7 +369,7 @@ def create_title_slide(ppt, title, palette):
     
     return slide
 
-def generate_intro_slide(ppt, title, palette):
+def generate_intro_slide(ppt, title, palette, model="gpt-3.5-turbo"):
     """Generate a modern introduction slide."""
     layout = ppt.slide_layouts[6]  # Blank layout
     slide = ppt.slides.add_slide(layout)
@@ -383,7 +399,7 @@ def generate_intro_slide(ppt, title, palette):
     if not api_key:
         raise ValueError("OPENAI_API_KEY environment variable is not set")
         
-    client = OpenAIClient(api_key)
+    client = OpenAIClient(api_key, model)
     prompt = f"""Write a compelling 2-3 sentence introduction for {title}.
     Requirements:
     1. Start with a powerful market insight or trend
@@ -396,7 +412,9 @@ def generate_intro_slide(ppt, title, palette):
     'The renewable energy sector is experiencing unprecedented growth, with global investments exceeding $500B in 2024. Advanced technologies and favorable policies are accelerating adoption, creating new opportunities for businesses to lead in sustainability while reducing operational costs.'"""
     
     try:
-        overview_text = client.generate(prompt).strip()
+        budget = TokenBudget(client.model)
+        overview_text = client.generate(prompt, template='generate_intro_slide',
+                                        max_tokens=budget.completion_tokens(budget.words(OVERVIEW_WORDS))).strip()
     except Exception as e:
         logging.error(f"Error generating overview: {e}")
         overview_text = f"The {title.lower()} landscape is rapidly evolving, presenting unprecedented opportunities for innovation and growth. Organizations that embrace these changes and implement strategic solutions will gain significant competitive advantages in the coming years."
@@ -419,8 +437,15 @@ def apply_theme_color(paragraph, color):
     """Apply theme color to paragraph text."""
     paragraph.font.color.rgb = color
 
-def create_presentation(topic, num_slides=5, theme="minimalist_blue"):
-    """Create a modern, professional presentation."""
+@span('ppt.build')
+def create_presentation(topic, num_slides=5, theme="minimalist_blue", progress=None, cancel_event=None,
+                        model="gpt-3.5-turbo"):
+    """
+    Create a modern, professional presentation. progress(step, total, message)
+    is called as each step starts; setting cancel_event skips the remaining
+    LLM calls and raises GenerationCancelled. model is the OpenAI chat model
+    used for every text completion.
+    """
     ppt = Presentation()
     palette = ColorPalette.get_palette(theme)
     
@@ -429,15 +454,19 @@ def create_presentation(topic, num_slides=5, theme="minimalist_blue"):
     ppt.slide_height = Inches(7.5)
     
     # Title slide
+    _step(0, "Creating title slide", progress, cancel_event)
     create_title_slide(ppt, topic, palette)
     
     # Overview slide
-    generate_intro_slide(ppt, topic, palette)
+    _step(1, "Writing overview", progress, cancel_event)
+    generate_intro_slide(ppt, topic, palette, model)
     
     # Generate insights
-    insights = generate_content_sections(topic, (num_slides - 2) * 3)  # -2 for title and overview
+    _step(2, "Writing insights", progress, cancel_event)
+    insights = generate_content_sections(topic, (num_slides - 2) * 3, cancel_event, model)  # -2 for title and overview
     
     # Create content slides (one slide per 3 insights)
+    _step(3, "Building content slides", progress, cancel_event)
     for i in range(0, len(insights), 3):
         slide_insights = insights[i:i+3]
         if slide_insights:
@@ -452,7 +481,9 @@ def create_presentation(topic, num_slides=5, theme="minimalist_blue"):
     current_slides = len(ppt.slides)
     if current_slides < num_slides:
         # Generate additional insights if needed
-        additional_insights = generate_content_sections(topic, (num_slides - current_slides) * 3)
+        _step(3, "Writing additional insights", progress, cancel_event)
+        additional_insights = generate_content_sections(topic, (num_slides - current_slides) * 3, cancel_event,
+                                                        model)
         
         # Create remaining slides
         for i in range(0, len(additional_insights), 3):
@@ -468,15 +499,23 @@ def create_presentation(topic, num_slides=5, theme="minimalist_blue"):
     
     return ppt
 
-def generate_content_sections(topic, num_sections):
-    """Generate unique content sections without numbering."""
-    api_key = os.environ.get('OPENAI_API_KEY')
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY environment variable is not set")
-        
-    client = OpenAIClient(api_key)
+# Words per insight the prompt asks for (30-40) and per overview (40-60), for sizing max_tokens
+INSIGHT_WORDS = 40
+OVERVIEW_WORDS = 60
+
+
+def insights_prompt(topic, num_sections, include_examples=True, part=None):
+    """Prompt for num_sections insights; part=(index, parts) when the deck is split across calls"""
+    examples = ("""
+    
+    Example insights:
+    "Implement AI-powered customer analytics to increase retention by 25% through personalized engagement strategies and predictive behavior modeling."
     
-    prompt = f"""Create {num_sections} distinct insights about {topic} for a modern business presentation.
+    "Deploy blockchain-based supply chain tracking to reduce operational costs by 40% while ensuring end-to-end transparency and compliance."
+""".rstrip()) if include_examples else ""
+    focus = (f"\n    7. This is part {part[0] + 1} of {part[1]}: cover aspects other parts are unlikely to repeat"
+             if part else "")
+    return f"""Create {num_sections} distinct insights about {topic} for a modern business presentation.
     Each insight should be a complete thought that fits in a small text block (30-40 words).
     
     Requirements:
@@ -485,44 +524,66 @@ def generate_content_sections(topic, num_sections):
     3. Start with action verbs
     4. Be forward-looking and actionable
     5. No bullet points or lists
-    6. Each insight must be unique (no repetition)
-    
-    Example insights:
-    "Implement AI-powered customer analytics to increase retention by 25% through personalized engagement strategies and predictive behavior modeling."
-    
-    "Deploy blockchain-based supply chain tracking to reduce operational costs by 40% while ensuring end-to-end transparency and compliance."
+    6. Each insight must be unique (no repetition){focus}{examples}
     
     Format: Return each insight as a separate paragraph."""
+
+
+def generate_content_sections(topic, num_sections, cancel_event=None, model="gpt-3.5-turbo"):
+    """Generate unique content sections without numbering; cancel_event is checked before every call."""
+    api_key = os.environ.get('OPENAI_API_KEY')
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY environment variable is not set")
+        
+    client = OpenAIClient(api_key, model)
+    budget = TokenBudget(client.model)
+    plan = budget.plan(num_sections, budget.words(INSIGHT_WORDS) + 2,
+                       lambda count, include_examples: insights_prompt(topic, count, include_examples))
     
+    insights = []
     try:
-        response = client.generate(prompt)
-        insights = [insight.strip() for insight in response.strip().split("\n\n")
-                   if insight.strip()][:num_sections]
+        for index, call in enumerate(plan):
+            raise_if_cancelled(cancel_event, f"Writing insights ({index + 1}/{len(plan)})")
+            prompt = insights_prompt(topic, call.count, call.include_examples,
+                                     (index, len(plan)) if len(plan) > 1 else None)
+            response = client.generate(prompt, template='generate_content_sections', max_tokens=call.max_tokens)
+            insights.extend([insight.strip() for insight in response.strip().split("\n\n")
+                             if insight.strip()][:call.count])
         
         return insights
+    except GenerationCancelled:
+        raise
     except Exception as e:
+        # Keep whatever earlier calls produced; create_presentation tops up short decks
         logging.error(f"Error generating insights: {e}")
-        return []
+        return insights
 
-def generate_ppt(topic, num_slides=5, theme="minimalist_blue"):
-    """Generate a professional presentation."""
+@span('ppt.generate')
+def generate_ppt(topic, num_slides=5, theme="minimalist_blue", progress=None, cancel_event=None,
+                 model="gpt-3.5-turbo"):
+    """Generate a professional presentation; see create_presentation for progress and cancel_event."""
     # Clean the topic for file naming
     clean_topic = re.sub(r'[^\w\s-]', '', topic.replace('/', '_'))
     
     try:
         # Create presentation with modern design
-        ppt = create_presentation(topic, num_slides, theme)
+        ppt = create_presentation(topic, num_slides, theme, progress, cancel_event, model)
         
-        # Save to a temporary file with a secure name
+        # Save to a temporary file with a secure name; decks generated side by side never share one
+        _step(4, "Saving presentation", progress, cancel_event)
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        temp_filename = f"{clean_topic}_{timestamp}.pptx"
+        temp_filename = f"{clean_topic}_{timestamp}_{uuid.uuid4().hex[:6]}.pptx"
         temp_path = os.path.join(tempfile.gettempdir(), temp_filename)
         
-        ppt.save(temp_path)
+        with span('ppt.save'):
+            ppt.save(temp_path)
         logging.info(f"Presentation saved to {temp_path}")
         
         return temp_path
         
+    except GenerationCancelled:
+        logging.info(f"Generation of '{topic}' cancelled")
+        raise
     except Exception as e:
         logging.error(f"Error generating presentation: {e}")
         raise
@@ -0,0 +1,3 @@
+-- Dashboard listing: WHERE user_id = ? AND status = ? ORDER BY created_at DESC, id DESC
+CREATE INDEX IF NOT EXISTS ix_presentation_user_status_created
+    ON presentation (user_id, status, created_at, id);
@@ -0,0 +1,7 @@
+-- Counter maintained by services/usage.py so plan checks need no COUNT(*)
+ALTER TABLE "user" ADD COLUMN active_presentations_count INTEGER NOT NULL DEFAULT 0;
+
+UPDATE "user" SET active_presentations_count = (
+    SELECT COUNT(*) FROM presentation
+    WHERE presentation.user_id = "user".id AND presentation.status = 'active'
+);
@@ -0,0 +1,10 @@
+-- Expiry sweeper: WHERE status = 'active' AND expires_at < now ORDER BY expires_at
+CREATE INDEX IF NOT EXISTS ix_presentation_status_expires
+    ON presentation (status, expires_at);
+
+-- Leases let exactly one worker run a background job at a time
+CREATE TABLE IF NOT EXISTS job_lease (
+    name VARCHAR(64) PRIMARY KEY,
+    holder VARCHAR(128) NOT NULL,
+    expires_at TIMESTAMP NOT NULL
+);
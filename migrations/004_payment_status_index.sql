@@ -0,0 +1,3 @@
+-- Reconciliation: WHERE status = 'pending' AND created_at < ? ORDER BY id
+CREATE INDEX IF NOT EXISTS ix_payment_status_created
+    ON payment (status, created_at, id);
@@ -0,0 +1,35 @@
+-- Append-only log of chat completion calls, read by created_at in the rollup job
+-- Postgres uses 005_llm_usage.postgresql.sql with SERIAL ids. INTEGER PRIMARY KEY is the rowid on SQLite
+CREATE TABLE IF NOT EXISTS llm_usage (
+    id INTEGER PRIMARY KEY,
+    created_at TIMESTAMP NOT NULL,
+    user_id VARCHAR(128),
+    plan VARCHAR(32),
+    template VARCHAR(64) NOT NULL,
+    model VARCHAR(64) NOT NULL,
+    max_tokens INTEGER,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    cost_usd FLOAT NOT NULL DEFAULT 0,
+    latency_ms FLOAT NOT NULL,
+    error VARCHAR(64)
+);
+
+CREATE INDEX IF NOT EXISTS ix_llm_usage_created ON llm_usage (created_at);
+
+-- Hourly aggregates per template, model and max_tokens
+CREATE TABLE IF NOT EXISTS llm_usage_rollup (
+    id INTEGER PRIMARY KEY,
+    hour TIMESTAMP NOT NULL,
+    template VARCHAR(64) NOT NULL,
+    model VARCHAR(64) NOT NULL,
+    max_tokens INTEGER,
+    calls INTEGER NOT NULL,
+    errors INTEGER NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    cost_usd FLOAT NOT NULL,
+    latency_ms_sum FLOAT NOT NULL,
+    latency_histogram TEXT NOT NULL,
+    CONSTRAINT uq_llm_usage_rollup_key UNIQUE (hour, template, model, max_tokens)
+);
@@ -0,0 +1,6 @@
+-- Reconciliation scans WHERE status = 'pending' AND created_at < ? AND id > ? ORDER BY id;
+-- (status, id) serves that order directly, created_at is only a filter
+DROP INDEX IF EXISTS ix_payment_status_created;
+
+CREATE INDEX IF NOT EXISTS ix_payment_status_id
+    ON payment (status, id);
@@ -0,0 +1,55 @@
+-- SQLite databases migrated with the first 005_llm_usage.sql got "id SERIAL PRIMARY KEY",
+-- which is not a rowid alias there, so every id is NULL. Rebuild both tables with
+-- INTEGER PRIMARY KEY. Other databases have nothing to do for this version.
+CREATE TABLE llm_usage_rebuilt (
+    id INTEGER PRIMARY KEY,
+    created_at TIMESTAMP NOT NULL,
+    user_id VARCHAR(128),
+    plan VARCHAR(32),
+    template VARCHAR(64) NOT NULL,
+    model VARCHAR(64) NOT NULL,
+    max_tokens INTEGER,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    cost_usd FLOAT NOT NULL DEFAULT 0,
+    latency_ms FLOAT NOT NULL,
+    error VARCHAR(64)
+);
+
+INSERT INTO llm_usage_rebuilt (created_at, user_id, plan, template, model, max_tokens, prompt_tokens,
+                               completion_tokens, cost_usd, latency_ms, error)
+    SELECT created_at, user_id, plan, template, model, max_tokens, prompt_tokens,
+           completion_tokens, cost_usd, latency_ms, error
+    FROM llm_usage ORDER BY created_at;
+
+DROP TABLE llm_usage;
+
+ALTER TABLE llm_usage_rebuilt RENAME TO llm_usage;
+
+CREATE INDEX IF NOT EXISTS ix_llm_usage_created ON llm_usage (created_at);
+
+CREATE TABLE llm_usage_rollup_rebuilt (
+    id INTEGER PRIMARY KEY,
+    hour TIMESTAMP NOT NULL,
+    template VARCHAR(64) NOT NULL,
+    model VARCHAR(64) NOT NULL,
+    max_tokens INTEGER,
+    calls INTEGER NOT NULL,
+    errors INTEGER NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    cost_usd FLOAT NOT NULL,
+    latency_ms_sum FLOAT NOT NULL,
+    latency_histogram TEXT NOT NULL,
+    CONSTRAINT uq_llm_usage_rollup_key UNIQUE (hour, template, model, max_tokens)
+);
+
+INSERT INTO llm_usage_rollup_rebuilt (hour, template, model, max_tokens, calls, errors, prompt_tokens,
+                                      completion_tokens, cost_usd, latency_ms_sum, latency_histogram)
+    SELECT hour, template, model, max_tokens, calls, errors, prompt_tokens,
+           completion_tokens, cost_usd, latency_ms_sum, latency_histogram
+    FROM llm_usage_rollup ORDER BY hour;
+
+DROP TABLE llm_usage_rollup;
+
+ALTER TABLE llm_usage_rollup_rebuilt RENAME TO llm_usage_rollup
@@ -1,14 +1,26 @@
+import json
+import base64
 from datetime import datetime, timedelta
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import defer
 from enum import Enum
+from models.routing import RoutingSQLAlchemy
 
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 
 class PlanType(Enum):
     FREE = 'free'
     PAY_PER_PRESENTATION = 'pay_per_presentation'
     SUBSCRIPTION = 'subscription'
 
+# Per-plan limits; None means no per-presentation slide cap
+PLAN_LIMITS = {
+    PlanType.FREE: {'max_slides': 5, 'max_active': 3},
+    PlanType.PAY_PER_PRESENTATION: {'max_slides': 10},
+    PlanType.SUBSCRIPTION: {'max_slides': None, 'monthly_presentations': 50, 'monthly_slides': 500},
+}
+
 class User(db.Model):
     id = db.Column(db.String(128), primary_key=True)  # Google OAuth ID
     email = db.Column(db.String(120), unique=True, nullable=False)
@@ -21,40 +33,43 @@ class User(db.Model):
     monthly_presentations_count = db.Column(db.Integer, default=0)
     monthly_slides_count = db.Column(db.Integer, default=0)
     last_count_reset = db.Column(db.DateTime, default=datetime.utcnow)
+    active_presentations_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     presentations = db.relationship('Presentation', backref='user', lazy=True)
 
     def can_create_presentation(self, num_slides):
-        if self.current_plan == PlanType.FREE:
-            active_presentations = Presentation.query.filter_by(
-                user_id=self.id,
-                status='active'
-            ).count()
-            return active_presentations < 3 and num_slides <= 5
+        """Read-only plan check; use services.usage.usage_quota.reserve() to actually claim usage"""
+        limits = PLAN_LIMITS.get(self.current_plan)
+        if limits is None:
+            return False
+        if limits['max_slides'] is not None and num_slides > limits['max_slides']:
+            return False
 
-        elif self.current_plan == PlanType.PAY_PER_PRESENTATION:
-            return num_slides <= 10
+        if self.current_plan == PlanType.FREE:
+            return (self.active_presentations_count or 0) < limits['max_active']
 
         elif self.current_plan == PlanType.SUBSCRIPTION:
-            # Check if we need to reset monthly counters
-            if (datetime.utcnow() - self.last_count_reset).days >= 30:
-                self.monthly_presentations_count = 0
-                self.monthly_slides_count = 0
-                self.last_count_reset = datetime.utcnow()
-                db.session.commit()
+            # Counters past the 30-day window count as already reset
+            if not self.last_count_reset or (datetime.utcnow() - self.last_count_reset).days >= 30:
+                return num_slides <= limits['monthly_slides']
+            return ((self.monthly_presentations_count or 0) < limits['monthly_presentations'] and
+                    (self.monthly_slides_count or 0) + num_slides <= limits['monthly_slides'])
 
-            return (self.monthly_presentations_count < 50 and 
-                    self.monthly_slides_count + num_slides <= 500)
-
-        return False
+        return True
 
     def increment_usage(self, num_slides):
-        if self.current_plan == PlanType.SUBSCRIPTION:
-            self.monthly_presentations_count += 1
-            self.monthly_slides_count += num_slides
-            db.session.commit()
+        """Atomically claim usage for one presentation; returns False if over the plan limit"""
+        from services.usage import usage_quota
+        return usage_quota.reserve(self.id, num_slides) is not None
 
 class Presentation(db.Model):
+    __table_args__ = (
+        # Keyset pagination for the dashboard, see migrations/001
+        db.Index('ix_presentation_user_status_created', 'user_id', 'status', 'created_at', 'id'),
+        # Expiry sweeper, see migrations/003
+        db.Index('ix_presentation_status_expires', 'status', 'expires_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.String(128), db.ForeignKey('user.id'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
@@ -67,11 +82,49 @@ class Presentation(db.Model):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         # Set expiration for free plan presentations
-        user = User.query.get(self.user_id)
+        from models.user_cache import get_user
+        user = get_user(self.user_id)
         if user and user.current_plan == PlanType.FREE:
             self.expires_at = datetime.utcnow() + timedelta(days=7)
 
+    @staticmethod
+    def encode_cursor(presentation):
+        """Opaque keyset cursor pointing just after this row"""
+        raw = json.dumps([presentation.created_at.isoformat(), presentation.id])
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        created_at, presentation_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), presentation_id
+
+    @classmethod
+    def page_for_user(cls, user_id, cursor=None, limit=20, status='active'):
+        """
+        One page of a user's presentations, newest first, using keyset
+        pagination on (created_at, id). Returns (presentations, next_cursor).
+        """
+        query = cls.query.options(defer(cls.file_path)).filter(
+            cls.user_id == user_id,
+            cls.status == status
+        )
+        if cursor:
+            created_at, presentation_id = cls.decode_cursor(cursor)
+            query = query.filter(or_(
+                cls.created_at < created_at,
+                and_(cls.created_at == created_at, cls.id < presentation_id)
+            ))
+
+        rows = query.order_by(cls.created_at.desc(), cls.id.desc()).limit(limit + 1).all()
+        next_cursor = cls.encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
 class Payment(db.Model):
+    __table_args__ = (
+        # Reconciliation of stuck payments, see migrations/004
+        db.Index('ix_payment_status_id', 'status', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.String(128), db.ForeignKey('user.id'), nullable=False)
     amount = db.Column(db.Float, nullable=False)
@@ -80,3 +133,71 @@ class Payment(db.Model):
     status = db.Column(db.String(20), default='pending')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     subscription_id = db.Column(db.String(100))  # For subscription payments
+
+class JobLease(db.Model):
+    """Time-limited lock so only one worker runs a given background job"""
+    name = db.Column(db.String(64), primary_key=True)
+    holder = db.Column(db.String(128), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    @classmethod
+    def acquire(cls, name, holder, seconds):
+        """Take or renew the lease; returns False if another holder owns it"""
+        now = datetime.utcnow()
+        taken = cls.query.filter(
+            cls.name == name,
+            or_(cls.holder == holder, cls.expires_at < now)
+        ).update({cls.holder: holder, cls.expires_at: now + timedelta(seconds=seconds)},
+                 synchronize_session=False)
+        if not taken:
+            try:
+                db.session.add(cls(name=name, holder=holder, expires_at=now + timedelta(seconds=seconds)))
+                db.session.flush()
+            except IntegrityError:
+                db.session.rollback()
+                return False
+        db.session.commit()
+        return True
+
+    @classmethod
+    def release(cls, name, holder):
+        cls.query.filter_by(name=name, holder=holder).delete(synchronize_session=False)
+        db.session.commit()
+
+class LLMUsage(db.Model):
+    """One chat completion call; rows are only ever inserted, see services/llm_usage.py"""
+    __table_args__ = (
+        db.Index('ix_llm_usage_created', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    user_id = db.Column(db.String(128))
+    plan = db.Column(db.String(32))
+    template = db.Column(db.String(64), nullable=False)
+    model = db.Column(db.String(64), nullable=False)
+    max_tokens = db.Column(db.Integer)
+    prompt_tokens = db.Column(db.Integer, nullable=False, default=0)
+    completion_tokens = db.Column(db.Integer, nullable=False, default=0)
+    cost_usd = db.Column(db.Float, nullable=False, default=0.0)
+    latency_ms = db.Column(db.Float, nullable=False)
+    error = db.Column(db.String(64))
+
+class LLMUsageRollup(db.Model):
+    """Hourly aggregate of LLMUsage per template, model and max_tokens"""
+    __table_args__ = (
+        db.UniqueConstraint('hour', 'template', 'model', 'max_tokens', name='uq_llm_usage_rollup_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    hour = db.Column(db.DateTime, nullable=False)
+    template = db.Column(db.String(64), nullable=False)
+    model = db.Column(db.String(64), nullable=False)
+    max_tokens = db.Column(db.Integer)
+    calls = db.Column(db.Integer, nullable=False)
+    errors = db.Column(db.Integer, nullable=False)
+    prompt_tokens = db.Column(db.Integer, nullable=False)
+    completion_tokens = db.Column(db.Integer, nullable=False)
+    cost_usd = db.Column(db.Float, nullable=False)
+    latency_ms_sum = db.Column(db.Float, nullable=False)
+    latency_histogram = db.Column(db.Text, nullable=False)  # JSON bucket counts, see LATENCY_BUCKETS_MS
@@ -0,0 +1,67 @@
+import os
+import logging
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+
+def migration_files(dialect):
+    """
+    (version, file) pairs in order. NNN_name.<dialect>.sql replaces
+    NNN_name.sql on that dialect; a version that only has files for other
+    dialects maps to None and is recorded without running anything.
+    """
+    generic, specific = {}, {}
+    for name in sorted(os.listdir(MIGRATIONS_DIR)):
+        if not name.endswith('.sql'):
+            continue
+        version, _, variant = name[:-4].partition('.')
+        if not variant:
+            generic[version] = name
+        elif variant == dialect:
+            specific[version] = name
+        else:
+            generic.setdefault(version, None)
+    versions = sorted(generic.keys() | specific.keys())
+    return [(version, specific.get(version) or generic.get(version)) for version in versions]
+
+
+def pending_migrations(conn):
+    """(version, file) pairs from MIGRATIONS_DIR that have not been applied yet, in order"""
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_migrations ('
+        ' version VARCHAR(255) PRIMARY KEY,'
+        ' applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)'
+    ))
+    applied = {row[0] for row in conn.execute(text('SELECT version FROM schema_migrations'))}
+    return [(version, name) for version, name in migration_files(conn.dialect.name) if version not in applied]
+
+
+def apply_migrations(engine):
+    """Apply every pending migration, each in its own transaction"""
+    with engine.begin() as conn:
+        pending = pending_migrations(conn)
+
+    for version, name in pending:
+        statements = []
+        if name:
+            with open(os.path.join(MIGRATIONS_DIR, name)) as f:
+                statements = [s.strip() for s in f.read().split(';')]
+        with engine.begin() as conn:
+            for statement in statements:
+                # Drop comment-only chunks
+                if '\n'.join(l for l in statement.splitlines() if not l.strip().startswith('--')).strip():
+                    conn.execute(text(statement))
+            conn.execute(text('INSERT INTO schema_migrations (version) VALUES (:v)'), {'v': version})
+        logger.info(f"Applied migration {name or version + ' (nothing to run on ' + engine.dialect.name + ')'}")
+
+    return [version for version, _ in pending]
+
+
+def stamp_migrations(engine):
+    """Mark every migration as applied, for a schema just built by db.create_all()"""
+    with engine.begin() as conn:
+        for version, _ in pending_migrations(conn):
+            conn.execute(text('INSERT INTO schema_migrations (version) VALUES (:v)'), {'v': version})
@@ -0,0 +1,129 @@
+import os
+import time
+import random
+import logging
+import threading
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.sql import Select
+
+logger = logging.getLogger(__name__)
+
+
+class ReplicaRouter:
+    """
+    Holds engines for read replicas and tracks which are usable. A replica is
+    skipped while it is unreachable or lagging more than max_lag seconds
+    behind the primary; reads then fall back to the primary.
+    """
+
+    def __init__(self, urls, engine_options=None, max_lag=None, retry_after=30):
+        self.max_lag = max_lag if max_lag is not None else float(os.environ.get('DATABASE_REPLICA_MAX_LAG', 5))
+        self.retry_after = retry_after
+        self.engines = []
+        for url in urls:
+            if url.startswith('postgres://'):
+                url = url.replace('postgres://', 'postgresql://', 1)
+            engine = create_engine(url, **(engine_options or {}))
+            event.listen(engine, 'handle_error', self._on_error)
+            self.engines.append(engine)
+        self._down_until = {}  # engine -> time before which it is not used
+        self._lag = {}  # engine -> last measured lag in seconds
+        self._lock = threading.Lock()
+
+    def _on_error(self, context):
+        if context.is_disconnect and context.engine in self.engines:
+            self.mark_down(context.engine, 'disconnected')
+
+    def mark_down(self, engine, reason):
+        logger.warning(f"Replica {engine.url.host or engine.url.database} unavailable ({reason}), "
+                       f"reading from primary for {self.retry_after}s")
+        with self._lock:
+            self._down_until[engine] = time.time() + self.retry_after
+
+    def pick(self):
+        """A usable replica engine, or None to read from the primary"""
+        now = time.time()
+        with self._lock:
+            usable = [e for e in self.engines if self._down_until.get(e, 0) <= now]
+        return random.choice(usable) if usable else None
+
+    @staticmethod
+    def _measure_lag(conn):
+        if conn.dialect.name == 'postgresql':
+            lag = conn.execute(text(
+                'SELECT EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())'
+            )).scalar()
+            return float(lag or 0)
+        return 0.0
+
+    def check(self):
+        """Measure every replica's lag; called periodically by the health monitor"""
+        status = {}
+        for engine in self.engines:
+            name = str(engine.url.set(password=None)) if engine.url.password else str(engine.url)
+            try:
+                with engine.connect() as conn:
+                    lag = self._measure_lag(conn)
+                with self._lock:
+                    self._lag[engine] = lag
+                    if lag > self.max_lag:
+                        self._down_until[engine] = time.time() + self.retry_after
+                    else:
+                        self._down_until.pop(engine, None)
+                status[name] = 'ok' if lag <= self.max_lag else f'lagging {lag:.1f}s'
+            except Exception as e:
+                self.mark_down(engine, str(e))
+                status[name] = str(e)
+        return status
+
+
+class RoutingSession(SignallingSession):
+    """
+    Sends plain SELECTs to a replica. Anything else, SELECT ... FOR UPDATE
+    included, goes to the primary, and once a session has written or locked
+    rows, every later read in it stays on the primary so a request always
+    sees its own writes.
+    """
+
+    def __init__(self, db, **options):
+        self._router = db.replica_router
+        self._use_primary = False
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._router is not None and not self._use_primary:
+            # SELECT ... FOR UPDATE takes row locks, so it is a write as far as routing is concerned
+            if (clause is not None and isinstance(clause, Select) and clause._for_update_arg is None
+                    and not self._flushing):
+                engine = self._router.pick()
+                if engine is not None:
+                    return engine
+            elif clause is not None or self._flushing:
+                self._use_primary = True
+        return super().get_bind(mapper, clause)
+
+    def use_primary(self):
+        """Pin the rest of this session to the primary"""
+        self._use_primary = True
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy with optional read-replica routing"""
+
+    replica_router = None
+
+    def configure_replicas(self, urls, engine_options=None):
+        """Route reads to these replica URLs; an empty list keeps everything on the primary"""
+        urls = [u.strip() for u in urls if u and u.strip()]
+        self.replica_router = ReplicaRouter(urls, engine_options) if urls else None
+        if self.replica_router:
+            logger.info(f"Routing reads to {len(urls)} replica(s)")
+
+    def use_primary(self):
+        """Pin the current request's session to the primary"""
+        self.session().use_primary()
+
+    def create_session(self, options):
+        return sessionmaker(class_=RoutingSession, db=self, **options)
@@ -0,0 +1,72 @@
+import os
+import time
+import threading
+from flask import g, has_app_context, session
+from sqlalchemy.orm.util import identity_key
+from models.database import db, User
+
+
+class UserCache:
+    """
+    Short-TTL cache of User rows shared by requests in a process. Entries are
+    detached copies, merged into the caller's session without a SELECT.
+    Anything that changes plan or usage fields must call invalidate().
+    """
+
+    def __init__(self, ttl=None, max_items=1024):
+        self.ttl = ttl if ttl is not None else float(os.environ.get('USER_CACHE_TTL', 30))
+        self.max_items = max_items
+        self._items = {}  # user_id -> (loaded_at, detached User)
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        # The request already holds this user, possibly with unflushed edits: use it as is
+        user = db.session.identity_map.get(identity_key(User, user_id))
+        if user is not None:
+            return user
+
+        with self._lock:
+            cached = self._items.get(user_id)
+        if cached and time.time() - cached[0] < self.ttl:
+            return db.session.merge(cached[1], load=False)
+
+        # Load the cached copy in a short-lived session of its own, so the caller's session is never touched
+        loader = db.session.session_factory()
+        try:
+            user = loader.query(User).get(user_id)
+            if user is None:
+                return None
+            loader.expunge(user)
+        finally:
+            loader.close()
+        with self._lock:
+            if len(self._items) >= self.max_items:
+                self._items.clear()
+            self._items[user_id] = (time.time(), user)
+        return db.session.merge(user, load=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._items.pop(user_id, None)
+        if has_app_context():
+            g.pop('_users', None)
+
+
+user_cache = UserCache()
+
+
+def get_user(user_id):
+    """Load a user at most once per request, backed by the cross-request cache"""
+    if not has_app_context():
+        return User.query.get(user_id)
+    users = g.setdefault('_users', {})
+    if user_id not in users:
+        users[user_id] = user_cache.get(user_id)
+    return users[user_id]
+
+
+def current_user():
+    """The logged-in user for this request, or None"""
+    if 'user' not in session:
+        return None
+    return get_user(session['user']['id'])
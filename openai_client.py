@@ -1,6 +1,9 @@
 import os
 from openai import OpenAI
 import logging
+import time
+from services.metrics import span
+from services.llm_usage import usage_recorder
 
 logger = logging.getLogger(__name__)
 
@@ -9,16 +12,20 @@ class OpenAIClient:
         self.client = OpenAI(api_key=os.environ.get('OPENAI_API_KEY'))
         self.model = "gpt-3.5-turbo"  # Can be configured as needed
         
-    def generate(self, prompt):
+    def generate(self, prompt, template=None, max_tokens=500):
         """Generate text using the OpenAI API"""
+        started = time.perf_counter()
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                max_tokens=500
-            )
+            with span('openai.chat'):
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.7,
+                    max_tokens=max_tokens
+                )
+            usage_recorder.record_completion(template, self.model, started, max_tokens, response=response)
             return response.choices[0].message.content.strip()
         except Exception as e:
+            usage_recorder.record_completion(template, self.model, started, max_tokens, error=e)
             logger.error(f"Error generating text: {str(e)}")
             raise
@@ -0,0 +1,189 @@
+import os
+import math
+import time
+import logging
+import threading
+from functools import wraps
+from flask import jsonify
+from models.database import PlanType
+from models.user_cache import current_user
+from services.metrics import registry, stage_seconds
+
+logger = logging.getLogger(__name__)
+
+# Share of the generation capacity and the upstream latency (seconds) each plan tolerates
+DEFAULT_THRESHOLDS = {
+    PlanType.FREE: (0.5, 10),
+    PlanType.PAY_PER_PRESENTATION: (1.0, 20),
+    PlanType.SUBSCRIPTION: (1.0, 30),
+}
+
+shed_total = registry.counter(
+    'decksky_admission_shed_total', 'Generation requests rejected by admission control', ('plan', 'reason'))
+admitted_total = registry.counter(
+    'decksky_admission_admitted_total', 'Generation requests admitted', ('plan',))
+in_flight_gauge = registry.gauge(
+    'decksky_admission_in_flight', 'Generations running in this process')
+queued_gauge = registry.gauge(
+    'decksky_admission_queued', 'Generations waiting for a slot in this process')
+upstream_latency_gauge = registry.gauge(
+    'decksky_admission_upstream_latency_seconds', 'Recent mean latency of upstream calls used for shedding')
+
+
+class Shed(Exception):
+    """A request admission control turned away"""
+
+    def __init__(self, status, reason, retry_after):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Bounds how many generations run at once in a worker process so slow
+    upstreams cannot tie up every thread. Of ADMISSION_WORKER_THREADS,
+    ADMISSION_RESERVED_THREADS are never given to generations, which keeps
+    login, dashboard and health routes responsive. Each plan may use a share
+    of the rest and is shed once recent upstream latency passes its limit;
+    both are configurable, e.g. ADMISSION_FREE_SHARE=0.5 and
+    ADMISSION_FREE_MAX_LATENCY=10. Requests over their plan's share are shed
+    at once with 429 (503 when the process is full). Queueing is opt-in:
+    ADMISSION_QUEUE_TIMEOUT=N lets them wait up to N seconds for a slot, as
+    long as waiting does not eat into the reserved threads.
+    """
+
+    UPSTREAM_STAGES = ('openai.chat', 'cohere.chat', 'slides.create', 'slides.batch_update')
+
+    def __init__(self, worker_threads=None, reserved_threads=None, queue_timeout=None, latency_window=None):
+        self.worker_threads = worker_threads or int(os.environ.get('ADMISSION_WORKER_THREADS', 8))
+        reserved = reserved_threads if reserved_threads is not None else int(
+            os.environ.get('ADMISSION_RESERVED_THREADS', 2))
+        self.capacity = max(1, self.worker_threads - reserved)
+        self.queue_timeout = queue_timeout if queue_timeout is not None else float(
+            os.environ.get('ADMISSION_QUEUE_TIMEOUT', 0))
+        self.latency_window = latency_window or float(os.environ.get('ADMISSION_LATENCY_WINDOW', 30))
+        self.thresholds = {}
+        for plan, (share, max_latency) in DEFAULT_THRESHOLDS.items():
+            prefix = f'ADMISSION_{plan.name}'
+            share = float(os.environ.get(f'{prefix}_SHARE', share))
+            self.thresholds[plan] = (
+                max(1, math.floor(self.capacity * share)),
+                float(os.environ.get(f'{prefix}_MAX_LATENCY', max_latency)),
+            )
+        self.in_flight = 0
+        self.queued = 0
+        self._generation_seconds = None  # EWMA of admitted generation durations
+        self._latency = None
+        self._snapshot = None  # (time, sum, count) of upstream stage latency at the window start
+        self._cond = threading.Condition()
+
+    def _upstream_totals(self):
+        total, count = 0.0, 0
+        for stage in self.UPSTREAM_STAGES:
+            stage_sum, stage_count = stage_seconds.totals(stage=stage)
+            total += stage_sum
+            count += stage_count
+        return total, count
+
+    def upstream_latency(self):
+        """
+        Mean upstream call latency over the last completed window, from the
+        stage histograms. A window with no calls clears it, so shedding
+        cannot keep itself going once traffic stops.
+        """
+        now = time.monotonic()
+        with self._cond:
+            if self._snapshot is None:
+                self._snapshot = (now, *self._upstream_totals())
+            elif now - self._snapshot[0] >= self.latency_window:
+                total, count = self._upstream_totals()
+                calls = count - self._snapshot[2]
+                self._latency = (total - self._snapshot[1]) / calls if calls else None
+                self._snapshot = (now, total, count)
+            latency = self._latency
+        upstream_latency_gauge.set(latency or 0)
+        return latency
+
+    def _retry_after(self):
+        # Roughly when the oldest running generation should have finished
+        return min(120, max(1, math.ceil(self._generation_seconds or 10)))
+
+    def _publish(self):
+        in_flight_gauge.set(self.in_flight)
+        queued_gauge.set(self.queued)
+
+    def acquire(self, plan):
+        """Take a generation slot for plan or raise Shed"""
+        plan = plan or PlanType.FREE
+        limit, max_latency = self.thresholds[plan]
+        latency = self.upstream_latency()
+        if latency is not None and latency > max_latency:
+            shed_total.inc(plan=plan.value, reason='upstream_slow')
+            raise Shed(503, 'upstream_slow', math.ceil(self.latency_window))
+
+        with self._cond:
+            if self.in_flight >= limit:
+                # Waiting holds a worker thread too, so never wait into the reserved threads
+                if self.queue_timeout <= 0 or self.in_flight + self.queued >= self.capacity:
+                    # 503 when the process is full, 429 when only this plan's share is
+                    status = 503 if self.in_flight >= self.capacity else 429
+                    shed_total.inc(plan=plan.value, reason='capacity')
+                    raise Shed(status, 'capacity', self._retry_after())
+                self.queued += 1
+                self._publish()
+                try:
+                    admitted = self._cond.wait_for(lambda: self.in_flight < limit, self.queue_timeout)
+                finally:
+                    self.queued -= 1
+                if not admitted:
+                    self._publish()
+                    shed_total.inc(plan=plan.value, reason='queue_timeout')
+                    raise Shed(429, 'queue_timeout', self._retry_after())
+            self.in_flight += 1
+            self._publish()
+        admitted_total.inc(plan=plan.value)
+        return time.monotonic()
+
+    def release(self, started):
+        elapsed = time.monotonic() - started
+        with self._cond:
+            self.in_flight -= 1
+            self._generation_seconds = elapsed if self._generation_seconds is None else (
+                0.8 * self._generation_seconds + 0.2 * elapsed)
+            self._publish()
+            self._cond.notify_all()
+
+    def limit(self, f):
+        """Route decorator: run the view inside a generation slot for the user's plan"""
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            user = current_user()
+            try:
+                started = self.acquire(user.current_plan if user else None)
+            except Shed as shed:
+                logger.warning(f"Shed generation request ({shed.reason}, {self.in_flight} in flight, "
+                               f"{self.queued} queued)")
+                response = jsonify({'error': 'The service is busy. Please try again shortly.',
+                                    'reason': shed.reason})
+                response.headers['Retry-After'] = str(shed.retry_after)
+                return response, shed.status
+            try:
+                return f(*args, **kwargs)
+            finally:
+                self.release(started)
+        return decorated_function
+
+    def report(self):
+        return {
+            'capacity': self.capacity,
+            'in_flight': self.in_flight,
+            'queued': self.queued,
+            'upstream_latency_seconds': self._latency,
+            'thresholds': {plan.value: {'max_in_flight': limit, 'max_latency_seconds': latency}
+                           for plan, (limit, latency) in self.thresholds.items()},
+        }
+
+
+admission = AdmissionController()
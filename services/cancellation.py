@@ -0,0 +1,8 @@
+class GenerationCancelled(Exception):
+    """Raised between steps once a generation's cancel_event is set"""
+
+
+def raise_if_cancelled(cancel_event, message='Generation cancelled'):
+    """Call before each LLM call or other expensive step of a cancellable generation"""
+    if cancel_event is not None and cancel_event.is_set():
+        raise GenerationCancelled(message)
@@ -0,0 +1,120 @@
+import os
+import time
+import logging
+import threading
+from collections import namedtuple
+from datetime import datetime, timezone
+from flask import request, send_file, make_response
+
+logger = logging.getLogger(__name__)
+
+FileEntry = namedtuple('FileEntry', ['path', 'size', 'mtime', 'etag'])
+
+
+class DownloadIndex:
+    """
+    In-memory index of the files in the download directory. Downloads are
+    resolved here instead of stat-ing the disk on every request; files are
+    added when first seen and removed when the expiry sweeper deletes them.
+    """
+
+    def __init__(self, app=None, miss_ttl=30):
+        self.miss_ttl = miss_ttl
+        self.storage_dir = None
+        self.offload = os.environ.get('DOWNLOAD_OFFLOAD', '').lower()  # '', 'x-sendfile' or 'x-accel'
+        self.accel_prefix = os.environ.get('DOWNLOAD_ACCEL_PREFIX', '/protected-downloads').rstrip('/')
+        self.max_age = int(os.environ.get('DOWNLOAD_MAX_AGE', 3600))
+        self._files = {}  # filename -> FileEntry
+        self._misses = {}  # filename -> time of the last failed lookup
+        self._lock = threading.Lock()
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.storage_dir = os.path.abspath(app.config['UPLOAD_FOLDER'])
+        self.scan()
+
+    def scan(self):
+        """Rebuild the index from the download directory"""
+        files = {}
+        with os.scandir(self.storage_dir) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    files[entry.name] = self._entry(entry.path, entry.stat())
+        with self._lock:
+            self._files = files
+            self._misses.clear()
+        logger.info(f"Indexed {len(files)} downloadable files")
+
+    @staticmethod
+    def _entry(path, stat):
+        return FileEntry(path, stat.st_size, stat.st_mtime, f"{int(stat.st_mtime_ns):x}-{stat.st_size:x}")
+
+    def register(self, path):
+        """Index a file just written to the download directory"""
+        path = os.path.abspath(path)
+        entry = self._entry(path, os.stat(path))
+        with self._lock:
+            self._files[os.path.basename(path)] = entry
+            self._misses.pop(os.path.basename(path), None)
+        return entry
+
+    def unregister(self, filename):
+        with self._lock:
+            self._files.pop(os.path.basename(filename), None)
+
+    def lookup(self, filename):
+        """The indexed entry for filename, or None. Unknown names are probed at most once per miss_ttl."""
+        with self._lock:
+            entry = self._files.get(filename)
+            if entry or time.time() - self._misses.get(filename, 0) < self.miss_ttl:
+                return entry
+        # Another worker may have written it since we scanned
+        path = os.path.join(self.storage_dir, filename)
+        try:
+            return self.register(path)
+        except OSError:
+            with self._lock:
+                self._misses[filename] = time.time()
+            return None
+
+    def _offloaded(self, entry, filename):
+        """Headers-only response telling the front proxy to stream the file"""
+        response = make_response('')
+        if self.offload == 'x-accel':
+            response.headers['X-Accel-Redirect'] = f"{self.accel_prefix}/{filename}"
+        else:
+            response.headers['X-Sendfile'] = entry.path
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response.mimetype = 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
+        response.set_etag(entry.etag)
+        response.last_modified = datetime.fromtimestamp(entry.mtime, timezone.utc)
+        response.cache_control.private = True
+        response.cache_control.max_age = self.max_age
+        # Answers If-None-Match / If-Modified-Since with 304; ranges are left to the proxy
+        return response.make_conditional(request)
+
+    def send(self, entry, filename):
+        """
+        Response for an indexed file: conditional (ETag / Last-Modified),
+        byte-range capable, and offloaded to the proxy when configured.
+        """
+        if self.offload in ('x-accel', 'x-sendfile'):
+            return self._offloaded(entry, filename)
+        response = send_file(
+            entry.path,
+            as_attachment=True,
+            download_name=filename,
+            conditional=True,
+            etag=entry.etag,
+            last_modified=entry.mtime,
+            max_age=self.max_age
+        )
+        # Decks are per-user: browsers may cache them, shared caches may not
+        response.cache_control.public = False
+        response.cache_control.private = True
+        response.accept_ranges = 'bytes'
+        return response
+
+
+download_index = DownloadIndex()
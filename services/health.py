@@ -0,0 +1,127 @@
+import os
+import time
+import shutil
+import logging
+import threading
+from datetime import datetime
+from sqlalchemy import text
+from models.database import db
+
+logger = logging.getLogger(__name__)
+
+
+class HealthMonitor:
+    """
+    Checks the database and download storage on a background thread and
+    caches the result. Requests consult the cached state instead of paying
+    for their own probe, and the database circuit breaker opens after
+    repeated failures so requests fail fast with 503.
+    """
+
+    def __init__(self, app=None, interval=None, failure_threshold=2, min_free_bytes=50 * 1024 * 1024):
+        self.interval = interval or float(os.environ.get('HEALTH_CHECK_INTERVAL', 15))
+        self.failure_threshold = failure_threshold
+        self.min_free_bytes = min_free_bytes
+        self.app = None
+        self.storage_dir = None
+        self._status = None
+        self._checked_at = None
+        self._db_failures = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.storage_dir = app.config['UPLOAD_FOLDER']
+
+    def ensure_started(self):
+        """Start the monitor thread once per process, including after a fork"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        # First check runs inline so the first request sees a real status
+        self.check_now()
+        thread = threading.Thread(target=self._run, name='health-monitor', daemon=True)
+        thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.check_now()
+
+    def _check_database(self):
+        with self.app.app_context():
+            with db.engine.connect() as conn:
+                conn.execute(text('SELECT 1'))
+
+    def _check_storage(self):
+        if not os.path.isdir(self.storage_dir):
+            raise Exception("Upload directory not accessible")
+        if not os.access(self.storage_dir, os.W_OK):
+            raise Exception("Upload directory not writable")
+        free = shutil.disk_usage(self.storage_dir).free
+        if free < self.min_free_bytes:
+            raise Exception(f"Upload directory low on space ({free} bytes free)")
+
+    def check_now(self):
+        """Run every check and cache the result"""
+        checks = {}
+        for name, check in (('database', self._check_database), ('filesystem', self._check_storage)):
+            try:
+                check()
+                checks[name] = 'ok'
+            except Exception as e:
+                logger.error(f"Health check '{name}' failed: {e}")
+                checks[name] = str(e)
+
+        # Replica trouble is absorbed by falling back to the primary, so it is reported but not fatal
+        if db.replica_router is not None:
+            checks['replicas'] = db.replica_router.check()
+
+        with self._lock:
+            if checks['database'] == 'ok':
+                if self._db_failures >= self.failure_threshold:
+                    logger.info("Database reachable again, closing circuit breaker")
+                self._db_failures = 0
+            else:
+                self._db_failures += 1
+            self._status = checks
+            self._checked_at = time.time()
+        return checks
+
+    def record_db_failure(self):
+        """Count a database error seen while serving a request"""
+        with self._lock:
+            self._db_failures += 1
+
+    @property
+    def database_available(self):
+        """False while the circuit breaker is open"""
+        return self._db_failures < self.failure_threshold
+
+    @property
+    def retry_after(self):
+        """Seconds until the next check may close the breaker"""
+        if self._checked_at is None:
+            return int(self.interval)
+        return max(1, int(self.interval - (time.time() - self._checked_at)))
+
+    def report(self):
+        """Cached status and its age, for /healthz"""
+        with self._lock:
+            checks = dict(self._status or {})
+            checked_at = self._checked_at
+        healthy = bool(checks) and all(checks[name] == 'ok' for name in ('database', 'filesystem'))
+        return {
+            'status': 'healthy' if healthy else 'unhealthy',
+            'timestamp': datetime.utcnow().isoformat(),
+            'checked_at': datetime.utcfromtimestamp(checked_at).isoformat() if checked_at else None,
+            'age_seconds': round(time.time() - checked_at, 3) if checked_at else None,
+            'circuit_breaker': 'closed' if self.database_available else 'open',
+            'checks': checks
+        }
@@ -0,0 +1,310 @@
+import os
+import json
+import time
+import socket
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from models.database import db, LLMUsage, LLMUsageRollup, JobLease
+
+logger = logging.getLogger(__name__)
+
+# USD per 1K tokens as (prompt, completion); unknown models are recorded at zero cost
+CHAT_PRICES = {
+    'gpt-3.5-turbo': (0.0005, 0.0015),
+    'gpt-4o-mini': (0.00015, 0.0006),
+    'gpt-4o': (0.0025, 0.01),
+    'gpt-4-turbo': (0.01, 0.03),
+}
+
+# Upper bounds of the latency histogram kept in each rollup row; the last bucket is open-ended
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+
+# Tags for the current request or job: user_id, plan and template
+_tags = contextvars.ContextVar('llm_usage_tags', default={})
+
+
+@contextmanager
+def usage_tags(**tags):
+    """Tag every LLM call made inside the block, e.g. usage_tags(user_id=..., plan=...)"""
+    token = _tags.set({**_tags.get(), **tags})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+
+def chat_cost(model, prompt_tokens, completion_tokens):
+    prices = CHAT_PRICES.get(model)
+    if not prices:
+        # Dated snapshots such as gpt-4o-2024-08-06 are billed like their base model
+        prices = next((p for name, p in CHAT_PRICES.items() if model.startswith(name + '-')), (0.0, 0.0))
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1000
+
+
+def latency_bucket(latency_ms):
+    for i, bound in enumerate(LATENCY_BUCKETS_MS):
+        if latency_ms <= bound:
+            return i
+    return len(LATENCY_BUCKETS_MS)
+
+
+def histogram_quantile(counts, q):
+    """Estimate a quantile from bucket counts, interpolating linearly inside the bucket"""
+    total = sum(counts)
+    if not total:
+        return None
+    target, seen = q * total, 0
+    for i, count in enumerate(counts):
+        if count and seen + count >= target:
+            lower = LATENCY_BUCKETS_MS[i - 1] if i > 0 else 0
+            upper = LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else LATENCY_BUCKETS_MS[-1] * 2
+            return round(lower + (upper - lower) * (target - seen) / count, 1)
+        seen += count
+    return None
+
+
+class UsageRecorder:
+    """
+    Buffers one row per chat completion and appends them to llm_usage in
+    batches from a background thread, so recording never adds a database
+    round trip to the call itself. A leased job folds finished hours into
+    llm_usage_rollup and prunes raw rows past the retention period. The
+    last LLM_USAGE_ROLLUP_LOOKBACK_HOURS rolled-up hours are aggregated
+    again on every run, so rows flushed late still reach the reports.
+    """
+
+    LEASE_NAME = 'llm_usage_rollup'
+
+    def __init__(self, app=None, flush_interval=None, rollup_interval=None, retention_days=None, max_buffer=200,
+                 rollup_lookback_hours=None):
+        self.flush_interval = flush_interval or float(os.environ.get('LLM_USAGE_FLUSH_INTERVAL', 10))
+        self.rollup_interval = rollup_interval or float(os.environ.get('LLM_USAGE_ROLLUP_INTERVAL', 300))
+        self.retention_days = retention_days if retention_days is not None else int(
+            os.environ.get('LLM_USAGE_RETENTION_DAYS', 30))
+        self.max_buffer = max_buffer
+        self.rollup_lookback_hours = max(1, rollup_lookback_hours or int(
+            os.environ.get('LLM_USAGE_ROLLUP_LOOKBACK_HOURS', 2)))
+        self.app = None
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+
+    @property
+    def holder(self):
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def record(self, template, model, latency_ms, max_tokens=None, prompt_tokens=0, completion_tokens=0,
+               error=None):
+        """Queue one call; a no-op outside the web app (e.g. the desktop UI)"""
+        if self.app is None:
+            return
+        tags = _tags.get()
+        row = {
+            'created_at': datetime.utcnow(),
+            'user_id': tags.get('user_id'),
+            'plan': tags.get('plan'),
+            'template': template or tags.get('template') or 'untagged',
+            'model': model,
+            'max_tokens': max_tokens,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'cost_usd': chat_cost(model, prompt_tokens, completion_tokens),
+            'latency_ms': round(latency_ms, 1),
+            'error': error,
+        }
+        with self._lock:
+            self._buffer.append(row)
+            full = len(self._buffer) >= self.max_buffer
+        if full:
+            self._wake.set()
+
+    def record_completion(self, template, model, started, max_tokens=None, response=None, error=None):
+        """Record a chat.completions call from its response (or the exception it raised)"""
+        usage = getattr(response, 'usage', None)
+        self.record(
+            template, model, (time.perf_counter() - started) * 1000, max_tokens,
+            getattr(usage, 'prompt_tokens', 0) or 0,
+            getattr(usage, 'completion_tokens', 0) or 0,
+            type(error).__name__ if error else None
+        )
+
+    def ensure_started(self):
+        """Start the flush/rollup thread once per process, including after a fork"""
+        if self.app is None or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._buffer = []  # rows buffered by a parent process are its to write
+        thread = threading.Thread(target=self._run, name='llm-usage', daemon=True)
+        thread.start()
+
+    def _run(self):
+        last_rollup = time.time()
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                with self.app.app_context():
+                    self.flush()
+                    if time.time() - last_rollup >= self.rollup_interval:
+                        last_rollup = time.time()
+                        self.rollup()
+            except Exception as e:
+                logger.error(f"LLM usage flush failed: {e}")
+
+    def flush(self):
+        """Append buffered rows in one batched INSERT; returns the number written"""
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+        if not rows:
+            return 0
+        try:
+            db.session.execute(LLMUsage.__table__.insert(), rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            with self._lock:
+                # Keep the rows for the next attempt, but never grow without bound
+                self._buffer = (rows + self._buffer)[-10 * self.max_buffer:]
+            raise
+        return len(rows)
+
+    def rollup(self):
+        """
+        Aggregate every finished hour not yet in llm_usage_rollup, plus the
+        lookback hours before them again, then prune raw rows older than the
+        retention period. Returns the number of hours rolled up, or None if
+        another worker holds the lease.
+        """
+        if not JobLease.acquire(self.LEASE_NAME, self.holder, 300):
+            return None
+        try:
+            # Leave a grace period so rows still in other workers' buffers land before their hour is rolled up
+            current_hour = (datetime.utcnow() - timedelta(minutes=5)).replace(minute=0, second=0, microsecond=0)
+            last = db.session.query(func.max(LLMUsageRollup.hour)).scalar()
+            if last:
+                # Rows buffered or retried past the grace period land in hours already rolled up
+                start = last - timedelta(hours=self.rollup_lookback_hours - 1)
+            else:
+                start = db.session.query(func.min(LLMUsage.created_at)).scalar()
+            hours = 0
+            if start is not None:
+                start = start.replace(minute=0, second=0, microsecond=0)
+                while start < current_hour:
+                    self._rollup_hour(start)
+                    start += timedelta(hours=1)
+                    hours += 1
+                db.session.commit()
+
+            if self.retention_days:
+                cutoff = min(current_hour, datetime.utcnow() - timedelta(days=self.retention_days))
+                LLMUsage.query.filter(LLMUsage.created_at < cutoff).delete(synchronize_session=False)
+                db.session.commit()
+            return hours
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            JobLease.release(self.LEASE_NAME, self.holder)
+
+    def _rollup_hour(self, hour):
+        """Replace the hour's rollup rows with a fresh aggregate of its raw rows"""
+        rows = db.session.query(
+            LLMUsage.template, LLMUsage.model, LLMUsage.max_tokens, LLMUsage.latency_ms,
+            LLMUsage.prompt_tokens, LLMUsage.completion_tokens, LLMUsage.cost_usd, LLMUsage.error
+        ).filter(LLMUsage.created_at >= hour, LLMUsage.created_at < hour + timedelta(hours=1)).all()
+        if not rows:
+            return  # nothing new, or raw rows already pruned: keep what was rolled up
+        LLMUsageRollup.query.filter(LLMUsageRollup.hour == hour).delete(synchronize_session=False)
+        for (template, model, max_tokens), group in self._aggregate(rows).items():
+            db.session.add(LLMUsageRollup(
+                hour=hour, template=template, model=model, max_tokens=max_tokens,
+                calls=group['calls'], errors=group['errors'],
+                prompt_tokens=group['prompt_tokens'], completion_tokens=group['completion_tokens'],
+                cost_usd=group['cost_usd'], latency_ms_sum=group['latency_ms_sum'],
+                latency_histogram=json.dumps(group['histogram'])
+            ))
+
+    @staticmethod
+    def _empty_group():
+        return {'calls': 0, 'errors': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'cost_usd': 0.0,
+                'latency_ms_sum': 0.0, 'histogram': [0] * (len(LATENCY_BUCKETS_MS) + 1)}
+
+    @classmethod
+    def _aggregate(cls, rows, groups=None):
+        """Fold raw rows into {(template, model, max_tokens): totals}"""
+        groups = {} if groups is None else groups
+        for row in rows:
+            group = groups.setdefault((row.template, row.model, row.max_tokens), cls._empty_group())
+            group['calls'] += 1
+            group['errors'] += 1 if row.error else 0
+            group['prompt_tokens'] += row.prompt_tokens
+            group['completion_tokens'] += row.completion_tokens
+            group['cost_usd'] += row.cost_usd
+            group['latency_ms_sum'] += row.latency_ms
+            group['histogram'][latency_bucket(row.latency_ms)] += 1
+        return groups
+
+    def report(self, since):
+        """
+        Calls, tokens, cost and p50/p95 latency per template and model since
+        the given time, broken down by max_tokens. Finished hours come from
+        the rollups; the rest is aggregated from raw rows.
+        """
+        since_hour = since.replace(minute=0, second=0, microsecond=0)
+        groups = {}
+        rolled_until = since_hour
+        for rollup in LLMUsageRollup.query.filter(LLMUsageRollup.hour >= since_hour):
+            group = groups.setdefault((rollup.template, rollup.model, rollup.max_tokens), self._empty_group())
+            for key in ('calls', 'errors', 'prompt_tokens', 'completion_tokens', 'cost_usd', 'latency_ms_sum'):
+                group[key] += getattr(rollup, key)
+            group['histogram'] = [a + b for a, b in zip(group['histogram'], json.loads(rollup.latency_histogram))]
+            rolled_until = max(rolled_until, rollup.hour + timedelta(hours=1))
+
+        raw = db.session.query(
+            LLMUsage.template, LLMUsage.model, LLMUsage.max_tokens, LLMUsage.latency_ms,
+            LLMUsage.prompt_tokens, LLMUsage.completion_tokens, LLMUsage.cost_usd, LLMUsage.error
+        ).filter(LLMUsage.created_at >= rolled_until)
+        self._aggregate(raw, groups)
+
+        report = {}
+        for (template, model, max_tokens), group in sorted(groups.items(), key=lambda kv: str(kv[0])):
+            entry = report.setdefault(f'{template}/{model}', {
+                'template': template, 'model': model, 'by_max_tokens': {}, **self._empty_group()
+            })
+            for key in ('calls', 'errors', 'prompt_tokens', 'completion_tokens', 'cost_usd', 'latency_ms_sum'):
+                entry[key] += group[key]
+            entry['histogram'] = [a + b for a, b in zip(entry['histogram'], group['histogram'])]
+            entry['by_max_tokens'][str(max_tokens)] = self._summarize(group)
+
+        return [dict(self._summarize(entry), template=entry['template'], model=entry['model'],
+                     by_max_tokens=entry['by_max_tokens']) for entry in report.values()]
+
+    @staticmethod
+    def _summarize(group):
+        calls = group['calls']
+        return {
+            'calls': calls,
+            'errors': group['errors'],
+            'prompt_tokens': group['prompt_tokens'],
+            'completion_tokens': group['completion_tokens'],
+            'cost_usd': round(group['cost_usd'], 6),
+            'avg_latency_ms': round(group['latency_ms_sum'] / calls, 1) if calls else None,
+            'p50_latency_ms': histogram_quantile(group['histogram'], 0.50),
+            'p95_latency_ms': histogram_quantile(group['histogram'], 0.95),
+        }
+
+
+usage_recorder = UsageRecorder()
@@ -0,0 +1,196 @@
+import time
+import bisect
+import threading
+from functools import wraps
+
+# Seconds; covers a fast DB commit up to a slow multi-slide Slides batchUpdate
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    """Base for labelled metrics; one child value per label combination"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, '')) for n in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in sorted(items):
+            lines.extend(self._render_child(key, value))
+        return lines
+
+    def _render_child(self, key, value):
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {value}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            child = self._values.get(key)
+            if child is None:
+                # Per-bucket counts (last slot is +Inf), then sum and count
+                child = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            child[0][index] += 1
+            child[1] += value
+            child[2] += 1
+
+    def totals(self, **labels):
+        """(sum, count) observed so far for one label combination"""
+        with self._lock:
+            child = self._values.get(self._key(labels))
+            return (child[1], child[2]) if child else (0.0, 0)
+
+    def _render_child(self, key, value):
+        counts, total, count = value
+        lines, cumulative = [], 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            le = '+Inf' if bound == float('inf') else repr(float(bound))
+            lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, [("le", le)])} {cumulative}')
+        lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {total}')
+        lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {count}')
+        return lines
+
+
+class Registry:
+    """Holds this process's metrics and renders them in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, *args, **kwargs)
+            return self._metrics[name]
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets)
+
+    def add_collector(self, collect):
+        """Register a callable run at scrape time, e.g. to refresh gauges from another component"""
+        self._collectors.append(collect)
+
+    def render(self):
+        for collect in list(self._collectors):
+            try:
+                collect()
+            except Exception:
+                pass  # A failing collector must never break the scrape
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram(
+    'decksky_stage_duration_seconds', 'Latency of external calls and render stages', ('stage',))
+stage_errors = registry.counter(
+    'decksky_stage_errors_total', 'Stages that raised, by exception type', ('stage', 'error'))
+stage_in_flight = registry.gauge(
+    'decksky_stage_in_flight', 'Stages currently running', ('stage',))
+http_seconds = registry.histogram(
+    'decksky_http_request_duration_seconds', 'Request latency by endpoint and status', ('endpoint', 'method', 'status'))
+
+
+class span:
+    """
+    Time one stage, as a context manager or decorator:
+
+        with span('slides.batch_update'):
+            ...
+
+    Records latency, in-flight count and, if the block raises, the error type.
+    """
+
+    __slots__ = ('stage', 'started')
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.started = None
+
+    def __enter__(self):
+        stage_in_flight.inc(stage=self.stage)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        stage_seconds.observe(time.perf_counter() - self.started, stage=self.stage)
+        stage_in_flight.dec(stage=self.stage)
+        if exc_type is not None:
+            stage_errors.inc(stage=self.stage, error=exc_type.__name__)
+        return False
+
+    def __call__(self, func):
+        stage = self.stage
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
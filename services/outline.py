@@ -0,0 +1,69 @@
+import re
+import json
+import logging
+from services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# A section needs a title and at least MIN_POINTS points; extra points beyond MAX_POINTS are dropped
+MIN_POINTS = 3
+MAX_POINTS = 6
+
+outline_sections = registry.counter(
+    'decksky_outline_sections_total', 'Outline sections by how they were obtained', ('result',))
+outline_repairs = registry.counter(
+    'decksky_outline_repair_calls_total', 'Follow-up completions asking only for missing or invalid sections')
+outline_tokens_saved = registry.counter(
+    'decksky_outline_repair_tokens_saved_total',
+    'Estimated tokens saved by repairing sections instead of regenerating whole outlines')
+
+_FENCE = re.compile(r'^```(?:json)?\s*|\s*```$')
+
+
+def _decode_objects(text, start):
+    """Decode consecutive complete JSON values from a '[' at start, stopping at the first broken one"""
+    decoder = json.JSONDecoder()
+    items, pos = [], start + 1
+    while True:
+        while pos < len(text) and text[pos] in ' \t\r\n,':
+            pos += 1
+        if pos >= len(text) or text[pos] == ']':
+            return items
+        try:
+            item, pos = decoder.raw_decode(text, pos)
+        except ValueError:
+            return items  # truncated or malformed from here on
+        items.append(item)
+
+
+def parse_sections(content):
+    """
+    Candidate sections from an outline completion. Well-formed JSON is read
+    as is; a reply cut off at max_tokens or broken part-way keeps every
+    section that was complete before the damage.
+    """
+    text = _FENCE.sub('', content.strip())
+    try:
+        data = json.loads(text)
+    except ValueError:
+        match = re.search(r'"sections"\s*:\s*\[', text)
+        if not match:
+            return []
+        return _decode_objects(text, match.end() - 1)
+    if isinstance(data, dict):
+        data = data.get('sections', [data] if 'title' in data else [])
+    return data if isinstance(data, list) else []
+
+
+def clean_section(section):
+    """A normalised {'title', 'points'} section, or None if it cannot be used"""
+    if not isinstance(section, dict):
+        return None
+    title = section.get('title')
+    points = section.get('points')
+    if not isinstance(title, str) or not title.strip() or not isinstance(points, list):
+        return None
+    points = [point.strip() for point in points if isinstance(point, str) and point.strip()]
+    if len(points) < MIN_POINTS:
+        return None
+    return {'title': title.strip(), 'points': points[:MAX_POINTS]}
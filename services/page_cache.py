@@ -0,0 +1,99 @@
+import gzip
+import hashlib
+import logging
+import threading
+from functools import wraps
+from flask import current_app, request, make_response
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 512
+
+
+class CachedPage:
+    """One rendered page with its precompressed variants, each with a strong ETag"""
+
+    def __init__(self, body, mimetype):
+        self.mimetype = mimetype
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.variants = {'identity': (body, digest)}
+        if len(body) >= MIN_COMPRESS_BYTES:
+            self.variants['gzip'] = (gzip.compress(body, compresslevel=9, mtime=0), f'{digest}-gz')
+            if brotli is not None:
+                self.variants['br'] = (brotli.compress(body, quality=11), f'{digest}-br')
+
+    @property
+    def etags(self):
+        return [etag for _, etag in self.variants.values()]
+
+    def choose(self, accept_encodings):
+        """Best variant the client accepts: br, then gzip, then identity"""
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and accept_encodings[encoding]:
+                return encoding
+        return 'identity'
+
+
+class PageCache:
+    """
+    Caches the output of views whose response is the same for every anonymous
+    visitor. The template runs once per process; later hits are served from
+    memory, and revalidations with a matching If-None-Match get a 304.
+    """
+
+    def __init__(self):
+        self._pages = {}  # endpoint -> CachedPage
+        self._lock = threading.Lock()
+
+    def _get(self, view, args, kwargs):
+        key = request.endpoint
+        with self._lock:
+            page = self._pages.get(key)
+        if page is None:
+            response = make_response(view(*args, **kwargs))
+            page = CachedPage(response.get_data(), response.mimetype)
+            with self._lock:
+                self._pages[key] = page
+            logger.info(f"Cached page {key} ({len(page.variants['identity'][0])} bytes, "
+                        f"variants: {', '.join(page.variants)})")
+        return page
+
+    def cached(self, max_age=3600):
+        """Decorator for views that render the same bytes for every visitor"""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if current_app.debug:
+                    return view(*args, **kwargs)
+                page = self._get(view, args, kwargs)
+                encoding = page.choose(request.accept_encodings)
+                body, etag = page.variants[encoding]
+
+                if any(request.if_none_match.contains(tag) for tag in page.etags):
+                    response = make_response('', 304)
+                else:
+                    response = make_response(body)
+                    response.mimetype = page.mimetype
+                    if encoding != 'identity':
+                        response.headers['Content-Encoding'] = encoding
+
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = f'public, max-age={max_age}'
+                response.vary.add('Accept-Encoding')
+                return response
+            return wrapper
+        return decorator
+
+    def clear(self):
+        """Drop every cached page, e.g. after editing templates in development"""
+        with self._lock:
+            self._pages.clear()
+
+
+page_cache = PageCache()
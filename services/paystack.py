@@ -1,18 +1,47 @@
 import os
+import hmac
+import hashlib
+import logging
 import requests
+from requests.adapters import HTTPAdapter
 from datetime import datetime, timedelta
 from models.database import db, User, Payment, PlanType
+from models.user_cache import user_cache
+from services.usage import usage_quota
+from services.metrics import span
+
+logger = logging.getLogger(__name__)
+
+USD_TO_GHS = 15.3  # Current USD to GHS conversion rate
+
+
+def usd_to_pesewas(amount_usd):
+    """Paystack expects amounts in pesewas - 100 pesewas = 1 GHS"""
+    return int(amount_usd * USD_TO_GHS * 100)
+
+
+def is_underpaid(payment, amount_pesewas):
+    """Whether Paystack reports less than the payment's price; an unreported amount is not checked"""
+    return amount_pesewas is not None and int(amount_pesewas) < usd_to_pesewas(payment.amount)
+
 
 class PaystackService:
     def __init__(self):
         self.api_key = os.environ.get('PAYSTACK_SECRET_KEY')
         if not self.api_key:
             raise ValueError('PAYSTACK_SECRET_KEY environment variable is not set')
-        self.base_url = 'https://api.paystack.co'
-        self.headers = {
+        self.base_url = os.environ.get('PAYSTACK_BASE_URL', 'https://api.paystack.co').rstrip('/')
+        # (connect, read) seconds; no Paystack call may block a worker indefinitely
+        self.timeout = (3.05, float(os.environ.get('PAYSTACK_TIMEOUT', 10)))
+
+        # One pooled, keep-alive session for every Paystack call
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=2, pool_maxsize=10))
+        self.session.mount('http://', HTTPAdapter(pool_connections=2, pool_maxsize=10))
+        self.session.headers.update({
             'Authorization': f'Bearer {self.api_key}',
             'Content-Type': 'application/json'
-        }
+        })
 
     def initialize_transaction(self, user_id, email, amount_usd, payment_type='one_time'):
         try:
@@ -21,9 +50,7 @@ class PaystackService:
             if not app_url:
                 raise ValueError("APP_URL environment variable is not set")
 
-            # Convert USD to GHS (Paystack expects amount in pesewas - 100 pesewas = 1 GHS)
-            amount_ghs = amount_usd * 15.3  # Current USD to GHS conversion rate
-            amount_pesewas = int(amount_ghs * 100)
+            amount_pesewas = usd_to_pesewas(amount_usd)
 
             data = {
                 'email': email,
@@ -36,19 +63,15 @@ class PaystackService:
                 }
             }
 
-            print(f"[Paystack] Using API Key: {self.api_key[:8]}...")
-            print(f"[Paystack] Using callback URL: {data['callback_url']}")
-            print(f"[Paystack] Amount: ${amount_usd:.2f} USD = {amount_ghs:.2f} GHS ({amount_pesewas} pesewas)")
-            print(f"[Paystack] Initializing transaction with data: {data}")
-            
-            response = requests.post(
-                f'{self.base_url}/transaction/initialize',
-                headers=self.headers,
-                json=data
-            )
+            logger.info(f"[Paystack] Initializing {payment_type} transaction for user {user_id}: "
+                        f"${amount_usd:.2f} USD ({amount_pesewas} pesewas)")
 
-            print(f"[Paystack] Response status: {response.status_code}")
-            print(f"[Paystack] Response body: {response.text}")
+            with span('paystack.initialize'):
+                response = self.session.post(
+                    f'{self.base_url}/transaction/initialize',
+                    json=data,
+                    timeout=self.timeout
+                )
 
             if response.status_code == 200:
                 result = response.json()
@@ -63,43 +86,99 @@ class PaystackService:
                 db.session.commit()
 
                 return result['data']['authorization_url'], result['data']['reference']
-            
+
             # If we get here, something went wrong
-            print(f"[Paystack] Error: Non-200 status code")
+            logger.error(f"[Paystack] Initialize failed with status {response.status_code}")
             return None, None
 
         except Exception as e:
-            print(f"[Paystack] Exception: {str(e)}")
+            logger.error(f"[Paystack] Exception: {str(e)}")
             raise
 
-    def verify_transaction(self, reference):
-        response = requests.get(
-            f'{self.base_url}/transaction/verify/{reference}',
-            headers=self.headers
-        )
+    def verify_webhook_signature(self, payload, signature):
+        """Paystack signs the raw request body with HMAC-SHA512 of the secret key"""
+        if not signature:
+            return False
+        expected = hmac.new(self.api_key.encode('utf-8'), payload, hashlib.sha512).hexdigest()
+        return hmac.compare_digest(expected, signature)
+
+    def handle_event(self, event):
+        """Process a verified webhook event; unknown events are acknowledged and ignored"""
+        if event.get('event') != 'charge.success':
+            logger.info(f"[Paystack] Ignoring webhook event {event.get('event')}")
+            return False
+        data = event.get('data') or {}
+        return self.apply_successful_payment(data.get('reference'), data.get('amount'))
+
+    def apply_successful_payment(self, reference, amount_pesewas=None):
+        """
+        Mark a payment successful and upgrade the user's plan, exactly once per
+        reference no matter how often Paystack redelivers the event.
+        """
+        if not reference:
+            return False
+
+        db.use_primary()
+        payment = Payment.query.filter_by(paystack_reference=reference).first()
+        if not payment:
+            logger.warning(f"[Paystack] Success for unknown reference {reference}")
+            return False
+        if is_underpaid(payment, amount_pesewas):
+            logger.error(f"[Paystack] Underpaid reference {reference}: {amount_pesewas} pesewas")
+            return False
+
+        # Only the first delivery flips the status; redeliveries update nothing
+        claimed = Payment.query.filter(
+            Payment.paystack_reference == reference,
+            Payment.status != 'success'
+        ).update({Payment.status: 'success'}, synchronize_session=False)
+        if not claimed:
+            db.session.rollback()
+            return True
 
+        # Update user's plan
+        user = User.query.get(payment.user_id)
+        if payment.payment_type == 'subscription':
+            user.current_plan = PlanType.SUBSCRIPTION
+            user.subscription_start = datetime.utcnow()
+            user.subscription_end = datetime.utcnow() + timedelta(days=30)
+        else:  # one_time payment
+            user.current_plan = PlanType.PAY_PER_PRESENTATION
+
+        db.session.commit()
+        usage_quota.invalidate(user.id)
+        user_cache.invalidate(user.id)
+        logger.info(f"[Paystack] Applied {payment.payment_type} payment {reference} for user {user.id}")
+        return True
+
+    def fetch_transaction(self, reference):
+        """
+        Look a transaction up on Paystack; returns its data dict or None.
+        Rate limiting and server errors raise, so callers can back off and retry.
+        """
+        with span('paystack.verify'):
+            response = self.session.get(
+                f'{self.base_url}/transaction/verify/{reference}',
+                timeout=self.timeout
+            )
+            if response.status_code == 429 or response.status_code >= 500:
+                response.raise_for_status()
         if response.status_code == 200:
-            result = response.json()
-            if result['data']['status'] == 'success':
-                # Update payment status
-                payment = Payment.query.filter_by(paystack_reference=reference).first()
-                if payment:
-                    payment.status = 'success'
-                    
-                    # Update user's plan
-                    user = User.query.get(payment.user_id)
-                    if payment.payment_type == 'subscription':
-                        user.current_plan = PlanType.SUBSCRIPTION
-                        user.subscription_start = datetime.utcnow()
-                        user.subscription_end = datetime.utcnow() + timedelta(days=30)
-                    else:  # one_time payment
-                        user.current_plan = PlanType.PAY_PER_PRESENTATION
-
-                    db.session.commit()
-                    return True
+            return response.json()['data']
+        return None
 
+    def verify_transaction(self, reference):
+        """Re-verify a transaction against Paystack and apply it if it succeeded"""
+        data = self.fetch_transaction(reference)
+        if data and data['status'] == 'success':
+            return self.apply_successful_payment(reference, data.get('amount'))
         return False
 
+    def payment_status(self, reference):
+        """Local payment status for a reference, without calling Paystack"""
+        db.use_primary()
+        return db.session.query(Payment.status).filter(Payment.paystack_reference == reference).scalar()
+
     def create_subscription(self, user_id, email):
         # Initialize transaction for subscription
         return self.initialize_transaction(user_id, email, 2.99, 'subscription')
@@ -110,5 +189,7 @@ class PaystackService:
             user.current_plan = PlanType.FREE
             user.subscription_end = datetime.utcnow()
             db.session.commit()
+            usage_quota.invalidate(user.id)
+            user_cache.invalidate(user.id)
             return True
         return False
@@ -0,0 +1,203 @@
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import logging
+import tempfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class StackSampler:
+    """
+    Samples one thread's Python stack every interval seconds from a helper
+    thread and counts identical stacks, giving collapsed-stack output that
+    flamegraph.pl or speedscope can render.
+    """
+
+    def __init__(self, thread_id, interval=0.005, max_seconds=300):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    @staticmethod
+    def _frame_name(frame):
+        code = frame.f_code
+        return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+    def _run(self):
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+            names = []
+            while frame is not None:
+                names.append(self._frame_name(frame))
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(names))] += 1
+            self.samples += 1
+
+
+class Profile:
+    """One profiled request or job"""
+
+    def __init__(self, profiler, name, user_id=None, request_id=None):
+        self.profiler = profiler
+        self.id = uuid.uuid4().hex  # never taken from the request, so callers cannot overwrite profiles
+        self.name = name
+        self.user_id = user_id
+        self.request_id = request_id[:128] if request_id else None
+        self.started_at = datetime.utcnow()
+        self._started = time.perf_counter()
+        self.sampler = StackSampler(threading.get_ident(), profiler.interval, profiler.max_seconds).start()
+        self.finished = False
+
+    def finish(self, status=None):
+        """Stop sampling and store the stacks; safe to call more than once"""
+        if self.finished:
+            return
+        self.finished = True
+        stacks = self.sampler.stop()
+        self.profiler.store(self, stacks, time.perf_counter() - self._started, status)
+
+
+class RequestProfiler:
+    """
+    Opt-in statistical profiling of selected requests and background jobs.
+    A request is profiled when an admin sends the X-Profile header or when it
+    is picked by 1-in-PROFILE_SAMPLE_RATE sampling; anything else pays only
+    for the endpoint check. Profiles are written as collapsed stacks plus a
+    small JSON summary under PROFILE_DIR, shared by every worker on the host.
+    """
+
+    HEADER = 'X-Profile'
+
+    def __init__(self, directory=None, sample_rate=None, interval=None, keep=200, max_seconds=300):
+        self.directory = directory or os.environ.get(
+            'PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'decksky-profiles'))
+        # 0 disables sampling; header-triggered profiles still work
+        self.sample_rate = sample_rate if sample_rate is not None else int(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+        self.interval = interval or float(os.environ.get('PROFILE_INTERVAL_MS', 5)) / 1000
+        self.keep = keep
+        self.max_seconds = max_seconds
+
+    def sampled(self):
+        return self.sample_rate > 0 and random.randrange(self.sample_rate) == 0
+
+    def wanted(self, headers, admin):
+        """Whether to profile this request: admin header or random sampling"""
+        if admin and headers.get(self.HEADER):
+            return True
+        return self.sampled()
+
+    @staticmethod
+    def clean_id(profile_id):
+        """Ids in lookups come from the URL, so keep them filename-safe"""
+        return ''.join(c for c in (profile_id or '') if c.isalnum() or c in '-_')[:64]
+
+    def start(self, name, user_id=None, request_id=None):
+        """Start sampling the calling thread; request_id (e.g. X-Request-ID) is kept as metadata only"""
+        return Profile(self, name, user_id, request_id)
+
+    @contextmanager
+    def job(self, name, force=False):
+        """Profile a background job run when forced or sampled"""
+        if not (force or self.sampled()):
+            yield None
+            return
+        profile = self.start(name)
+        status = 'ok'
+        try:
+            yield profile
+        except Exception as e:
+            status = type(e).__name__
+            raise
+        finally:
+            profile.finish(status)
+
+    def _path(self, profile_id, suffix):
+        return os.path.join(self.directory, f"{self.clean_id(profile_id)}{suffix}")
+
+    def store(self, profile, stacks, seconds, status):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self._path(profile.id, '.collapsed'), 'w') as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            summary = {
+                'id': profile.id,
+                'name': profile.name,
+                'user_id': profile.user_id,
+                'request_id': profile.request_id,
+                'status': status,
+                'started_at': profile.started_at.isoformat(),
+                'seconds': round(seconds, 3),
+                'samples': sum(stacks.values()),
+                'pid': os.getpid(),
+            }
+            with open(self._path(profile.id, '.json'), 'w') as f:
+                json.dump(summary, f)
+            logger.info(f"Stored profile {profile.id} for {profile.name} ({summary['seconds']}s, "
+                        f"{summary['samples']} samples)")
+            self._prune()
+        except OSError as e:
+            logger.error(f"Could not store profile {profile.id}: {e}")
+
+    def _summaries(self):
+        summaries = []
+        if not os.path.isdir(self.directory):
+            return summaries
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                try:
+                    with open(os.path.join(self.directory, name)) as f:
+                        summaries.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return summaries
+
+    def _prune(self):
+        summaries = sorted(self._summaries(), key=lambda s: s['started_at'], reverse=True)
+        for summary in summaries[self.keep:]:
+            for suffix in ('.json', '.collapsed'):
+                try:
+                    os.remove(self._path(summary['id'], suffix))
+                except FileNotFoundError:
+                    pass
+
+    def slowest(self, limit=50, name=None, request_id=None):
+        """Stored profile summaries, slowest first"""
+        summaries = [s for s in self._summaries() if (name is None or s['name'] == name)
+                     and (request_id is None or s.get('request_id') == request_id)]
+        return sorted(summaries, key=lambda s: s['seconds'], reverse=True)[:limit]
+
+    def collapsed(self, profile_id):
+        """Collapsed stacks for one profile, or None"""
+        try:
+            with open(self._path(profile_id, '.collapsed')) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+
+profiler = RequestProfiler()
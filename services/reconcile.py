@@ -0,0 +1,142 @@
+import os
+import time
+import random
+import socket
+import logging
+import requests
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from models.database import db, User, Payment, PlanType, JobLease
+from models.user_cache import user_cache
+from services.usage import usage_quota
+from services.paystack import is_underpaid
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = 'payment_reconcile'
+
+# Paystack statuses that will never turn into a success
+FINAL_FAILURE_STATUSES = {'failed', 'abandoned', 'reversed'}
+
+
+def _fetch_with_backoff(paystack, reference, retries=4, base_delay=0.5):
+    """Fetch one transaction, backing off exponentially (with jitter) on 429/5xx/network errors"""
+    for attempt in range(retries + 1):
+        try:
+            return reference, paystack.fetch_transaction(reference)
+        except requests.RequestException as e:
+            if attempt == retries:
+                logger.warning(f"[Reconcile] Giving up on {reference}: {e}")
+                return reference, e
+            time.sleep(base_delay * (2 ** attempt) * (1 + random.random()))
+
+
+def _apply_batch(payments, results):
+    """Apply one batch of Paystack results in a single transaction; returns per-outcome counts"""
+    counts = Counter()
+    upgrades = {}  # user_id -> payment_type, subscription wins over one_time
+
+    for payment in payments:
+        data = results.get(payment.paystack_reference)
+        if isinstance(data, Exception):
+            counts['errors'] += 1
+        elif data is None:
+            counts['not_found'] += 1
+        elif data.get('status') == 'success' and is_underpaid(payment, data.get('amount')):
+            # Same check as the webhook path: leave it pending for someone to look at
+            logger.error(f"[Reconcile] Underpaid reference {payment.paystack_reference}: "
+                         f"{data.get('amount')} pesewas")
+            counts['underpaid'] += 1
+        elif data.get('status') == 'success':
+            # Conditional, so a webhook that got there first is not applied twice
+            claimed = Payment.query.filter(
+                Payment.id == payment.id,
+                Payment.status == 'pending'
+            ).update({Payment.status: 'success'}, synchronize_session=False)
+            if claimed:
+                counts['succeeded'] += 1
+                if upgrades.get(payment.user_id) != 'subscription':
+                    upgrades[payment.user_id] = payment.payment_type
+            else:
+                counts['already_applied'] += 1
+        elif data.get('status') in FINAL_FAILURE_STATUSES:
+            Payment.query.filter(
+                Payment.id == payment.id,
+                Payment.status == 'pending'
+            ).update({Payment.status: 'failed'}, synchronize_session=False)
+            counts['failed'] += 1
+        else:
+            counts['still_pending'] += 1
+
+    now = datetime.utcnow()
+    subscribers = [user_id for user_id, kind in upgrades.items() if kind == 'subscription']
+    one_time = [user_id for user_id, kind in upgrades.items() if kind != 'subscription']
+    if subscribers:
+        User.query.filter(User.id.in_(subscribers)).update({
+            User.current_plan: PlanType.SUBSCRIPTION,
+            User.subscription_start: now,
+            User.subscription_end: now + timedelta(days=30)
+        }, synchronize_session=False)
+    if one_time:
+        User.query.filter(User.id.in_(one_time)).update(
+            {User.current_plan: PlanType.PAY_PER_PRESENTATION}, synchronize_session=False
+        )
+    db.session.commit()
+
+    for user_id in upgrades:
+        usage_quota.invalidate(user_id)
+        user_cache.invalidate(user_id)
+    return counts
+
+
+def reconcile_pending_payments(paystack, batch_size=100, max_workers=4, min_age_minutes=10):
+    """
+    Re-verify every pending payment older than min_age_minutes against Paystack.
+    Payments are scanned in id order through the (status, id) index,
+    each batch verified with at most max_workers concurrent requests and applied
+    in one transaction. Returns a report dict, or None if another run holds the lease.
+    """
+    holder = f"{socket.gethostname()}:{os.getpid()}"
+    if not JobLease.acquire(LEASE_NAME, holder, 600):
+        return None
+
+    db.use_primary()
+    started = time.perf_counter()
+    report = Counter()
+    cutoff = datetime.utcnow() - timedelta(minutes=min_age_minutes)
+    last_id = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while True:
+                payments = Payment.query.filter(
+                    Payment.status == 'pending',
+                    Payment.created_at < cutoff,
+                    Payment.id > last_id
+                ).order_by(Payment.id).limit(batch_size).all()
+                if not payments:
+                    break
+                last_id = payments[-1].id
+
+                results = dict(executor.map(
+                    lambda reference: _fetch_with_backoff(paystack, reference),
+                    [p.paystack_reference for p in payments if p.paystack_reference]
+                ))
+                report.update(_apply_batch(payments, results))
+                report['scanned'] += len(payments)
+                report['batches'] += 1
+                if not JobLease.acquire(LEASE_NAME, holder, 600):
+                    # Another worker took over; stop rather than verify the same payments twice
+                    logger.warning("[Reconcile] Lease lost, stopping early")
+                    report['lease_lost'] = 1
+                    break
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        JobLease.release(LEASE_NAME, holder)
+
+    report = dict(report)
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    logger.info(f"[Reconcile] {report}")
+    return report
@@ -0,0 +1,143 @@
+import os
+import time
+import socket
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime
+from models.database import db, Presentation, JobLease
+from services.usage import usage_quota
+from services.downloads import download_index
+from services.profiler import profiler
+
+logger = logging.getLogger(__name__)
+
+
+class ExpirySweeper:
+    """
+    Moves free-plan presentations past their expires_at to 'expired' in
+    bounded chunks and deletes their files. A database lease makes it safe
+    to run from every worker: only the lease holder sweeps.
+    """
+
+    LEASE_NAME = 'presentation_expiry_sweep'
+
+    def __init__(self, app=None, interval=None, chunk_size=200, lease_seconds=120):
+        self.interval = interval if interval is not None else float(os.environ.get('EXPIRY_SWEEP_INTERVAL', 600))
+        self.chunk_size = chunk_size
+        self.lease_seconds = lease_seconds
+        self.app = None
+        self.storage_dir = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.storage_dir = os.path.abspath(app.config['UPLOAD_FOLDER'])
+
+    @property
+    def holder(self):
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def ensure_started(self):
+        """Start the sweep thread once per process; an interval of 0 disables it"""
+        if not self.interval or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        thread = threading.Thread(target=self._run, name='expiry-sweeper', daemon=True)
+        thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                with self.app.app_context(), profiler.job('expiry_sweep'):
+                    self.run_once()
+            except Exception as e:
+                logger.error(f"Expiry sweep failed: {e}")
+
+    def _artifact_paths(self, file_path):
+        """The stored path and its copy in the download directory; nothing else is touched"""
+        paths = {os.path.join(self.storage_dir, os.path.basename(file_path))}
+        if os.path.isabs(file_path):
+            paths.add(os.path.abspath(file_path))
+        return list(paths)
+
+    def _delete_files(self, file_paths):
+        reclaimed, deleted = 0, 0
+        for file_path in file_paths:
+            for path in self._artifact_paths(file_path):
+                try:
+                    size = os.path.getsize(path)
+                    os.remove(path)
+                    download_index.unregister(path)
+                    reclaimed += size
+                    deleted += 1
+                except FileNotFoundError:
+                    continue
+                except OSError as e:
+                    logger.warning(f"Could not delete expired file {path}: {e}")
+        return deleted, reclaimed
+
+    def run_once(self):
+        """
+        Expire every overdue presentation, one chunk per transaction.
+        Returns a report dict, or None if another worker holds the lease.
+        """
+        if not JobLease.acquire(self.LEASE_NAME, self.holder, self.lease_seconds):
+            return None
+
+        started = time.perf_counter()
+        report = {'rows': 0, 'files': 0, 'bytes': 0, 'chunks': 0}
+        try:
+            while True:
+                rows = db.session.query(Presentation.id, Presentation.user_id, Presentation.file_path).filter(
+                    Presentation.status == 'active',
+                    Presentation.expires_at < datetime.utcnow()
+                ).order_by(Presentation.expires_at).limit(self.chunk_size).all()
+                if not rows:
+                    break
+
+                ids_by_user = defaultdict(list)
+                for row in rows:
+                    ids_by_user[row.user_id].append(row.id)
+                expired = 0
+                for user_id, ids in ids_by_user.items():
+                    # Only rows this UPDATE flips count against the quota; another worker or a
+                    # delete may have got to some of them since the SELECT
+                    flipped = Presentation.query.filter(
+                        Presentation.id.in_(ids),
+                        Presentation.status == 'active'
+                    ).update({Presentation.status: 'expired'}, synchronize_session=False)
+                    if flipped:
+                        usage_quota.presentations_removed(user_id, flipped)
+                    expired += flipped
+                db.session.commit()
+
+                # Files go only after the rows are committed, so a crash never leaves rows without files
+                files, reclaimed = self._delete_files([row.file_path for row in rows if row.file_path])
+                report['rows'] += expired
+                report['files'] += files
+                report['bytes'] += reclaimed
+                report['chunks'] += 1
+
+                if len(rows) < self.chunk_size:
+                    break
+                if not JobLease.acquire(self.LEASE_NAME, self.holder, self.lease_seconds):
+                    logger.warning("Lost expiry sweep lease mid-run, stopping")
+                    break
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            JobLease.release(self.LEASE_NAME, self.holder)
+
+        report['seconds'] = round(time.perf_counter() - started, 3)
+        logger.info(f"Expiry sweep: {report['rows']} presentations expired, "
+                    f"{report['files']} files / {report['bytes']} bytes reclaimed in {report['seconds']}s")
+        return report
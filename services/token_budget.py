@@ -0,0 +1,147 @@
+"""
+Token counting for completion sizing. The supported default is a word and
+character heuristic (about 1.4 tokens per English word), which needs no
+downloads. If tiktoken is installed and TIKTOKEN_CACHE_DIR points at
+pre-fetched encodings, exact counts are used instead; without the cache
+directory tiktoken would fetch BPE files over the network on first use, so
+it is left alone.
+"""
+import os
+import math
+import logging
+from collections import namedtuple
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional; see the module docstring
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# (context window, maximum completion tokens) per chat model
+MODEL_LIMITS = {
+    'gpt-3.5-turbo': (16385, 4096),
+    'gpt-4o-mini': (128000, 16384),
+    'gpt-4o': (128000, 16384),
+    'gpt-4-turbo': (128000, 4096),
+}
+DEFAULT_LIMITS = (16385, 4096)
+
+# Typical business prose, used to measure tokens per word with the model's tokenizer
+SAMPLE_TEXT = ("Implement AI-powered customer analytics to increase retention by 25% through "
+               "personalized engagement strategies and predictive behavior modeling across 12 regions.")
+
+# Headroom for chat formatting tokens the prompt count does not see
+MESSAGE_OVERHEAD = 16
+
+# One planned completion: which items it covers, its max_tokens and whether the prompt keeps its examples
+PlannedCall = namedtuple('PlannedCall', 'start count max_tokens include_examples')
+
+
+def model_limits(model):
+    limits = MODEL_LIMITS.get(model)
+    if not limits:
+        # Dated snapshots such as gpt-4o-2024-08-06 share their base model's limits
+        limits = next((l for name, l in MODEL_LIMITS.items() if model.startswith(name + '-')), DEFAULT_LIMITS)
+    return limits
+
+
+@lru_cache(maxsize=8)
+def _encoding(model):
+    if tiktoken is None or not os.environ.get('TIKTOKEN_CACHE_DIR'):
+        _log_heuristic()
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding('cl100k_base')
+    except Exception as e:  # e.g. the BPE files cannot be downloaded
+        logger.warning(f"tiktoken unavailable for {model}, estimating token counts: {e}")
+        return None
+
+
+@lru_cache(maxsize=1)
+def _log_heuristic():
+    logger.info("Estimating token counts heuristically (install tiktoken and set TIKTOKEN_CACHE_DIR "
+                "for exact counts)")
+
+
+def count_tokens(text, model='gpt-3.5-turbo'):
+    """Tokens in text for model, exact with tiktoken and a conservative estimate without"""
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return max(math.ceil(len(text) / 4), math.ceil(len(text.split()) * 4 / 3))
+
+
+@lru_cache(maxsize=8)
+def tokens_per_word(model='gpt-3.5-turbo'):
+    """Measured on SAMPLE_TEXT with the model's tokenizer; English prose averages about 1.4 without it"""
+    if _encoding(model) is None:
+        return 1.4
+    return count_tokens(SAMPLE_TEXT, model) / len(SAMPLE_TEXT.split())
+
+
+class TokenBudget:
+    """
+    Sizes completions for prompts that ask for a number of similar items
+    (outline sections, insights). Output is estimated from the words each
+    item should contain; max_tokens is set to that estimate plus a margin,
+    the prompt's examples are dropped when keeping them would not leave room
+    for the output, and work that still does not fit one completion is split
+    across several. LLM_MAX_OUTPUT_TOKENS lowers the per-call output cap.
+    """
+
+    def __init__(self, model='gpt-3.5-turbo', margin=1.25, max_output=None):
+        self.model = model
+        self.margin = margin
+        self.context_window, model_max_output = model_limits(model)
+        cap = max_output or int(os.environ.get('LLM_MAX_OUTPUT_TOKENS', 0)) or model_max_output
+        self.max_output = min(cap, model_max_output)
+
+    def words(self, count):
+        """Estimated tokens for count words of generated prose"""
+        return count * tokens_per_word(self.model)
+
+    def completion_tokens(self, tokens, minimum=16):
+        """max_tokens for an expected completion of tokens, with the safety margin"""
+        return min(self.max_output, max(minimum, math.ceil(tokens * self.margin)))
+
+    def available(self, prompt_tokens):
+        """Largest completion a prompt of prompt_tokens leaves room for"""
+        return max(0, min(self.max_output, self.context_window - prompt_tokens - MESSAGE_OVERHEAD))
+
+    def plan(self, items, tokens_per_item, build_prompt, overhead=20):
+        """
+        Split items into completions. build_prompt(count, include_examples)
+        must return the prompt for a call of count items; overhead is the
+        fixed output around the items (JSON wrapper, separators).
+        """
+        per_item = tokens_per_item * self.margin
+
+        def fits(count, include_examples):
+            prompt_tokens = count_tokens(build_prompt(count, include_examples), self.model)
+            return overhead + count * per_item <= self.available(prompt_tokens)
+
+        for include_examples in (True, False):
+            if fits(items, include_examples):
+                return [PlannedCall(0, items, self.completion_tokens(overhead + items * tokens_per_item),
+                                    include_examples)]
+
+        # Too much for one completion: find the largest batch that fits, then spread items evenly
+        include_examples = fits(1, True)
+        batch = max(1, math.floor((self.available(count_tokens(build_prompt(items, include_examples), self.model))
+                                   - overhead) / per_item))
+        while batch > 1 and not fits(batch, include_examples):
+            batch -= 1
+        calls = math.ceil(items / batch)
+        size, extra = divmod(items, calls)
+        planned, start = [], 0
+        for i in range(calls):
+            count = size + (1 if i < extra else 0)
+            planned.append(PlannedCall(start, count, self.completion_tokens(overhead + count * tokens_per_item),
+                                       include_examples))
+            start += count
+        logger.info(f"Split {items} items into {calls} calls of up to {batch} for {self.model}")
+        return planned
@@ -0,0 +1,138 @@
+import time
+import logging
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import and_, case, or_
+from models.database import db, User, PlanType, PLAN_LIMITS
+from models.user_cache import user_cache
+
+logger = logging.getLogger(__name__)
+
+Entitlement = namedtuple('Entitlement', ['plan', 'limits'])
+Reservation = namedtuple('Reservation', ['user_id', 'plan', 'num_slides'])
+
+USAGE_WINDOW = timedelta(days=30)
+
+
+class UsageQuota:
+    """
+    Enforces plan limits with single conditional UPDATE statements, so two
+    concurrent generations can never both take the last slot.
+    """
+
+    def __init__(self, entitlement_ttl=60):
+        self.entitlement_ttl = entitlement_ttl
+        self._entitlements = {}  # user_id -> (loaded_at, Entitlement)
+        self._lock = threading.Lock()
+
+    def entitlements(self, user_id):
+        """The user's plan and limits, cached for entitlement_ttl seconds"""
+        with self._lock:
+            cached = self._entitlements.get(user_id)
+        if cached and time.time() - cached[0] < self.entitlement_ttl:
+            return cached[1]
+
+        plan = db.session.query(User.current_plan).filter(User.id == user_id).scalar()
+        entitlement = Entitlement(plan, PLAN_LIMITS.get(plan)) if plan else None
+        with self._lock:
+            self._entitlements[user_id] = (time.time(), entitlement)
+        return entitlement
+
+    def invalidate(self, user_id):
+        """Drop cached entitlements, e.g. after a plan change"""
+        with self._lock:
+            self._entitlements.pop(user_id, None)
+
+    def _claim(self, user_id, plan, limits, num_slides):
+        """Run the conditional UPDATE for one plan; returns the number of rows updated"""
+        query = User.query.filter(User.id == user_id, User.current_plan == plan)
+        values = {User.active_presentations_count: User.active_presentations_count + 1}
+
+        if plan == PlanType.FREE:
+            query = query.filter(User.active_presentations_count < limits['max_active'])
+
+        elif plan == PlanType.SUBSCRIPTION:
+            now = datetime.utcnow()
+            # Reset the monthly window lazily, in the same statement that claims usage
+            stale = or_(User.last_count_reset.is_(None), User.last_count_reset < now - USAGE_WINDOW)
+            query = query.filter(or_(
+                and_(stale, num_slides <= limits['monthly_slides']),
+                and_(
+                    User.monthly_presentations_count < limits['monthly_presentations'],
+                    User.monthly_slides_count + num_slides <= limits['monthly_slides']
+                )
+            ))
+            values.update({
+                User.monthly_presentations_count: case((stale, 1), else_=User.monthly_presentations_count + 1),
+                User.monthly_slides_count: case((stale, num_slides), else_=User.monthly_slides_count + num_slides),
+                User.last_count_reset: case((stale, now), else_=User.last_count_reset),
+            })
+
+        return query.update(values, synchronize_session=False)
+
+    def reserve(self, user_id, num_slides):
+        """
+        Claim usage for one presentation of num_slides slides.
+        Returns a Reservation, or None if the user's plan does not allow it.
+        """
+        for attempt in range(2):
+            entitlement = self.entitlements(user_id)
+            if not entitlement or not entitlement.limits:
+                return None
+            limits = entitlement.limits
+            if limits['max_slides'] is not None and num_slides > limits['max_slides']:
+                return None
+
+            try:
+                updated = self._claim(user_id, entitlement.plan, limits, num_slides)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+            if updated:
+                user_cache.invalidate(user_id)
+                return Reservation(user_id, entitlement.plan, num_slides)
+
+            # The plan may have changed under a stale cache entry; re-read it once
+            self.invalidate(user_id)
+        return None
+
+    def release(self, reservation):
+        """Give back a reservation whose presentation was never created"""
+        values = {
+            User.active_presentations_count: case(
+                (User.active_presentations_count > 0, User.active_presentations_count - 1), else_=0
+            )
+        }
+        if reservation.plan == PlanType.SUBSCRIPTION:
+            values.update({
+                User.monthly_presentations_count: case(
+                    (User.monthly_presentations_count > 0, User.monthly_presentations_count - 1), else_=0
+                ),
+                User.monthly_slides_count: case(
+                    (User.monthly_slides_count >= reservation.num_slides,
+                     User.monthly_slides_count - reservation.num_slides),
+                    else_=0
+                ),
+            })
+        try:
+            User.query.filter(User.id == reservation.user_id).update(values, synchronize_session=False)
+            db.session.commit()
+            user_cache.invalidate(reservation.user_id)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to release usage for user {reservation.user_id}: {e}")
+
+    def presentations_removed(self, user_id, count=1):
+        """Free active-presentation slots when presentations expire or are deleted"""
+        User.query.filter(User.id == user_id).update({
+            User.active_presentations_count: case(
+                (User.active_presentations_count > count, User.active_presentations_count - count), else_=0
+            )
+        }, synchronize_session=False)
+        user_cache.invalidate(user_id)
+
+
+usage_quota = UsageQuota()
@@ -2,20 +2,37 @@ import os
 import json
 import logging
 import random
+import time
 import uuid
-from google.oauth2 import service_account
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+import threading
 from flask import url_for, session
-import openai
+from services.metrics import span
+from services.llm_usage import usage_recorder
+from services.token_budget import TokenBudget
+from services.cancellation import GenerationCancelled, raise_if_cancelled
+from services.outline import (parse_sections, clean_section, outline_sections, outline_repairs,
+                              outline_tokens_saved)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Configure OpenAI
-openai_client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+# The OpenAI client is created on first use in each process; importing openai is slow
+_openai_client = None
+_openai_pid = None
+_openai_lock = threading.Lock()
+
+
+def get_openai_client():
+    """This process's OpenAI client, rebuilt after a fork so pooled connections are never shared"""
+    global _openai_client, _openai_pid
+    if _openai_pid != os.getpid():
+        with _openai_lock:
+            if _openai_pid != os.getpid():
+                import openai
+                _openai_client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+                _openai_pid = os.getpid()
+    return _openai_client
 
 # Google Slides API scope
 SCOPES = ['https://www.googleapis.com/auth/presentations']
@@ -40,7 +57,10 @@ class PlaceholderType:
 
 class GoogleSlidesGenerator:
     def __init__(self, credentials_path=None):
-        self.service = self._create_slides_service(credentials_path)
+        self.credentials_path = credentials_path
+        # httplib2 connections are not thread-safe, so every thread gets its own client,
+        # built on first use (and again in a forked child)
+        self._local = threading.local()
         # Modern color palette
         self.theme = {
             'primary': {'red': 0.27, 'green': 0.36, 'blue': 0.87},  # Royal Blue
@@ -50,9 +70,25 @@ class GoogleSlidesGenerator:
             'text': {'red': 0.13, 'green': 0.13, 'blue': 0.13}  # Dark Gray
         }
 
+    @property
+    def service(self):
+        """This thread's Slides client"""
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.service = self._create_slides_service(self.credentials_path)
+            local.pid = os.getpid()
+        return local.service
+
     def _create_slides_service(self, credentials_path=None):
         """Initialize the Google Slides service with credentials."""
+        from google.oauth2 import service_account
+        from google.oauth2.credentials import Credentials
+        from google.auth.credentials import AnonymousCredentials
+        from googleapiclient.discovery import build
         try:
+            # Alternative API root, e.g. the local fake used by benchmarks/
+            api_root = os.getenv('SLIDES_API_ROOT')
+
             # Try to get credentials from environment variable first
             creds_json = os.getenv('GOOGLE_CREDENTIALS_JSON')
             if creds_json:
@@ -81,6 +117,10 @@ class GoogleSlidesGenerator:
                     'token.json', SCOPES)
                 logger.info("Using default credentials from token.json")
             
+            elif api_root:
+                credentials = AnonymousCredentials()
+                logger.info(f"Using anonymous credentials against {api_root}")
+
             else:
                 logger.error("No valid credentials found")
                 raise ValueError(
@@ -89,7 +129,8 @@ class GoogleSlidesGenerator:
                 )
                 
             # Build the service
-            service = build('slides', 'v1', credentials=credentials)
+            client_options = {'api_endpoint': api_root} if api_root else None
+            service = build('slides', 'v1', credentials=credentials, client_options=client_options)
             logger.info("Successfully initialized Slides service")
             return service
             
@@ -404,104 +445,189 @@ class GoogleSlidesGenerator:
 
         return requests
 
-    def _generate_content(self, topic, num_slides):
-        """Generate content for the presentation using OpenAI."""
-        try:
-            logger.info(f"Generating content for {num_slides} slides")
-            
-            # Create a detailed prompt
-            prompt = f"""Create a detailed presentation outline on "{topic}" with {num_slides} sections.
-            For each section, provide:
-            1. A clear, engaging title (2-5 words)
-            2. 4-6 detailed bullet points that:
-               - Are complete thoughts (10-15 words each)
-               - Include specific examples, data, or insights
-               - Flow logically from one point to the next
-               - Avoid vague statements
-            
-            Format as JSON:
-            {{
+    # Outline sizing for the token budget: a 2-5 word title and up to 6 points of up to 15 words
+    OUTLINE_MODEL = "gpt-3.5-turbo"
+    TITLE_WORDS = 5
+    POINTS_PER_SECTION = 6
+    WORDS_PER_POINT = 15
+    # Follow-up rounds for sections still missing after the first repair
+    MAX_REPAIR_ROUNDS = 2
+
+    def _outline_prompt(self, topic, count, total, start=0, include_examples=True, previous_titles=()):
+        """Prompt for sections start+1..start+count of a total-section outline"""
+        if count == total:
+            scope = f'Create a detailed presentation outline on "{topic}" with {count} sections.'
+            flow = """- First section introduces the topic
+            - Middle sections develop key ideas
+            - Final section concludes with takeaways"""
+        else:
+            scope = (f'Create sections {start + 1}-{start + count} of a {total}-section presentation outline '
+                     f'on "{topic}" ({count} sections).')
+            flow = "- Section 1 introduces the topic" if start == 0 else (
+                f"- Continue from the earlier sections: {'; '.join(previous_titles)}")
+            if start + count == total:
+                flow += "\n            - The last section concludes with takeaways"
+        if include_examples:
+            schema = """{
                 "sections": [
-                    {{
+                    {
                         "title": "Section Title",
                         "points": [
                             "Detailed point 1 with specific example",
                             "Detailed point 2 with data or insight",
                             ...
                         ]
-                    }},
+                    },
                     ...
                 ]
-            }}
+            }"""
+        else:
+            schema = '{"sections": [{"title": "...", "points": ["...", "..."]}]}'
+        return f"""{scope}
+            For each section, provide:
+            1. A clear, engaging title (2-5 words)
+            2. 4-6 detailed bullet points that:
+               - Are complete thoughts (10-15 words each)
+               - Include specific examples, data, or insights
+               - Flow logically from one point to the next
+               - Avoid vague statements
+            
+            Format as JSON:
+            {schema}
             
             Make sure:
-            - First section introduces the topic
-            - Middle sections develop key ideas
-            - Final section concludes with takeaways
+            {flow}
             - Each point is substantive and informative
             - No placeholder or generic content"""
 
-            # Get completion from OpenAI using new client interface
-            client = openai.OpenAI()
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                max_tokens=2000
+    def _repair_prompt(self, topic, sections, missing):
+        """Prompt asking only for the sections at the missing indexes, with the rest of the outline as context"""
+        outline = '\n'.join(
+            f"            {i + 1}. {section['title'] if section else '(to write)'}" for i, section in enumerate(sections)
+        )
+        numbers = ', '.join(str(i + 1) for i in missing)
+        return f"""A presentation outline on "{topic}" has these sections:
+{outline}
+
+            Write only sections {numbers} ({len(missing)} sections), in that order, so they fit between their neighbours.
+            For each, provide a clear, engaging title (2-5 words) and 4-6 detailed bullet points
+            (complete thoughts of 10-15 words with specific examples, data, or insights).
+
+            Format as JSON:
+            {{"sections": [{{"title": "...", "points": ["...", "..."]}}]}}"""
+
+    def _generate_content(self, topic, num_slides, cancel_event=None):
+        """
+        Generate content for the presentation using OpenAI. Sections that are
+        missing, truncated or invalid are re-requested on their own instead
+        of regenerating the whole outline. Setting cancel_event stops before
+        the next completion with GenerationCancelled.
+        """
+        try:
+            logger.info(f"Generating content for {num_slides} slides")
+
+            # Size max_tokens to the outline, splitting big decks across several completions
+            budget = TokenBudget(self.OUTLINE_MODEL)
+            section_tokens = (budget.words(self.TITLE_WORDS) + 12
+                              + self.POINTS_PER_SECTION * (budget.words(self.WORDS_PER_POINT) + 4))
+            plan = budget.plan(
+                num_slides, section_tokens,
+                lambda count, include_examples: self._outline_prompt(topic, count, num_slides, 0, include_examples)
             )
 
-            # Parse response using new response format
-            content = response.choices[0].message.content.strip()
-            
-            try:
-                # Parse JSON response
-                data = json.loads(content)
-                
-                # Validate response format
-                if not isinstance(data, dict) or 'sections' not in data:
-                    raise ValueError("Invalid response format")
-                
-                sections = data['sections']
-                if not sections or len(sections) < num_slides:
-                    raise ValueError(f"Not enough sections generated (got {len(sections)}, need {num_slides})")
-                
-                # Validate each section
-                for section in sections:
-                    if not isinstance(section, dict):
-                        raise ValueError("Invalid section format")
-                    
-                    if 'title' not in section or not section['title'].strip():
-                        raise ValueError("Missing or empty section title")
-                    
-                    if 'points' not in section or not section['points']:
-                        raise ValueError("Missing or empty section points")
-                    
-                    if len(section['points']) < 3:
-                        raise ValueError(f"Not enough points in section '{section['title']}'")
-                
-                return sections[:num_slides]
-                
-            except json.JSONDecodeError:
-                raise ValueError("Failed to parse OpenAI response as JSON")
-                
+            sections = [None] * num_slides
+            outline_tokens = 0
+            for call in plan:
+                raise_if_cancelled(cancel_event)
+                previous_titles = [section['title'] for section in sections[:call.start] if section]
+                prompt = self._outline_prompt(topic, call.count, num_slides, call.start, call.include_examples,
+                                              previous_titles)
+                candidates, tokens = self._request_sections(prompt, call.max_tokens, 'generate_content')
+                outline_tokens += tokens
+                for offset, candidate in enumerate(candidates[:call.count]):
+                    sections[call.start + offset] = clean_section(candidate)
+
+            missing = [i for i, section in enumerate(sections) if section is None]
+            outline_sections.inc(num_slides - len(missing), result='valid')
+            if missing:
+                self._repair_sections(topic, sections, missing, budget, section_tokens, outline_tokens,
+                                      cancel_event)
+            return sections
+
+        except GenerationCancelled:
+            raise
         except Exception as e:
             logger.error(f"Error generating content: {str(e)}")
             raise ValueError("Failed to generate presentation content")
 
-    def create_presentation(self, title, topic, num_slides=5):
-        """Create a presentation with consistent styling and layout."""
+    def _repair_sections(self, topic, sections, missing, budget, section_tokens, outline_tokens, cancel_event=None):
+        """Fill sections[i] for every missing i with targeted completions, or raise ValueError"""
+        logger.warning(f"Repairing {len(missing)} of {len(sections)} outline sections")
+        invalid, repair_tokens = len(missing), 0
+        for _ in range(self.MAX_REPAIR_ROUNDS):
+            if not missing:
+                break
+            plan = budget.plan(len(missing), section_tokens,
+                               lambda count, include_examples: self._repair_prompt(topic, sections, missing[:count]))
+            for call in plan:
+                raise_if_cancelled(cancel_event)
+                batch = missing[call.start:call.start + call.count]
+                candidates, tokens = self._request_sections(
+                    self._repair_prompt(topic, sections, batch), call.max_tokens, 'repair_content')
+                outline_repairs.inc()
+                repair_tokens += tokens
+                for index, candidate in zip(batch, candidates):
+                    sections[index] = clean_section(candidate)
+            missing = [i for i in missing if sections[i] is None]
+
+        outline_sections.inc(invalid - len(missing), result='repaired')
+        if missing:
+            outline_sections.inc(len(missing), result='failed')
+            raise ValueError(f"Could not repair outline sections {[i + 1 for i in missing]}")
+        # Regenerating the whole outline would have cost the original calls again
+        outline_tokens_saved.inc(max(0, outline_tokens - repair_tokens))
+        logger.info(f"Repaired outline with {repair_tokens} tokens instead of about {outline_tokens}")
+
+    def _request_sections(self, prompt, max_tokens, template):
+        """One JSON-mode outline completion; returns (candidate sections, tokens used)"""
+        client = get_openai_client()
+        started = time.perf_counter()
         try:
-            # Create new presentation
-            presentation = {'title': title}
-            presentation = self.service.presentations().create(body=presentation).execute()
-            presentation_id = presentation.get('presentationId')
+            with span('openai.chat'):
+                response = client.chat.completions.create(
+                    model=self.OUTLINE_MODEL,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.7,
+                    max_tokens=max_tokens,
+                    response_format={"type": "json_object"}
+                )
+        except Exception as e:
+            usage_recorder.record_completion(template, self.OUTLINE_MODEL, started, max_tokens, error=e)
+            raise
+        usage_recorder.record_completion(template, self.OUTLINE_MODEL, started, max_tokens, response=response)
 
-            # Generate content
+        choice = response.choices[0]
+        if choice.finish_reason == 'length':
+            logger.warning(f"Outline completion hit max_tokens={max_tokens}; keeping the complete sections")
+        usage = getattr(response, 'usage', None)
+        return parse_sections(choice.message.content or ''), getattr(usage, 'total_tokens', 0) or 0
+
+    @span('slides.create_presentation')
+    def create_presentation(self, title, topic, num_slides=5, cancel_event=None):
+        """Create a presentation with consistent styling and layout; cancel_event stops the outline calls."""
+        try:
+            # Generate content first so a failed outline never leaves an empty presentation behind
             logger.info(f"Generating content for topic: {topic}")
-            sections = self._generate_content(topic, num_slides)
+            sections = self._generate_content(topic, num_slides, cancel_event)
             if not sections:
                 raise ValueError("No content generated")
 
+            # Create new presentation
+            presentation = {'title': title}
+            with span('slides.create'):
+                presentation = self.service.presentations().create(body=presentation).execute()
+            presentation_id = presentation.get('presentationId')
+
             # Start with requests for title slide
             requests = self._create_title_slide(presentation_id, title, f"Topic: {topic}")
 
@@ -520,8 +646,9 @@ class GoogleSlidesGenerator:
 
             # Execute all requests
             body = {'requests': requests}
-            response = self.service.presentations().batchUpdate(
-                presentationId=presentation_id, body=body).execute()
+            with span('slides.batch_update'):
+                response = self.service.presentations().batchUpdate(
+                    presentationId=presentation_id, body=body).execute()
 
             return presentation_id
 
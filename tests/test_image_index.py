@@ -0,0 +1,41 @@
+from io import BytesIO
+
+from PIL import Image
+
+from crawlers.image_index import PerceptualHashIndex
+
+
+def png(shade):
+    """A small left-to-right gradient; different shades hash differently"""
+    image = Image.new('L', (32, 32))
+    image.putdata([((x * shade) + y * 3) % 256 for y in range(32) for x in range(32)])
+    buffer = BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def test_near_duplicates_rejected_only_within_a_deck(tmp_path):
+    index = PerceptualHashIndex(threshold=6)
+    assert index.store('a', png(7), str(tmp_path), 'one.png') == 'one.png'
+    assert index.store('a', png(7), str(tmp_path), 'two.png') is None
+    assert index.store('b', png(7), str(tmp_path), 'three.png') == 'one.png'
+
+
+def test_released_deck_accepts_the_image_again(tmp_path):
+    index = PerceptualHashIndex(threshold=6)
+    index.store('a', png(7), str(tmp_path), 'one.png')
+    index.release_deck('a')
+    assert index.store('a', png(7), str(tmp_path), 'again.png') == 'one.png'
+
+
+def test_deck_hashes_are_bounded_by_count_and_age(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr('crawlers.image_index.time.time', lambda: clock[0])
+    index = PerceptualHashIndex(max_decks=3, deck_ttl=60)
+    for deck in range(10):
+        index.store(deck, png(7), str(tmp_path), f'{deck}.png')
+    assert list(index._decks) == [7, 8, 9]
+
+    clock[0] += 61
+    index.store('new', png(7), str(tmp_path), 'new.png')
+    assert list(index._decks) == ['new']
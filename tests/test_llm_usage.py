@@ -0,0 +1,76 @@
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, text
+
+from models.database import db, LLMUsage, LLMUsageRollup
+from models.migrations import MIGRATIONS_DIR, apply_migrations, migration_files
+from services.llm_usage import UsageRecorder
+
+
+def usage_row(created_at, **fields):
+    row = {'created_at': created_at, 'template': 'outline', 'model': 'gpt-3.5-turbo', 'max_tokens': 500,
+           'prompt_tokens': 100, 'completion_tokens': 50, 'cost_usd': 0.0001, 'latency_ms': 300.0}
+    row.update(fields)
+    return row
+
+
+def stamp(engine, versions):
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE schema_migrations (version VARCHAR(255) PRIMARY KEY, applied_at TIMESTAMP)'))
+        for version in versions:
+            conn.execute(text('INSERT INTO schema_migrations (version) VALUES (:v)'), {'v': version})
+
+
+def test_dialect_specific_migrations_replace_the_generic_file():
+    sqlite = dict(migration_files('sqlite'))
+    postgres = dict(migration_files('postgresql'))
+    assert sqlite['005_llm_usage'] == '005_llm_usage.sql'
+    assert postgres['005_llm_usage'] == '005_llm_usage.postgresql.sql'
+    assert sqlite['007_llm_usage_rowid'] == '007_llm_usage_rowid.sqlite.sql'
+    assert postgres['007_llm_usage_rowid'] is None
+
+
+def test_llm_usage_migration_assigns_ids_on_sqlite(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrate.db'}")
+    stamp(engine, [v for v, _ in migration_files('sqlite') if not v.startswith(('005_', '007_'))])
+
+    assert apply_migrations(engine) == ['005_llm_usage', '007_llm_usage_rowid']
+    with engine.begin() as conn:
+        conn.execute(LLMUsage.__table__.insert(), [usage_row(datetime.utcnow())])
+        assert conn.execute(text('SELECT id FROM llm_usage')).scalar() is not None
+
+
+def test_rowid_migration_repairs_tables_from_the_serial_ddl(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'repair.db'}")
+    stamp(engine, [v for v, _ in migration_files('sqlite') if not v.startswith('007_')])
+    with open(os.path.join(MIGRATIONS_DIR, '005_llm_usage.postgresql.sql')) as f:
+        serial_ddl = [s for s in f.read().split(';') if s.strip()]
+    with engine.begin() as conn:
+        for statement in serial_ddl:
+            conn.execute(text(statement))
+        conn.execute(LLMUsage.__table__.insert(), [usage_row(datetime.utcnow()) for _ in range(3)])
+        assert conn.execute(text('SELECT count(*) FROM llm_usage WHERE id IS NULL')).scalar() == 3
+
+    apply_migrations(engine)
+    with engine.begin() as conn:
+        assert conn.execute(text('SELECT count(*) FROM llm_usage')).scalar() == 3
+        assert conn.execute(text('SELECT count(*) FROM llm_usage WHERE id IS NULL')).scalar() == 0
+
+
+def test_rollup_picks_up_rows_flushed_after_their_hour(app):
+    recorder = UsageRecorder(app, retention_days=0)
+    hour = (datetime.utcnow() - timedelta(hours=3)).replace(minute=0, second=0, microsecond=0)
+    with app.app_context():
+        db.session.execute(LLMUsage.__table__.insert(), [usage_row(hour + timedelta(minutes=10))])
+        db.session.commit()
+        assert recorder.rollup() > 0
+
+        # A worker's buffer lands after the hour was rolled up
+        db.session.execute(LLMUsage.__table__.insert(), [usage_row(hour + timedelta(minutes=50))])
+        db.session.commit()
+        recorder.rollup()
+
+        rollups = LLMUsageRollup.query.filter(LLMUsageRollup.hour == hour).all()
+        assert [r.calls for r in rollups] == [2]
+        assert sum(entry['calls'] for entry in recorder.report(hour)) == 2
@@ -0,0 +1,52 @@
+import base64
+from types import SimpleNamespace
+
+from apis.openai_api import IMAGE_PRICES, ImageCache, OpenAIClient
+
+
+def test_image_cache_is_bounded_by_bytes():
+    cache = ImageCache(max_bytes=10)
+    cache.put('a', b'1234')
+    cache.put('b', b'1234')
+    assert cache.get('a') == b'1234'  # now most recently used
+    cache.put('c', b'1234')
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert cache.size == 8
+
+
+def test_image_cache_replaces_entries_and_skips_oversized_images():
+    cache = ImageCache(max_bytes=10)
+    cache.put('a', b'1234')
+    cache.put('a', b'123456')
+    assert cache.size == 6
+    cache.put('huge', b'x' * 11)
+    assert cache.get('huge') is None and cache.get('a') == b'123456'
+
+
+class FakeImages:
+    def __init__(self):
+        self.prompts = []
+
+    def generate(self, model, prompt, size, response_format, n):
+        self.prompts.append(prompt)
+        data = SimpleNamespace(b64_json=base64.b64encode(prompt.encode()).decode())
+        return SimpleNamespace(data=[data])
+
+
+def client_with_fake_images():
+    client = OpenAIClient('sk-test')
+    client.client = SimpleNamespace(images=FakeImages())
+    return client
+
+
+def test_generate_images_pays_once_per_distinct_prompt(monkeypatch):
+    monkeypatch.setattr('apis.openai_api.image_cache', ImageCache())
+    client = client_with_fake_images()
+    prompts = ['solar farm', 'wind turbine', 'solar farm', 'solar farm']
+
+    results = client.generate_images(prompts, max_spend_usd=IMAGE_PRICES['1024x1024'] * 2)
+
+    assert sorted(client.client.images.prompts) == ['solar farm', 'wind turbine']
+    assert results == [b'solar farm', b'wind turbine', b'solar farm', b'solar farm']
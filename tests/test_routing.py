@@ -0,0 +1,71 @@
+import pytest
+from sqlalchemy import create_engine
+
+from models.database import db, User, PlanType
+
+
+@pytest.fixture
+def replica(app, tmp_path):
+    """A second SQLite database as the only read replica, holding different rows than the primary"""
+    url = f"sqlite:///{tmp_path / 'replica.db'}"
+    engine = create_engine(url)
+    db.Model.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [{'id': 'shared', 'email': 'replica@example.com'}])
+    with app.app_context():
+        db.session.add(User(id='shared', email='primary@example.com', current_plan=PlanType.FREE))
+        db.session.commit()
+
+    db.configure_replicas([url])
+    yield engine
+    db.replica_router.engines[0].dispose()
+    db.configure_replicas([])
+    engine.dispose()
+
+
+def email(user_id='shared'):
+    return db.session.query(User.email).filter(User.id == user_id).scalar()
+
+
+def test_reads_go_to_the_replica_by_default(app, replica):
+    with app.app_context():
+        assert email() == 'replica@example.com'
+
+
+def test_use_primary_pins_reads_to_the_primary(app, replica):
+    with app.app_context():
+        db.use_primary()
+        assert email() == 'primary@example.com'
+
+
+def test_writes_go_to_the_primary_and_later_reads_follow(app, replica):
+    with app.app_context():
+        db.session.add(User(id='new', email='new@example.com', current_plan=PlanType.FREE))
+        db.session.commit()
+        # The session has written, so it now reads its own writes from the primary
+        assert email('new') == 'new@example.com'
+        assert email() == 'primary@example.com'
+
+    with replica.connect() as conn:
+        assert conn.execute(User.__table__.select().where(User.id == 'new')).first() is None
+
+
+def test_primary_pin_resets_per_request(app, replica):
+    with app.test_request_context('/'):
+        db.use_primary()
+        assert email() == 'primary@example.com'
+    with app.test_request_context('/'):
+        assert email() == 'replica@example.com'
+
+
+def test_unreachable_replica_falls_back_to_the_primary(app, replica):
+    db.replica_router.mark_down(db.replica_router.engines[0], 'test')
+    with app.app_context():
+        assert email() == 'primary@example.com'
+
+
+def test_locking_reads_go_to_the_primary_and_pin_the_session(app, replica):
+    with app.app_context():
+        locked = User.query.filter(User.id == 'shared').with_for_update().one()
+        assert locked.email == 'primary@example.com'
+        assert email() == 'primary@example.com'
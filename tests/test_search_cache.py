@@ -0,0 +1,64 @@
+from crawlers.base_crawler import BaseCrawler
+from crawlers.search_cache import SearchResultCache, search_cache
+
+PAGE = [{'id': i, 'url': f'https://example.com/{i}.jpg'} for i in range(5)]
+
+
+def fetch(query):
+    return PAGE
+
+
+def test_each_deck_gets_distinct_candidates():
+    cache = SearchResultCache()
+    first = [cache.next_candidate('a', 'pexels', 'solar panels', fetch)['id'] for _ in range(3)]
+    assert first == [0, 1, 2]
+    assert cache.next_candidate('b', 'pexels', 'panels solar', fetch)['id'] == 0
+    assert cache.searches == 1
+
+
+def test_deck_state_is_bounded_by_count_and_age(monkeypatch):
+    cache = SearchResultCache(max_decks=3, deck_ttl=60)
+    for deck in range(10):
+        cache.next_candidate(deck, 'pexels', 'solar', fetch)
+    assert list(cache._decks) == [7, 8, 9]
+
+    clock = [1000.0]
+    monkeypatch.setattr('crawlers.search_cache.time.time', lambda: clock[0])
+    cache = SearchResultCache(max_decks=3, deck_ttl=60)
+    cache.next_candidate('old', 'pexels', 'solar', fetch)
+    clock[0] += 61
+    cache.next_candidate('new', 'pexels', 'solar', fetch)
+    assert list(cache._decks) == ['new']
+
+
+class ListCrawler(BaseCrawler):
+    def __init__(self):
+        super().__init__('pexels')
+        self.deck_ids = set()
+
+    def get_image(self, prompt, save_dir, deck_id=None):
+        self.deck_ids.add(deck_id)
+        candidate = search_cache.next_candidate(deck_id, self.browser, prompt, fetch)
+        return f"{candidate['id']}.jpg" if candidate else None
+
+
+def test_get_images_for_sections_releases_its_own_deck(tmp_path):
+    crawler = ListCrawler()
+    sections = [{'title': 'Solar panels', 'points': ['Rooftop solar panels']}] * 3
+    images = crawler.get_images_for_sections(sections, str(tmp_path))
+
+    assert len(images) == 3 and len(set(images)) == 3
+    (deck_id,) = crawler.deck_ids
+    assert deck_id is not None
+    assert deck_id not in search_cache._decks
+
+
+def test_deck_context_releases_on_error():
+    crawler = ListCrawler()
+    try:
+        with crawler.deck() as deck_id:
+            crawler.get_image('solar', '.', deck_id)
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    assert deck_id not in search_cache._decks
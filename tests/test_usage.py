@@ -0,0 +1,91 @@
+import threading
+from datetime import datetime
+
+from models.database import db, User, PlanType, PLAN_LIMITS
+from services.usage import usage_quota
+
+THREADS = 16
+
+
+def add_user(app, user_id, plan, **fields):
+    with app.app_context():
+        db.session.add(User(id=user_id, email=f'{user_id}@example.com', current_plan=plan, **fields))
+        db.session.commit()
+    usage_quota.invalidate(user_id)
+
+
+def race(app, user_id, num_slides=1, threads=THREADS):
+    """Reserve from threads started together, each with its own app context and session"""
+    barrier = threading.Barrier(threads)
+    results, errors = [], []
+
+    def worker():
+        with app.app_context():
+            barrier.wait()
+            try:
+                results.append(usage_quota.reserve(user_id, num_slides))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.session.remove()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    assert not errors
+    return [r for r in results if r is not None]
+
+
+def load(app, user_id):
+    with app.app_context():
+        return db.session.get(User, user_id)
+
+
+def test_free_plan_active_limit_under_concurrency(app):
+    limit = PLAN_LIMITS[PlanType.FREE]['max_active']
+    add_user(app, 'free-user', PlanType.FREE)
+
+    reserved = race(app, 'free-user')
+
+    assert len(reserved) == limit
+    assert load(app, 'free-user').active_presentations_count == limit
+
+
+def test_subscription_monthly_limit_under_concurrency(app):
+    limit = PLAN_LIMITS[PlanType.SUBSCRIPTION]['monthly_presentations']
+    already_used = limit - 5
+    add_user(app, 'sub-user', PlanType.SUBSCRIPTION, last_count_reset=datetime.utcnow(),
+             monthly_presentations_count=already_used, monthly_slides_count=already_used)
+
+    reserved = race(app, 'sub-user')
+
+    user = load(app, 'sub-user')
+    assert len(reserved) == 5
+    assert user.monthly_presentations_count == limit
+    assert user.monthly_slides_count == limit
+
+
+def test_subscription_slide_limit_under_concurrency(app):
+    slides_limit = PLAN_LIMITS[PlanType.SUBSCRIPTION]['monthly_slides']
+    add_user(app, 'slides-user', PlanType.SUBSCRIPTION, last_count_reset=datetime.utcnow(),
+             monthly_presentations_count=0, monthly_slides_count=slides_limit - 30)
+
+    reserved = race(app, 'slides-user', num_slides=10)
+
+    assert len(reserved) == 3
+    assert load(app, 'slides-user').monthly_slides_count == slides_limit
+
+
+def test_release_returns_the_slot(app):
+    limit = PLAN_LIMITS[PlanType.FREE]['max_active']
+    add_user(app, 'release-user', PlanType.FREE)
+    reserved = race(app, 'release-user')
+    assert len(reserved) == limit
+
+    with app.app_context():
+        usage_quota.release(reserved[0])
+        assert usage_quota.reserve('release-user', 1) is not None
+        assert usage_quota.reserve('release-user', 1) is None
+    assert load(app, 'release-user').active_presentations_count == limit
@@ -0,0 +1,47 @@
+from models.database import db, User, Presentation, PlanType
+from models.user_cache import get_user, user_cache
+
+
+def add_user(app, user_id, plan=PlanType.FREE):
+    with app.app_context():
+        db.session.add(User(id=user_id, email=f'{user_id}@example.com', name='original', current_plan=plan))
+        db.session.commit()
+    user_cache.invalidate(user_id)
+
+
+def test_get_user_keeps_unflushed_edits_of_the_session(app):
+    add_user(app, 'edited')
+    with app.test_request_context('/'):
+        user = User.query.get('edited')
+        user.name = 'changed'
+        assert get_user('edited') is user
+        Presentation(user_id='edited', title='Deck', num_slides=3)
+        db.session.commit()
+    with app.app_context():
+        assert User.query.get('edited').name == 'changed'
+
+
+def test_cache_miss_does_not_detach_anything_from_the_callers_session(app):
+    add_user(app, 'miss')
+    with app.test_request_context('/'):
+        user = get_user('miss')
+        assert user in db.session
+        user.name = 'renamed'
+        db.session.commit()
+    with app.app_context():
+        assert User.query.get('miss').name == 'renamed'
+
+
+def test_cached_copy_is_reused_across_requests(app):
+    add_user(app, 'cached')
+    with app.test_request_context('/'):
+        assert get_user('cached').name == 'original'
+    with app.app_context():
+        # Changed behind the cache's back: the next request still sees the cached copy until invalidate()
+        User.query.filter(User.id == 'cached').update({User.name: 'stale'})
+        db.session.commit()
+    with app.test_request_context('/'):
+        assert get_user('cached').name == 'original'
+    user_cache.invalidate('cached')
+    with app.test_request_context('/'):
+        assert get_user('cached').name == 'stale'
@@ -1,34 +1,101 @@
+import os
+import queue
+import threading
 import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
 import utils
 
-from generate_ppt import generate_ppt
+from generate_ppt import generate_ppt, GenerationCancelled
+from services.token_budget import MODEL_LIMITS
+
+# Decks from the batch list generated at the same time
+MAX_CONCURRENT_DECKS = 3
+POLL_INTERVAL_MS = 100
+
+executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_DECKS, thread_name_prefix='deck')
+# (job index, status text) sent by worker threads; only the Tk thread touches widgets
+events = queue.Queue()
+jobs = []  # {'topic', 'slides', 'model', 'cancel': Event, 'done'}
 
 settings = utils.get_settings()
 config = utils.get_config()
-api_options = utils.get_api_list()
-model_options = ["Select an API first"]
+# generate_ppt writes every deck with OpenAI; offer the chat models the token budget knows
+model_options = list(MODEL_LIMITS)
 
 
-def set_model_options(api_name):
-    models = utils.get_model_list_from_api(api_name)
-    model_selection.set("Select a model")
+def save_api_key():
+    api_key = api_key_entry.get().strip()
+    utils.save_config(api_key)
 
-    model_dropdown['menu'].delete(0, 'end')
-    for model in models:
-        model_dropdown['menu'].add_command(
-            label=model,
-            command=lambda value=model: model_selection.set(value)
-        )
 
+def run_job(index):
+    """Runs on a worker thread; reports back through the events queue"""
+    job = jobs[index]
+
+    def progress(step, total, message):
+        events.put((index, f"{step + 1}/{total} {message}"))
+
+    try:
+        path = generate_ppt(job['topic'], job['slides'], progress=progress, cancel_event=job['cancel'],
+                            model=job['model'])
+        events.put((index, f"Saved to {path}"))
+    except GenerationCancelled:
+        events.put((index, "Cancelled"))
+    except Exception as e:
+        events.put((index, f"Failed: {e}"))
+    finally:
+        job['done'] = True
+
+
+def add_to_batch():
+    topic = prompt_entry.get().strip()
+    try:
+        slides = int(number_of_slides_entry.get() or 5)
+    except ValueError:
+        result_label.config(text="Number of slides must be a whole number")
+        return
+    if not topic:
+        result_label.config(text="Enter a prompt first")
+        return
 
-def save_api_key():
     api_key = api_key_entry.get().strip()
-    utils.save_config(api_key)
+    if api_key:
+        os.environ['OPENAI_API_KEY'] = api_key
 
+    model = model_selection.get()
+    jobs.append({'topic': topic, 'slides': slides, 'model': model, 'cancel': threading.Event(), 'done': False})
+    batch_list.insert(tk.END, f"{topic} ({slides} slides, {model}): Queued")
+    executor.submit(run_job, len(jobs) - 1)
 
-def generate_ppt_and_set_result():
-    result = generate_ppt(prompt_entry.get(), api_selection.get(), model_selection.get(), number_of_slides_entry.get())
-    result_label.config(text=result)
+
+def cancel_selected():
+    """Cancel the selected decks, or every unfinished deck when none is selected"""
+    indexes = batch_list.curselection() or range(len(jobs))
+    for index in indexes:
+        job = jobs[index]
+        if not job['done'] and not job['cancel'].is_set():
+            job['cancel'].set()
+            events.put((index, "Cancelling after the current step..."))
+
+
+def poll_events():
+    while True:
+        try:
+            index, status = events.get_nowait()
+        except queue.Empty:
+            break
+        job = jobs[index]
+        batch_list.delete(index)
+        batch_list.insert(index, f"{job['topic']} ({job['slides']} slides, {job['model']}): {status}")
+        result_label.config(text=status)
+    window.after(POLL_INTERVAL_MS, poll_events)
+
+
+def on_close():
+    for job in jobs:
+        job['cancel'].set()
+    executor.shutdown(wait=False, cancel_futures=True)
+    window.destroy()
 
 
 window = tk.Tk()
@@ -42,25 +109,24 @@ api_key_entry = tk.Entry(window)
 prompt_label = tk.Label(window, text="Prompt: (write me a PPT presentation about...)")
 prompt_entry = tk.Entry(window)
 
-api_selection = tk.StringVar()
-api_selection.set("Select an option")
-api_label = tk.Label(window, text="Select generation API: ")
-api_dropdown = tk.OptionMenu(window, api_selection, *api_options, command=set_model_options)
-
 model_selection = tk.StringVar()
-model_selection.set("Select an API first.")
+model_selection.set(model_options[0])
 model_label = tk.Label(window, text="Select script generation model: ")
 model_dropdown = tk.OptionMenu(window, model_selection, *model_options)
 
 number_of_slides_label = tk.Label(window, text="Number of slides: ")
 number_of_slides_entry = tk.Entry(window)
 
-generate_button = tk.Button(window, text="Submit", command=generate_ppt_and_set_result)
+generate_button = tk.Button(window, text="Submit", command=add_to_batch)
+cancel_button = tk.Button(window, text="Cancel", command=cancel_selected)
 
 save_api_key_button = tk.Button(window, text="Save API Key", command=save_api_key)
 
 result_label = tk.Label(window, text="")
 
+batch_label = tk.Label(window, text="Batch:")
+batch_list = tk.Listbox(window, width=80, height=8)
+
 if config.get('api_key'):
     api_key_entry.insert(0, config['api_key'])
 
@@ -72,16 +138,19 @@ save_api_key_button.grid(row=0, column=2, padx=5, pady=5)
 prompt_label.grid(row=1, column=0, sticky="w", padx=5, pady=5)
 prompt_entry.grid(row=1, column=1, padx=5, pady=5)
 
-api_label.grid(row=2, column=0, sticky="w", padx=5, pady=5)
-api_dropdown.grid(row=2, column=1, padx=5, pady=5)
+model_label.grid(row=2, column=0, sticky="w", padx=5, pady=5)
+model_dropdown.grid(row=2, column=1, padx=5, pady=5)
 
-model_label.grid(row=3, column=0, sticky="w", padx=5, pady=5)
-model_dropdown.grid(row=3, column=1, padx=5, pady=5)
+number_of_slides_label.grid(row=3, column=0, sticky="w", padx=5, pady=5)
+number_of_slides_entry.grid(row=3, column=1, padx=5, pady=5)
 
-number_of_slides_label.grid(row=4, column=0, sticky="w", padx=5, pady=5)
-number_of_slides_entry.grid(row=4, column=1, padx=5, pady=5)
+generate_button.grid(row=4, column=0, pady=10)
+cancel_button.grid(row=4, column=1, pady=10)
+result_label.grid(row=5, column=0, columnspan=3, pady=5)
 
-generate_button.grid(row=5, column=0, columnspan=2, pady=10)
-result_label.grid(row=6, column=0, columnspan=2, pady=5)
+batch_label.grid(row=6, column=0, sticky="w", padx=5)
+batch_list.grid(row=7, column=0, columnspan=3, padx=5, pady=5)
 
+window.protocol("WM_DELETE_WINDOW", on_close)
+window.after(POLL_INTERVAL_MS, poll_events)
 window.mainloop()